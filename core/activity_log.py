@@ -0,0 +1,222 @@
+"""用户操作日志的异步批量写入
+
+中间件和登录/登出信号只把日志字段放入进程内的有界队列，后台线程每攒够
+ACTIVITY_LOG_BATCH_SIZE 条或每隔 ACTIVITY_LOG_FLUSH_MS 毫秒用 bulk_create 写入一次，
+请求不再逐条等待数据库写锁。时间戳在入队时确定，写入延迟不影响记录的时间。
+用户代理在写入时换成 UserAgent 表的 id，能由操作类型等字段生成的描述不保存。
+
+队列已满时按 ACTIVITY_LOG_OVERFLOW 处理：drop 直接丢弃并计数；block 最多等待
+ACTIVITY_LOG_BLOCK_SECONDS 秒，仍然满时丢弃。进程退出时写入队列中剩余的日志。
+settings.ACTIVITY_LOG_ASYNC 为 False 时在请求内同步写入(适合测试和开发环境)。
+"""
+import atexit
+import hashlib
+import logging
+import os
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections
+from django.utils import timezone
+
+from .models import UserActivityLog, UserAgent
+from .search import index_objects
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_SIZE = 10000
+DEFAULT_BATCH_SIZE = 200
+DEFAULT_FLUSH_MS = 500
+DEFAULT_BLOCK_SECONDS = 1.0
+
+# 进程内缓存的用户代理 id 数量上限，超过时清空
+USER_AGENT_CACHE_SIZE = 1000
+
+# 进程退出时等待后台线程写完的最长时间(秒)
+SHUTDOWN_TIMEOUT = 10
+
+# 通知后台线程写完剩余日志后退出
+_STOP = object()
+
+
+# 用户代理摘要 -> UserAgent id
+_user_agents = {}
+
+
+def is_async():
+    return getattr(settings, 'ACTIVITY_LOG_ASYNC', True)
+
+
+def get_user_agent_digest(value):
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()
+
+
+def intern_user_agents(values):
+    """返回 {用户代理: UserAgent id}，不存在的先插入；常见的几种浏览器命中进程内缓存"""
+    digests = {value: get_user_agent_digest(value) for value in set(values) if value}
+    missing = {digest: value for value, digest in digests.items() if digest not in _user_agents}
+    if missing:
+        UserAgent.objects.bulk_create(
+            [UserAgent(digest=digest, value=value) for digest, value in missing.items()], ignore_conflicts=True,
+        )
+        if len(_user_agents) + len(missing) > USER_AGENT_CACHE_SIZE:
+            _user_agents.clear()
+        _user_agents.update(UserAgent.objects.filter(digest__in=list(missing)).values_list('digest', 'id'))
+    return {value: _user_agents.get(digest) for value, digest in digests.items()}
+
+
+def normalize(records):
+    """把入队的字段转为模型字段：用户代理换成 id，可生成的描述置空"""
+    user_agents = intern_user_agents(record['user_agent'] for record in records)
+    rows = []
+    for record in records:
+        row = dict(record)
+        row['user_agent_id'] = user_agents.get(row.pop('user_agent'))
+        if row['description'] == UserActivityLog.describe(row['action_type'], row['content_type'], row['object_id']):
+            row['description'] = ''
+        rows.append(row)
+    return rows
+
+
+def write(records):
+    """写入一批日志并更新搜索索引，返回写入的条数"""
+    records = normalize(records)
+    try:
+        logs = UserActivityLog.objects.bulk_create([UserActivityLog(**record) for record in records])
+    except IntegrityError:
+        # 入队后用户已被删除等情况，逐条写入，跳过失败的记录
+        logs = []
+        for record in records:
+            try:
+                logs.append(UserActivityLog.objects.create(**record))
+            except IntegrityError:
+                logger.warning('跳过无法写入的操作日志: 用户 %s %s', record['user_id'], record['action_type'])
+        return len(logs)
+    # bulk_create 不触发信号，需要单独更新索引
+    index_objects(UserActivityLog, [log.pk for log in logs if log.pk])
+    return len(logs)
+
+
+class ActivityLogWriter:
+    """进程内的日志队列和后台写入线程
+
+    后台线程在第一次入队时启动；fork 出的子进程(如预加载应用的工作进程)重新创建队列和线程。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._thread = None
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def get_queue(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._queue = queue.Queue(maxsize=getattr(settings, 'ACTIVITY_LOG_QUEUE_SIZE', DEFAULT_QUEUE_SIZE))
+                    self._thread = threading.Thread(target=self._run, name='activity-log-writer', daemon=True)
+                    self._thread.start()
+                    self._pid = os.getpid()
+        return self._queue
+
+    def enqueue(self, record):
+        """把一条日志放入队列，队列已满时按配置丢弃或等待；返回是否入队"""
+        log_queue = self.get_queue()
+        try:
+            if getattr(settings, 'ACTIVITY_LOG_OVERFLOW', 'drop') == 'block':
+                log_queue.put(record, timeout=getattr(settings, 'ACTIVITY_LOG_BLOCK_SECONDS', DEFAULT_BLOCK_SECONDS))
+            else:
+                log_queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        return True
+
+    def _collect(self, log_queue):
+        """等待第一条日志，再收集到批量上限或等待时间结束；收到退出通知时返回 (批次, True)"""
+        batch_size = getattr(settings, 'ACTIVITY_LOG_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+        interval = getattr(settings, 'ACTIVITY_LOG_FLUSH_MS', DEFAULT_FLUSH_MS) / 1000
+        item = log_queue.get()
+        if item is _STOP:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + interval
+        while len(batch) < batch_size:
+            try:
+                item = log_queue.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _flush(self, batch):
+        try:
+            written = write(batch)
+        except Exception:
+            logger.exception('写入 %s 条操作日志失败', len(batch))
+            written = 0
+        with self._lock:
+            self.written += written
+            self.failed += len(batch) - written
+
+    def _run(self):
+        log_queue = self._queue
+        stopping = False
+        while not stopping:
+            batch, stopping = self._collect(log_queue)
+            if batch:
+                self._flush(batch)
+            # 长期运行的线程需要自行关闭失效或超过 CONN_MAX_AGE 的连接
+            close_old_connections()
+
+    def shutdown(self, timeout=SHUTDOWN_TIMEOUT):
+        """通知后台线程写完队列中的日志后退出"""
+        if self._pid != os.getpid() or not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning('退出时仍有 %s 条操作日志未写入', self._queue.qsize())
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'pending': self._queue.qsize() if self._pid == os.getpid() else 0,
+                'written': self.written,
+                'dropped': self.dropped,
+                'failed': self.failed,
+            }
+
+
+writer = ActivityLogWriter()
+atexit.register(writer.shutdown)
+
+
+def log_activity(user, action_type, content_type, object_id=None, description='', ip_address='', user_agent=''):
+    """记录一条用户操作日志；description 只在无法由其他字段生成时需要提供"""
+    record = {
+        'user_id': user.pk,
+        'action_type': action_type,
+        'content_type': content_type,
+        'object_id': str(object_id) if object_id is not None else None,
+        'description': description,
+        'ip_address': ip_address or None,
+        'user_agent': user_agent or '',
+        'timestamp': timezone.now(),
+    }
+    if is_async():
+        writer.enqueue(record)
+        return
+    try:
+        write([record])
+    except Exception:
+        # 记录失败不应影响正常响应
+        logger.exception('写入操作日志失败')
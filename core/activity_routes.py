@@ -0,0 +1,191 @@
+"""操作日志的路由分类表和记录策略
+
+启动时遍历 URL 配置，按路由名称为每个 (路由, 请求方法) 预先算好内容类型、操作类型
+和记录策略。请求结束时直接用 request.resolver_match 的路由名查表，不再逐条
+匹配路径正则，也不再重新解析 URL。
+
+默认全部记录；查看(VIEW)事件按 ACTIVITY_LOG_VIEW_POLICY 处理，访问频繁的路由可在
+ACTIVITY_LOG_ROUTE_POLICIES 中按路由名单独指定。写操作、导入和导出等其他事件总是全部记录。策略有：
+always 全部记录；sample 按 ACTIVITY_LOG_SAMPLE_RATE 抽样；dedupe 同一用户同一路由在
+ACTIVITY_LOG_DEDUPE_SECONDS 秒内只记录一次；skip 不记录。未记录的事件按路由计数。
+"""
+import random
+import threading
+import time
+from collections import Counter, namedtuple
+
+from django.conf import settings
+from django.urls import URLResolver, get_resolver
+
+# 按路由名称(不含命名空间)前缀确定内容类型，依次匹配，后台管理的路由名以 <应用>_<模型>_ 开头
+CONTENT_TYPE_PREFIXES = (
+    (('device_arrival_', 'core_devicearrival_'), 'DEVICE_ARRIVAL'),
+    (('device_delivery_', 'core_devicedelivery_'), 'DEVICE_DELIVERY'),
+    (('device_security_status_', 'core_devicesecuritystatus_', 'status_history', 'status_trend'), 'DEVICE_SECURITY'),
+    (('register', 'login', 'logout', 'profile_', 'change_password', 'password_change', 'user_autocomplete',
+      'core_user_', 'auth_'), 'USER'),
+)
+
+# 按路由名称后缀确定写操作的类型
+ACTION_SUFFIXES = (
+    (('_create', '_add'), 'CREATE'),
+    (('_update', '_change'), 'UPDATE'),
+    (('_delete',), 'DELETE'),
+    (('_import',), 'IMPORT'),
+    (('_export', '_delta', '_download'), 'EXPORT'),
+)
+
+# 不按后缀区分的路由各请求方法的操作类型
+METHOD_ACTIONS = {
+    'GET': 'VIEW',
+    'HEAD': 'VIEW',
+    'POST': 'CREATE',
+    'PUT': 'UPDATE',
+    'PATCH': 'UPDATE',
+    'DELETE': 'DELETE',
+    'OPTIONS': 'OTHER',
+}
+
+# 不记录的路由；登录由 user_logged_in 信号记录
+IGNORED_ROUTES = {'admin:jsi18n', 'django.views.static.serve', 'login', 'admin:login'}
+
+# 作为操作对象 ID 的路由参数
+OBJECT_ID_KWARGS = ('pk', 'object_id')
+
+POLICIES = ('always', 'sample', 'dedupe', 'skip')
+
+DEFAULT_VIEW_POLICY = 'always'
+DEFAULT_SAMPLE_RATE = 0.1
+DEFAULT_DEDUPE_SECONDS = 300
+
+# 去重表超过该条目数时清理已过期的条目
+MAX_DEDUPE_ENTRIES = 10000
+
+ActivityRoute = namedtuple('ActivityRoute', 'view_name content_type action_type policy')
+
+
+def iter_routes(patterns=None, namespace=''):
+    """返回 (路由名, URL 模式)；未命名的路由使用视图的完整路径，与 ResolverMatch.view_name 一致"""
+    if patterns is None:
+        patterns = get_resolver().url_patterns
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            prefix = f'{namespace}{pattern.namespace}:' if pattern.namespace else namespace
+            yield from iter_routes(pattern.url_patterns, prefix)
+        else:
+            yield f'{namespace}{pattern.name}' if pattern.name else pattern.lookup_str, pattern
+
+
+def get_content_type(url_name):
+    for prefixes, content_type in CONTENT_TYPE_PREFIXES:
+        if url_name.startswith(prefixes):
+            return content_type
+    return 'SYSTEM'
+
+
+def get_action_type(url_name, method):
+    for suffixes, action_type in ACTION_SUFFIXES:
+        if url_name.endswith(suffixes):
+            if action_type == 'EXPORT':
+                return action_type
+            # 表单页面的 GET 只是打开页面
+            return 'VIEW' if method in ('GET', 'HEAD') else action_type
+    return METHOD_ACTIONS.get(method, 'OTHER')
+
+
+def get_policy(view_name, action_type):
+    """路由的记录策略；ACTIVITY_LOG_ROUTE_POLICIES 的值为字符串或字典，字典按操作类型指定
+
+    只有查看(VIEW)事件可以不全部记录，为其他操作类型指定 always 以外的策略时报错。
+    """
+    override = getattr(settings, 'ACTIVITY_LOG_ROUTE_POLICIES', {}).get(view_name)
+    if isinstance(override, dict):
+        policy = override.get(action_type)
+    else:
+        policy = override if action_type == 'VIEW' else None
+    if action_type != 'VIEW':
+        if policy not in (None, 'always'):
+            raise ValueError(f'{view_name} 的 {action_type} 操作必须全部记录，不能使用 {policy} 策略')
+        return 'always'
+    if policy is None:
+        policy = getattr(settings, 'ACTIVITY_LOG_VIEW_POLICY', DEFAULT_VIEW_POLICY)
+    if policy not in POLICIES:
+        raise ValueError(f'未知的操作日志记录策略: {policy}')
+    return policy
+
+
+def build_route(view_name, method):
+    url_name = view_name.rpartition(':')[2]
+    action_type = get_action_type(url_name, method)
+    return ActivityRoute(view_name, get_content_type(url_name), action_type, get_policy(view_name, action_type))
+
+
+def build_route_table(patterns=None):
+    """(路由名, 请求方法) -> ActivityRoute；忽略的路由不在表中"""
+    table = {}
+    for view_name, _ in iter_routes(patterns):
+        if view_name in IGNORED_ROUTES:
+            continue
+        for method in METHOD_ACTIONS:
+            table[view_name, method] = build_route(view_name, method)
+    return table
+
+
+class ActivityThrottle:
+    """按路由的记录策略决定事件是否写入日志，并统计各路由记录和未记录的次数(按进程)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_logged = {}
+        self._logged = Counter()
+        self._suppressed = Counter()
+
+    def is_duplicate(self, key, now, window):
+        with self._lock:
+            last = self._last_logged.get(key)
+            if last is not None and now - last < window:
+                return True
+            if len(self._last_logged) >= MAX_DEDUPE_ENTRIES:
+                self._last_logged = {
+                    item: logged_at for item, logged_at in self._last_logged.items() if now - logged_at < window
+                }
+            self._last_logged[key] = now
+            return False
+
+    def allow(self, route, user_id):
+        if route.policy == 'always':
+            allowed = True
+        elif route.policy == 'sample':
+            allowed = random.random() < getattr(settings, 'ACTIVITY_LOG_SAMPLE_RATE', DEFAULT_SAMPLE_RATE)
+        elif route.policy == 'dedupe':
+            window = getattr(settings, 'ACTIVITY_LOG_DEDUPE_SECONDS', DEFAULT_DEDUPE_SECONDS)
+            allowed = not self.is_duplicate((user_id, route.view_name), time.monotonic(), window)
+        else:
+            allowed = False
+        with self._lock:
+            (self._logged if allowed else self._suppressed)[route.view_name, route.action_type, route.policy] += 1
+        return allowed
+
+    def get_stats(self):
+        """各路由记录和未记录的次数，按未记录次数从多到少排列"""
+        with self._lock:
+            keys = set(self._logged) | set(self._suppressed)
+            routes = [
+                {
+                    'route': view_name,
+                    'action_type': action_type,
+                    'policy': policy,
+                    'logged': self._logged[view_name, action_type, policy],
+                    'suppressed': self._suppressed[view_name, action_type, policy],
+                }
+                for view_name, action_type, policy in keys
+            ]
+        routes.sort(key=lambda item: (-item['suppressed'], item['route']))
+        return {
+            'logged': sum(item['logged'] for item in routes),
+            'suppressed': sum(item['suppressed'] for item in routes),
+            'routes': routes,
+        }
+
+
+throttle = ActivityThrottle()
@@ -42,11 +42,20 @@ admin.site.register(DeviceSecurityStatus, DeviceSecurityStatusAdmin)
 # 用户活动日志
 @admin.register(UserActivityLog)
 class UserActivityLogAdmin(admin.ModelAdmin):
-    list_display = ('user', 'action_type', 'content_type', 'description', 'timestamp', 'ip_address')
-    search_fields = ('user__username', 'description', 'ip_address')
+    list_display = ('user', 'action_type', 'content_type', 'get_description', 'timestamp', 'ip_address')
+    search_fields = ('user__username', 'description', 'object_id', 'ip_address')
     list_filter = ('action_type', 'content_type', 'timestamp')
     date_hierarchy = 'timestamp'
-    readonly_fields = ('user', 'action_type', 'content_type', 'object_id', 'description', 'ip_address', 'user_agent', 'timestamp')
+    readonly_fields = ('user', 'action_type', 'content_type', 'object_id', 'get_description', 'ip_address', 'user_agent', 'timestamp')
+    exclude = ('description',)
+    
+    def get_search_results(self, request, queryset, search_term):
+        # 通用描述不保存，另外按生成的描述匹配
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        condition = UserActivityLog.description_filter(search_term) if search_term else None
+        if condition:
+            results |= queryset.filter(condition)
+        return results, may_have_duplicates
     
     def has_add_permission(self, request):
         return False
@@ -0,0 +1,150 @@
+"""条码查询
+
+扫码得到的关键词(不含空格、包含数字的字母数字串)另外按条码字段精确或前缀匹配，
+走条码字段上的索引，与其他搜索字段的模糊匹配合并。resolve() 一次返回某个条码的
+到货、出货和安装记录，结果保存在进程内的 LRU 缓存中，设备数据写入后清空。
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import Q
+
+from .delta import NATURAL_KEYS
+from .models import DeviceArrival, DeviceDelivery, DeviceSecurityStatus
+
+# 各表的条码字段(安装记录为资产序列号)
+BARCODE_FIELDS = NATURAL_KEYS
+
+# 条码形状：字母数字开头，可含 - _ . /，至少 4 位且包含数字
+BARCODE_PATTERN = re.compile(r'^(?=.*\d)[A-Za-z0-9][A-Za-z0-9\-_./]{3,99}$')
+
+# 前缀匹配上界，拼接在前缀后构造范围条件
+PREFIX_UPPER_BOUND = '\U0010ffff'
+
+# 缓存的条码数
+DEFAULT_CACHE_SIZE = 256
+
+# 缓存有效期(秒)，其他进程的写入最迟在该时间后可见
+DEFAULT_CACHE_TIMEOUT = 30
+
+# 未找到记录时返回的候选条码数
+CANDIDATE_LIMIT = 10
+
+# 返回给接口的字段
+ARRIVAL_FIELDS = ('id', 'project_name', 'arrival_date', 'device_model', 'barcode', 'updated_at', 'created_by__username')
+DELIVERY_FIELDS = ('id', 'delivery_date', 'barcode', 'device_model', 'recipient_unit', 'recipient', 'updated_at', 'created_by__username')
+INSTALLATION_FIELDS = ('id', 'network_element_name', 'asset_serial_number', 'is_online', 'check_date', 'last_check_time', 'created_by__username')
+
+
+def is_barcode(query):
+    return bool(BARCODE_PATTERN.match(query))
+
+
+def barcode_filter(model, query):
+    """条码精确或前缀匹配条件
+
+    用范围比较代替 LIKE，SQLite 和 PostgreSQL 都能使用条码字段的 B 树索引；
+    同时匹配原样和大写形式，兼容手工输入的小写条码。
+    """
+    field = BARCODE_FIELDS[model]
+    condition = Q()
+    for value in {query, query.upper()}:
+        condition |= Q(**{f'{field}__gte': value, f'{field}__lt': value + PREFIX_UPPER_BOUND})
+    return condition
+
+
+class LRUCache:
+    """线程安全的定长缓存，超出容量时淘汰最久未使用的条目"""
+
+    def __init__(self, maxsize, timeout):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self.data.pop(key, None)
+                self.misses += 1
+                return None
+            self.data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = (time.monotonic() + self.timeout, value)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+_cache = LRUCache(
+    getattr(settings, 'BARCODE_CACHE_SIZE', DEFAULT_CACHE_SIZE),
+    getattr(settings, 'BARCODE_CACHE_TIMEOUT', DEFAULT_CACHE_TIMEOUT),
+)
+
+
+def get_stats():
+    """本进程条码缓存的命中/未命中次数和条目数"""
+    return {'hits': _cache.hits, 'misses': _cache.misses, 'size': len(_cache.data)}
+
+
+def invalidate():
+    """设备数据写入后清空缓存；写入很少，整体清空比逐条维护更简单可靠"""
+    _cache.clear()
+
+
+def find_candidates(prefix, limit=CANDIDATE_LIMIT):
+    """返回以 prefix 开头的条码，按条码排序"""
+    candidates = set()
+    for model, field in BARCODE_FIELDS.items():
+        candidates.update(
+            model.objects.filter(barcode_filter(model, prefix)).order_by(field).values_list(field, flat=True)[:limit]
+        )
+    return sorted(candidates)[:limit]
+
+
+def lookup(barcode):
+    """按条码精确查询三张表，每张表一次索引查询"""
+    arrival = DeviceArrival.objects.filter(barcode=barcode).values(*ARRIVAL_FIELDS).first()
+    deliveries = list(
+        DeviceDelivery.objects.filter(barcode=barcode).order_by('-delivery_date', '-id').values(*DELIVERY_FIELDS)
+    )
+    installations = list(
+        DeviceSecurityStatus.objects.filter(asset_serial_number=barcode)
+        .order_by('-last_check_time', '-id').values(*INSTALLATION_FIELDS)
+    )
+    return {
+        'barcode': barcode,
+        'found': bool(arrival or deliveries or installations),
+        'arrival': arrival,
+        'deliveries': deliveries,
+        'installations': installations,
+    }
+
+
+def resolve(barcode):
+    """返回条码对应的到货、出货和安装记录；调用方不应修改返回值"""
+    barcode = barcode.strip()
+    result = _cache.get(barcode)
+    if result is None:
+        result = lookup(barcode)
+        if not result['found'] and barcode.upper() != barcode:
+            # 手工输入的小写条码按大写再查一次
+            result = lookup(barcode.upper())
+        if not result['found']:
+            result['candidates'] = find_candidates(barcode)
+        _cache.set(barcode, result)
+    return result
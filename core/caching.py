@@ -0,0 +1,84 @@
+"""按表版本号失效的共享缓存
+
+缓存后端由 settings.CACHE_BACKEND 选择(进程内、文件或兼容 Redis 协议的服务)。
+缓存键包含相关数据表的版本号(见 versioning 模块)，写入、删除和批量导入都会递增版本号，
+旧键随之不再被读取，无需主动清除；未变化时各请求复用同一份计算结果。
+
+每类缓存的命中/未命中次数按进程统计，get_stats() 返回统计结果。
+"""
+import hashlib
+import json
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import TableVersion
+from .versioning import get_table_label
+
+# 默认缓存时间(秒)
+DEFAULT_TIMEOUT = 300
+
+_lock = threading.Lock()
+_stats = {}
+
+
+def record(namespace, hit):
+    with _lock:
+        stats = _stats.setdefault(namespace, {'hits': 0, 'misses': 0})
+        stats['hits' if hit else 'misses'] += 1
+
+
+def get_stats():
+    """各类缓存在本进程的命中/未命中次数和命中率"""
+    with _lock:
+        stats = {namespace: dict(values) for namespace, values in _stats.items()}
+    for values in stats.values():
+        total = values['hits'] + values['misses']
+        values['hit_rate'] = round(values['hits'] / total, 4) if total else None
+    return stats
+
+
+def reset_stats():
+    with _lock:
+        _stats.clear()
+
+
+def get_backend_name():
+    return getattr(settings, 'CACHE_BACKEND', 'locmem')
+
+
+def get_versions(*models):
+    """一次查询取出多张表的版本号，从未写入过的表为 0"""
+    tables = [get_table_label(model) for model in models]
+    versions = dict(TableVersion.objects.filter(table__in=tables).values_list('table', 'version'))
+    return [versions.get(table, 0) for table in tables]
+
+
+def make_key(namespace, versions, *parts):
+    """由命名空间、版本号和其他参数组成缓存键，参数部分取摘要避免键过长"""
+    version = '-'.join(str(value) for value in versions)
+    digest = hashlib.sha256(
+        json.dumps(parts, cls=DjangoJSONEncoder, sort_keys=True).encode('utf-8')
+    ).hexdigest()[:32]
+    return f'{namespace}:{version}:{digest}'
+
+
+def get_or_compute(namespace, key, compute, timeout=DEFAULT_TIMEOUT):
+    """读取缓存，未命中时计算并写入；结果为 None 时不缓存"""
+    value = cache.get(key)
+    if value is not None:
+        record(namespace, True)
+        return value
+    record(namespace, False)
+    value = compute()
+    if value is not None:
+        cache.set(key, value, timeout)
+    return value
+
+
+def cached_for_models(namespace, models, parts, compute, timeout=DEFAULT_TIMEOUT):
+    """按 models 当前的版本号缓存 compute() 的结果"""
+    key = make_key(namespace, get_versions(*models), *parts)
+    return get_or_compute(namespace, key, compute, timeout)
@@ -0,0 +1,200 @@
+"""设备状态看板数据
+
+看板把条码分为在线设备(有到货和安装记录)、脱网设备(只有到货记录)和其他设备(只有安装记录)。
+默认只统计最近 DASHBOARD_WINDOW_HOURS 小时创建的到货和安装记录，也可以统计全部设备；
+两种范围都由 settings.DASHBOARD_BACKEND 选择实现：
+
+- 'reconciliation'(默认)：读取增量维护的对账表，按时间范围统计时比较对账行中保存的
+  到货记录和最近一条安装记录的创建时间；
+- 'query'：用 EXISTS/NOT EXISTS 子查询直接在到货和安装表上分类，不需要维护对账表。
+
+同一序列号有多条安装记录时，两种实现都显示最近检查的一条(INSTALLATION_ORDERING)。
+两种实现都只查询当前页的设备，并按条码排序，翻页结果稳定。
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, Exists, OuterRef, Q
+from django.utils import timezone
+
+from .models import DeviceArrival, DeviceReconciliation, DeviceSecurityStatus
+
+STATES = ('online', 'offline', 'other')
+
+# 查询实现默认统计的时间范围(小时)
+DEFAULT_WINDOW_HOURS = 24
+
+
+def arrival_item(barcode, arrival, installation=None):
+    item = {
+        'barcode': barcode,
+        'device_model': arrival['device_model'],
+        'project_name': arrival['project_name'],
+        'arrival_date': arrival['arrival_date'],
+    }
+    if installation:
+        item.update({
+            'network_element_name': installation['network_element_name'],
+            'is_online': installation['is_online'],
+            'check_date': installation['check_date'],
+        })
+    return item
+
+
+def installation_item(serial, installation):
+    return {
+        'serial': serial,
+        'network_element_name': installation['network_element_name'],
+        'is_online': installation['is_online'],
+        'check_date': installation['check_date'],
+    }
+
+
+ARRIVAL_FIELDS = ('barcode', 'device_model', 'project_name', 'arrival_date')
+INSTALLATION_FIELDS = ('asset_serial_number', 'network_element_name', 'is_online', 'check_date')
+
+# 同一序列号有多条安装记录时显示最近检查的一条，对账表也按此选择
+INSTALLATION_ORDERING = ('asset_serial_number', '-last_check_time', '-id')
+
+
+def get_window_hours():
+    return getattr(settings, 'DASHBOARD_WINDOW_HOURS', DEFAULT_WINDOW_HOURS)
+
+
+def get_display_installations(serials):
+    """每个序列号显示的安装记录：{序列号: 字段字典}"""
+    installations = {}
+    for row in (
+        DeviceSecurityStatus.objects.filter(asset_serial_number__in=serials)
+        .order_by(*INSTALLATION_ORDERING).values(*INSTALLATION_FIELDS)
+    ):
+        installations.setdefault(row['asset_serial_number'], row)
+    return installations
+
+
+class DashboardBackend:
+    """指定 window_hours 时只统计该时间范围内创建的到货和安装记录"""
+    name = None
+
+    def __init__(self, window_hours=None):
+        self.window = timedelta(hours=window_hours) if window_hours else None
+        # 取整到分钟，同一分钟内的请求可以共用缓存
+        self.since = self.window and (timezone.now() - self.window).replace(second=0, microsecond=0)
+
+    def get_cache_parts(self):
+        """除表版本号外影响结果的参数，用于缓存键"""
+        return [self.name, self.since]
+
+
+class ReconciliationBackend(DashboardBackend):
+    """读取对账表"""
+    name = 'reconciliation'
+
+    def get_state_filter(self, state):
+        if self.since is None:
+            return Q(state=state)
+        # 按时间范围统计时，范围外的到货或安装记录视为不存在
+        arrival = Q(arrival_created_at__gte=self.since)
+        installation = Q(installation_created_at__gte=self.since)
+        return {
+            'online': arrival & installation,
+            'offline': arrival & ~installation,
+            'other': installation & ~arrival,
+        }[state]
+
+    def get_counts(self):
+        devices = DeviceReconciliation.objects.order_by()
+        if self.since is None:
+            counts = dict(devices.values_list('state').annotate(total=Count('id')))
+            return {state: counts.get(state, 0) for state in STATES}
+        devices = devices.filter(Q(arrival_created_at__gte=self.since) | Q(installation_created_at__gte=self.since))
+        return devices.aggregate(**{
+            state: Count('id', filter=self.get_state_filter(state)) for state in STATES
+        })
+
+    def get_page(self, state, offset, limit):
+        devices = (
+            DeviceReconciliation.objects.filter(self.get_state_filter(state))
+            .select_related('arrival', 'installation')
+            .order_by('barcode')[offset:offset + limit]
+        )
+        items = []
+        for device in devices:
+            arrival = device.arrival and {field: getattr(device.arrival, field) for field in ARRIVAL_FIELDS}
+            installation = device.installation and {
+                field: getattr(device.installation, field) for field in INSTALLATION_FIELDS
+            }
+            if state == 'other':
+                if installation:
+                    items.append(installation_item(device.barcode, installation))
+            elif state == 'offline':
+                if arrival:
+                    items.append(arrival_item(device.barcode, arrival))
+            elif arrival and installation:
+                items.append(arrival_item(device.barcode, arrival, installation))
+        return items
+
+
+class QueryBackend(DashboardBackend):
+    """在到货和安装表上直接分类"""
+    name = 'query'
+
+    def created(self, model):
+        return model.objects.filter(created_at__gte=self.since) if self.since else model.objects.all()
+
+    def arrivals(self):
+        return self.created(DeviceArrival).exclude(barcode='').order_by()
+
+    def installations(self):
+        return self.created(DeviceSecurityStatus).exclude(asset_serial_number='').order_by()
+
+    def has_installation(self):
+        return Exists(self.installations().filter(asset_serial_number=OuterRef('barcode')))
+
+    def other_serials(self):
+        """没有到货记录的安装记录的序列号，每个序列号一行"""
+        installations = self.installations()
+        has_arrival = Exists(self.arrivals().filter(barcode=OuterRef('asset_serial_number')))
+        # 同一序列号只保留 id 最大的一行；用 NOT EXISTS 而不是 DISTINCT，时间范围条件仍可使用索引
+        newer = Exists(installations.filter(asset_serial_number=OuterRef('asset_serial_number'), id__gt=OuterRef('id')))
+        return installations.filter(~has_arrival, ~newer).values_list('asset_serial_number', flat=True)
+
+    def get_counts(self):
+        # 到货表一次聚合得到在线和脱网数量
+        has_installation = self.has_installation()
+        counts = self.arrivals().aggregate(
+            online=Count('id', filter=Q(has_installation)),
+            offline=Count('id', filter=~Q(has_installation)),
+        )
+        counts['other'] = self.other_serials().count()
+        return counts
+
+    def get_page(self, state, offset, limit):
+        if state == 'other':
+            serials = list(self.other_serials().order_by('asset_serial_number')[offset:offset + limit])
+            installations = get_display_installations(serials)
+            return [installation_item(serial, installations[serial]) for serial in serials if serial in installations]
+
+        has_installation = self.has_installation()
+        arrivals = self.arrivals().filter(has_installation if state == 'online' else ~Q(has_installation))
+        rows = list(arrivals.order_by('barcode').values(*ARRIVAL_FIELDS)[offset:offset + limit])
+        if state == 'offline':
+            return [arrival_item(row['barcode'], row) for row in rows]
+
+        installations = get_display_installations([row['barcode'] for row in rows])
+        return [
+            arrival_item(row['barcode'], row, installations[row['barcode']])
+            for row in rows if row['barcode'] in installations
+        ]
+
+
+BACKENDS = {
+    'reconciliation': ReconciliationBackend,
+    'query': QueryBackend,
+}
+
+
+def get_backend(limited=False):
+    """limited 为 True 时只统计最近 DASHBOARD_WINDOW_HOURS 小时创建的记录，否则统计全部设备"""
+    backend_class = BACKENDS[getattr(settings, 'DASHBOARD_BACKEND', 'reconciliation')]
+    return backend_class(get_window_hours() if limited else None)
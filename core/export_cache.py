@@ -0,0 +1,130 @@
+"""导出文件缓存
+
+缓存键由数据表、筛选条件、导出列、格式和表版本号组成。表数据写入后版本号递增，
+旧版本的文件不再命中；缓存目录超过 settings.EXPORT_CACHE_MAX_BYTES 时
+从最久未使用的文件开始清理。
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import uuid
+
+from django.conf import settings
+from django.utils.http import http_date
+
+logger = logging.getLogger(__name__)
+
+# 缓存目录默认上限 512MB
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# 写入中的临时文件后缀，清理时跳过
+TEMP_SUFFIX = '.part'
+
+
+def get_cache_dir():
+    """导出缓存目录，可通过 settings.EXPORT_CACHE_DIR 调整"""
+    cache_dir = getattr(settings, 'EXPORT_CACHE_DIR', None) or os.path.join(settings.MEDIA_ROOT, 'export_cache')
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+def get_max_bytes():
+    return int(getattr(settings, 'EXPORT_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES))
+
+
+def evict(max_bytes=None):
+    """按最近使用时间从旧到新删除缓存文件，直到总大小不超过上限"""
+    max_bytes = get_max_bytes() if max_bytes is None else max_bytes
+    cache_dir = get_cache_dir()
+    entries = []
+    total = 0
+    for entry in os.scandir(cache_dir):
+        if not entry.is_file() or entry.name.endswith(TEMP_SUFFIX):
+            continue
+        stat = entry.stat()
+        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total += stat.st_size
+    entries.sort()
+    for mtime, size, path in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+    return total
+
+
+class ExportCacheEntry:
+    """某个版本数据的一份导出文件"""
+
+    def __init__(self, target, version, filters, fields, export_format):
+        key = json.dumps({
+            'target': target,
+            'filters': filters or {},
+            'fields': fields or [],
+            'format': export_format,
+        }, sort_keys=True)
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+        name = f'{target}-v{version.version}-{digest}'
+        self.path = os.path.join(get_cache_dir(), f'{name}.{export_format}')
+        self.etag = f'"{name}"'
+        self.last_modified = version.updated_at
+
+    @property
+    def last_modified_header(self):
+        if self.last_modified is None:
+            return None
+        return http_date(self.last_modified.timestamp())
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def open(self):
+        """打开缓存文件并更新使用时间"""
+        try:
+            os.utime(self.path)
+        except OSError:
+            pass
+        return open(self.path, 'rb')
+
+    def temp_path(self):
+        return f'{self.path}.{uuid.uuid4().hex}{TEMP_SUFFIX}'
+
+    def commit(self, temp_path):
+        os.replace(temp_path, self.path)
+        evict()
+
+    def tee(self, chunks):
+        """边输出边写入缓存；只有完整输出后才保存，客户端中断时丢弃"""
+        temp_path = self.temp_path()
+        completed = False
+        try:
+            with open(temp_path, 'wb') as cache_file:
+                for chunk in chunks:
+                    cache_file.write(chunk)
+                    yield chunk
+            completed = True
+        finally:
+            if completed:
+                self.commit(temp_path)
+            elif os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def store(self, source_path):
+        """把已生成的导出文件复制到缓存"""
+        temp_path = self.temp_path()
+        try:
+            shutil.copyfile(source_path, temp_path)
+            self.commit(temp_path)
+        except OSError:
+            logger.exception("导出缓存写入失败: %s", self.path)
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def copy_to(self, destination):
+        with self.open() as source, open(destination, 'wb') as target_file:
+            shutil.copyfileobj(source, target_file)
@@ -0,0 +1,74 @@
+"""设备清单查询条件
+
+列表页和导出共用同一套筛选逻辑，保证导出的记录与页面上看到的一致。
+"""
+from django.utils.http import urlencode
+
+from .barcodes import barcode_filter, is_barcode
+from .models import DeviceArrival, DeviceDelivery, DeviceSecurityStatus
+from .search import search_filter
+
+
+class DeviceQuery:
+    """根据请求参数构造设备清单查询集
+
+    子类声明 model，搜索字段见 search.SEARCH_FIELDS；需要额外筛选条件时扩展 filter_params 并重写 filter。
+    """
+    model = None
+    # 参与筛选的请求参数
+    filter_params = ('q',)
+
+    def __init__(self, params):
+        # 只保留筛选参数，分页等参数不影响查询结果
+        self.params = {
+            name: params.get(name, '').strip()
+            for name in self.filter_params
+            if params.get(name, '').strip()
+        }
+
+    def search(self, queryset, query):
+        condition = search_filter(self.model, query)
+        if is_barcode(query):
+            # 扫码查询另外按条码精确或前缀匹配(大小写不同的条码也能命中)，其他字段照常模糊搜索
+            condition |= barcode_filter(self.model, query)
+        return queryset.filter(condition)
+
+    def filter(self, queryset):
+        return queryset
+
+    def get_queryset(self):
+        """返回未排序的查询集，由调用方决定排序"""
+        queryset = self.model.objects.all()  # 所有用户都能看到所有记录
+        query = self.params.get('q')
+        if query:
+            queryset = self.search(queryset, query)
+        return self.filter(queryset)
+
+    def urlencode(self):
+        """筛选条件的查询字符串，用于生成带相同条件的导出链接"""
+        return urlencode(self.params)
+
+
+class DeviceArrivalQuery(DeviceQuery):
+    """设备到货清单：按项目名称、设备型号或条码搜索"""
+    model = DeviceArrival
+
+
+class DeviceDeliveryQuery(DeviceQuery):
+    """设备出货清单：按设备型号、条码、接收单位或接收人搜索"""
+    model = DeviceDelivery
+
+
+class DeviceSecurityStatusQuery(DeviceQuery):
+    """设备安装状态：按网元名称或资产序列号搜索，可按在线状态筛选"""
+    model = DeviceSecurityStatus
+    filter_params = ('q', 'status')
+
+    def filter(self, queryset):
+        # 在线状态筛选
+        online_status = self.params.get('status')
+        if online_status == 'online':
+            queryset = queryset.filter(is_online=True)
+        elif online_status == 'offline':
+            queryset = queryset.filter(is_online=False)
+        return queryset
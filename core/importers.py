@@ -0,0 +1,484 @@
+"""设备清单流式导入引擎
+
+以只读模式逐行读取 xlsx，按块(chunk)通过 bulk_create/bulk_update 批量写入，
+内存占用只与块大小有关，与文件行数无关。校验后的行暂存在磁盘上，
+预览确认后直接写入，无需再次解析。
+"""
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import date, datetime
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from openpyxl import load_workbook
+
+from . import barcodes, reconciliation, status_history
+from .models import DeviceArrival, DeviceDelivery, DeviceSecurityStatus
+from .resources import DeviceArrivalResource, DeviceDeliveryResource, DeviceSecurityStatusResource
+from .search import index_objects
+from .versioning import bulk_changes
+
+logger = logging.getLogger(__name__)
+
+# 默认每块处理的行数，可通过 settings.IMPORT_CHUNK_SIZE 调整
+DEFAULT_CHUNK_SIZE = 1000
+
+# 最多保留的错误明细条数，避免错误过多时占用大量内存
+MAX_ERROR_DETAILS = 100
+
+# 预览页展示的样例行数
+MAX_PREVIEW_SAMPLES = 20
+
+# 暂存文件默认保留时间(秒)，可通过 settings.IMPORT_STAGING_TTL 调整
+DEFAULT_STAGING_TTL = 3600
+
+DATE_FORMATS = ('%Y-%m-%d', '%Y/%m/%d', '%Y.%m.%d', '%Y%m%d', '%Y-%m-%d %H:%M:%S')
+
+
+def get_chunk_size():
+    """读取配置的块大小"""
+    return int(getattr(settings, 'IMPORT_CHUNK_SIZE', DEFAULT_CHUNK_SIZE))
+
+
+def iter_xlsx_rows(file_obj):
+    """逐行读取第一个工作表，首行为列标题
+
+    返回 (行号, 行字典) 迭代器，行号从数据第一行开始计为 1，空行会被跳过。
+    """
+    workbook = load_workbook(file_obj, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        rows = sheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        headers = [str(value).strip() if value is not None else '' for value in header]
+        padding = (None,) * len(headers)
+        for row_number, values in enumerate(rows, start=1):
+            if not values or all(value is None or str(value).strip() == '' for value in values):
+                continue
+            # 行尾的空单元格可能不会返回，补齐后每行的列都与表头一致
+            if len(values) < len(headers):
+                values = tuple(values) + padding[len(values):]
+            yield row_number, dict(zip(headers, values))
+    finally:
+        workbook.close()
+
+
+def estimate_xlsx_rows(file_obj):
+    """根据工作表声明的尺寸估算数据行数，无法获取时返回 None"""
+    workbook = load_workbook(file_obj, read_only=True, data_only=True)
+    try:
+        max_row = workbook.worksheets[0].max_row
+    finally:
+        workbook.close()
+    return max(max_row - 1, 0) if max_row else None
+
+
+def clean_text(value):
+    """将单元格值转换为去除首尾空白的字符串"""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        # Excel 中的纯数字条码会被读成浮点数
+        value = int(value)
+    return str(value).strip()
+
+
+def clean_date(value):
+    """将单元格值转换为日期"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = clean_text(value)
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f"无法识别的日期: {text}")
+
+
+class ImportSummary:
+    """导入结果汇总"""
+
+    def __init__(self):
+        self.token = None
+        self.total_rows = 0
+        self.created = 0
+        self.updated = 0
+        self.skipped = 0
+        self.error_count = 0
+        self.errors = []
+        self.samples = []
+
+    def add_error(self, row_number, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_ERROR_DETAILS:
+            self.errors.append((row_number, message))
+
+    def add_sample(self, row_number, action, values):
+        if len(self.samples) < MAX_PREVIEW_SAMPLES:
+            self.samples.append((row_number, action, values))
+
+    def has_errors(self):
+        return self.error_count > 0
+
+    def error_message(self, limit=10):
+        """生成与原导入视图一致的错误摘要"""
+        error_rows = [f"行 {row_number}: {message}" for row_number, message in self.errors[:limit]]
+        message = "、".join(error_rows)
+        if self.error_count > limit:
+            message += f"...等{self.error_count}个错误"
+        return message
+
+    def to_dict(self):
+        return {
+            'token': self.token,
+            'total_rows': self.total_rows,
+            'created': self.created,
+            'updated': self.updated,
+            'skipped': self.skipped,
+            'error_count': self.error_count,
+            'errors': self.errors,
+            'samples': self.samples,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        summary = cls()
+        for key, value in data.items():
+            setattr(summary, key, value)
+        return summary
+
+
+def get_staging_dir():
+    """预览暂存目录，可通过 settings.IMPORT_STAGING_DIR 调整"""
+    staging_dir = getattr(settings, 'IMPORT_STAGING_DIR', None) or os.path.join(settings.MEDIA_ROOT, 'import_staging')
+    os.makedirs(staging_dir, exist_ok=True)
+    return staging_dir
+
+
+def purge_expired_staging():
+    """清理超过有效期仍未确认的暂存文件"""
+    staging_dir = get_staging_dir()
+    expire_before = time.time() - getattr(settings, 'IMPORT_STAGING_TTL', DEFAULT_STAGING_TTL)
+    for name in os.listdir(staging_dir):
+        path = os.path.join(staging_dir, name)
+        try:
+            if os.path.getmtime(path) < expire_before:
+                os.remove(path)
+        except OSError:
+            continue
+
+
+class StagingNotFound(Exception):
+    """暂存数据不存在、已过期或不属于当前用户"""
+
+
+class ChunkedImporter:
+    """流式分块导入基类
+
+    子类需要指定 model、resource_class、id_field 以及 columns(规范列名 -> 模型字段)。
+    列名别名和默认值由 resource_class 的 column_aliases/fill_defaults 定义。
+
+    导入分为两步：stage() 只解析、校验一次，把校验后的行写入磁盘暂存文件并返回预览；
+    apply() 按令牌读取暂存行直接批量写入，不再重复解析和校验。
+    """
+    model = None
+    resource_class = None
+    id_field = None
+    columns = {}
+    date_fields = ()
+
+    def __init__(self, user=None, chunk_size=None):
+        self.user = user
+        self.chunk_size = chunk_size or get_chunk_size()
+        self.resource = self.resource_class()
+
+    def clean_row(self, row):
+        """将规范化后的行转换为模型字段字典，返回 None 表示跳过该行"""
+        values = {}
+        for column, field in self.columns.items():
+            value = row.get(column)
+            values[field] = clean_date(value) if field in self.date_fields else clean_text(value)
+        if not values[self.id_field]:
+            return None
+        return values
+
+    def get_update_fields(self):
+        """bulk_update 需要写入的字段，auto_now 字段不会自动更新，需要显式写入"""
+        return list(self.columns.values()) + ['updated_at']
+
+    def touch(self, instance, now):
+        """为待更新的记录写入 auto_now 字段"""
+        instance.updated_at = now
+
+    def get_staging_paths(self, token):
+        staging_dir = get_staging_dir()
+        return (
+            os.path.join(staging_dir, f'{token}.json'),
+            os.path.join(staging_dir, f'{token}.jsonl'),
+        )
+
+    def iter_cleaned_rows(self, file_obj, summary):
+        """逐行规范化并校验，返回按块分组的 {标识: (行号, 字段字典)}
+
+        列名别名在读到第一行时根据表头解析一次，之后每行只做固定的列投影。
+        """
+        chunk = {}
+        transform = None
+        for row_number, row in iter_xlsx_rows(file_obj):
+            summary.total_rows += 1
+            if transform is None:
+                transform = self.resource.compile_row_transformer(list(row))
+            try:
+                transform(row, row_number)
+                values = self.clean_row(row)
+            except (ValueError, TypeError) as e:
+                summary.add_error(row_number, str(e))
+                continue
+            if values is None:
+                summary.skipped += 1
+                continue
+            # 同一块内重复的标识以最后一行为准
+            if values[self.id_field] in chunk:
+                summary.skipped += 1
+            chunk[values[self.id_field]] = (row_number, values)
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = {}
+        if chunk:
+            yield chunk
+
+    def fetch_existing(self, keys):
+        """一次查询取出本块中已存在的记录"""
+        existing = {}
+        lookup = {f'{self.id_field}__in': list(keys)}
+        for instance in self.model.objects.filter(**lookup).order_by('id'):
+            existing.setdefault(getattr(instance, self.id_field), instance)
+        return existing
+
+    def is_unchanged(self, instance, values):
+        return all(getattr(instance, field) == value for field, value in values.items())
+
+    def stage(self, file_obj, progress=None):
+        """解析并校验上传文件，暂存校验后的行，返回带令牌的预览汇总
+
+        跨块重复的标识在预览中会各自计数，实际结果以 apply() 返回为准。
+        progress 为可选回调，每处理完一块以已读取的行数调用一次。
+        """
+        purge_expired_staging()
+        summary = ImportSummary()
+        summary.token = uuid.uuid4().hex
+        meta_path, rows_path = self.get_staging_paths(summary.token)
+        with open(rows_path, 'w', encoding='utf-8') as rows_file:
+            for chunk in self.iter_cleaned_rows(file_obj, summary):
+                existing = self.fetch_existing(chunk)
+                for key, (row_number, values) in chunk.items():
+                    instance = existing.get(key)
+                    if instance is None:
+                        summary.created += 1
+                        summary.add_sample(row_number, 'create', values)
+                    elif self.is_unchanged(instance, values):
+                        summary.skipped += 1
+                        continue
+                    else:
+                        summary.updated += 1
+                        summary.add_sample(row_number, 'update', values)
+                    rows_file.write(json.dumps(values, cls=DjangoJSONEncoder, ensure_ascii=False))
+                    rows_file.write('\n')
+                if progress:
+                    progress(summary.total_rows)
+
+        meta = {
+            'model': self.model._meta.label,
+            'user_id': self.user.pk if self.user else None,
+            'summary': summary.to_dict(),
+        }
+        with open(meta_path, 'w', encoding='utf-8') as meta_file:
+            json.dump(meta, meta_file, cls=DjangoJSONEncoder, ensure_ascii=False)
+        if summary.has_errors():
+            # 存在错误时不允许确认导入，只保留预览信息
+            os.remove(rows_path)
+        return summary
+
+    def load_staged(self, token):
+        """读取暂存的预览汇总，校验令牌归属"""
+        meta_path, rows_path = self.get_staging_paths(token)
+        try:
+            with open(meta_path, encoding='utf-8') as meta_file:
+                meta = json.load(meta_file)
+        except (OSError, ValueError):
+            raise StagingNotFound(token)
+        if meta['model'] != self.model._meta.label or meta['user_id'] != (self.user.pk if self.user else None):
+            raise StagingNotFound(token)
+        if not os.path.exists(rows_path):
+            raise StagingNotFound(token)
+        return ImportSummary.from_dict(meta['summary'])
+
+    def iter_staged_chunks(self, token):
+        _, rows_path = self.get_staging_paths(token)
+        chunk = {}
+        with open(rows_path, encoding='utf-8') as rows_file:
+            for line in rows_file:
+                values = json.loads(line)
+                for field in self.date_fields:
+                    values[field] = date.fromisoformat(values[field])
+                chunk[values[self.id_field]] = values
+                if len(chunk) >= self.chunk_size:
+                    yield chunk
+                    chunk = {}
+        if chunk:
+            yield chunk
+
+    def apply(self, token, progress=None):
+        """按令牌写入暂存的行，不再重复解析和校验
+
+        每块在各自的短事务中提交，updated_at 与提交时间只相差一块的写入时间，增量导出的
+        安全延迟足以覆盖；不会出现整个文件写完才提交、游标越过早已写入的记录的情况。
+        某块写入失败时之前的块已提交，暂存文件保留，用同一令牌重试时已写入的行按未变化跳过。
+        """
+        staged = self.load_staged(token)
+        summary = ImportSummary()
+        summary.token = token
+        summary.total_rows = staged.total_rows
+        summary.skipped = staged.skipped
+        # bulk_create/bulk_update 不触发信号，写入结束后统一递增表版本号；
+        # 在事务外递增，写入出错时不会在已中止的事务中继续查询而掩盖原来的异常
+        processed = 0
+        try:
+            with bulk_changes(self.model):
+                for chunk in self.iter_staged_chunks(token):
+                    with transaction.atomic():
+                        self.write_chunk(chunk, summary)
+                    processed += len(chunk)
+                    if progress:
+                        progress(processed)
+        except Exception:
+            logger.error(
+                "%s 导入中断: 已提交%d行(新增%d, 更新%d)，暂存数据保留，可重试",
+                self.model.__name__, processed, summary.created, summary.updated,
+            )
+            raise
+        finally:
+            barcodes.invalidate()
+        self.discard(token)
+        logger.info(
+            "%s 导入完成: 共%d行, 新增%d, 更新%d, 跳过%d",
+            self.model.__name__, summary.total_rows, summary.created,
+            summary.updated, summary.skipped,
+        )
+        return summary
+
+    def discard(self, token):
+        """删除暂存文件"""
+        for path in self.get_staging_paths(token):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def run(self, file_obj):
+        """一次完成暂存和写入，存在错误时不写入任何数据"""
+        summary = self.stage(file_obj)
+        if summary.has_errors():
+            self.discard(summary.token)
+            return summary
+        return self.apply(summary.token)
+
+    def write_chunk(self, chunk, summary):
+        """批量写入一个块：一次查询已有记录，再分别批量新增和批量更新"""
+        existing = self.fetch_existing(chunk)
+        now = timezone.now()
+        to_create = []
+        to_update = []
+        for key, values in chunk.items():
+            instance = existing.get(key)
+            if instance is None:
+                to_create.append(self.model(created_by=self.user, **values))
+                continue
+            if self.is_unchanged(instance, values):
+                summary.skipped += 1
+                continue
+            for field, value in values.items():
+                setattr(instance, field, value)
+            self.touch(instance, now)
+            to_update.append(instance)
+
+        if to_create:
+            self.model.objects.bulk_create(to_create, batch_size=self.chunk_size)
+        if to_update:
+            self.model.objects.bulk_update(to_update, self.get_update_fields(), batch_size=self.chunk_size)
+        # 批量写入不触发信号，单独更新搜索索引、对账表和状态历史
+        index_objects(self.model, [instance.pk for instance in to_create + to_update])
+        if self.model in reconciliation.SOURCES and (to_create or to_update):
+            reconciliation.refresh(chunk.keys())
+        if self.model is DeviceSecurityStatus:
+            status_history.record_bulk(to_create, to_update)
+        summary.created += len(to_create)
+        summary.updated += len(to_update)
+
+
+class DeviceArrivalImporter(ChunkedImporter):
+    """设备到货清单导入"""
+    model = DeviceArrival
+    resource_class = DeviceArrivalResource
+    id_field = 'barcode'
+    columns = {
+        '项目名称': 'project_name',
+        '到货日期': 'arrival_date',
+        '设备型号': 'device_model',
+        '条码': 'barcode',
+    }
+    date_fields = ('arrival_date',)
+
+
+class DeviceDeliveryImporter(ChunkedImporter):
+    """设备出货清单导入"""
+    model = DeviceDelivery
+    resource_class = DeviceDeliveryResource
+    id_field = 'barcode'
+    columns = {
+        '出货日期': 'delivery_date',
+        '设备型号': 'device_model',
+        '条码': 'barcode',
+        '接收单位': 'recipient_unit',
+        '接收人': 'recipient',
+    }
+    date_fields = ('delivery_date',)
+
+
+class DeviceSecurityStatusImporter(ChunkedImporter):
+    """设备安装状态导入"""
+    model = DeviceSecurityStatus
+    resource_class = DeviceSecurityStatusResource
+    id_field = 'asset_serial_number'
+    columns = {
+        '网元名称': 'network_element_name',
+        '资产序列号': 'asset_serial_number',
+        '检查日期': 'check_date',
+    }
+    date_fields = ('check_date',)
+
+    def clean_row(self, row):
+        # fill_defaults 会把没有资产序列号的行的序列号置空，这类行直接跳过
+        if not row.get('资产序列号'):
+            return None
+        values = super().clean_row(row)
+        if values is not None:
+            values['is_online'] = bool(row.get('在线状态', True))
+        return values
+
+    def get_update_fields(self):
+        return super().get_update_fields() + ['is_online', 'last_check_time']
+
+    def touch(self, instance, now):
+        super().touch(instance, now)
+        instance.last_check_time = now
@@ -0,0 +1,269 @@
+"""后台导入导出任务
+
+任务保存在 BackgroundJob 表中，由 `python manage.py run_jobs` 启动的本地工作进程池
+轮询执行，不依赖外部消息队列。默认在请求内同步执行，settings.BACKGROUND_JOBS 为 True
+时才交给工作进程，避免没有启动工作进程时任务一直排队。
+"""
+import logging
+import os
+import socket
+import time
+import uuid
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .export_cache import ExportCacheEntry
+from .exporters import STREAM_FORMATS, write_export
+from .filters import DeviceArrivalQuery, DeviceDeliveryQuery, DeviceSecurityStatusQuery
+from .importers import (
+    DeviceArrivalImporter, DeviceDeliveryImporter, DeviceSecurityStatusImporter, estimate_xlsx_rows,
+)
+from .models import BackgroundJob, DeviceArrival, DeviceDelivery, DeviceSecurityStatus
+from .resources import DeviceArrivalResource, DeviceDeliveryResource, DeviceSecurityStatusResource
+from .versioning import get_version
+
+logger = logging.getLogger(__name__)
+
+# 进度写回数据库的最小间隔(秒)
+PROGRESS_INTERVAL = 1.0
+
+# 可执行后台任务的数据表
+JOB_TARGETS = {
+    'device_arrival': {
+        'label': '设备到货数据',
+        'model': DeviceArrival,
+        'importer_class': DeviceArrivalImporter,
+        'resource_class': DeviceArrivalResource,
+        'query_class': DeviceArrivalQuery,
+        'export_filename': 'device_arrivals.xlsx',
+    },
+    'device_delivery': {
+        'label': '设备出货数据',
+        'model': DeviceDelivery,
+        'importer_class': DeviceDeliveryImporter,
+        'resource_class': DeviceDeliveryResource,
+        'query_class': DeviceDeliveryQuery,
+        'export_filename': 'device_deliveries.xlsx',
+    },
+    'device_security_status': {
+        'label': '设备安装状态数据',
+        'model': DeviceSecurityStatus,
+        'importer_class': DeviceSecurityStatusImporter,
+        'resource_class': DeviceSecurityStatusResource,
+        'query_class': DeviceSecurityStatusQuery,
+        'export_filename': 'device_security_statuses.xlsx',
+    },
+}
+
+
+def get_job_files_dir():
+    """任务上传文件和导出结果的存放目录，可通过 settings.JOB_FILES_DIR 调整"""
+    files_dir = getattr(settings, 'JOB_FILES_DIR', None) or os.path.join(settings.MEDIA_ROOT, 'jobs')
+    os.makedirs(files_dir, exist_ok=True)
+    return files_dir
+
+
+def new_job_file_path(suffix):
+    return os.path.join(get_job_files_dir(), f'{uuid.uuid4().hex}{suffix}')
+
+
+def submit(job):
+    """提交任务：启用后台任务时交给工作进程，否则立即在当前进程执行"""
+    if not getattr(settings, 'BACKGROUND_JOBS', False):
+        run_job(job)
+    return job
+
+
+def enqueue_import_stage(user, target, upload):
+    """保存上传文件并创建导入校验任务"""
+    path = new_job_file_path('.xlsx')
+    with open(path, 'wb') as destination:
+        for chunk in upload.chunks():
+            destination.write(chunk)
+    job = BackgroundJob.objects.create(
+        job_type='IMPORT_STAGE', target=target, input_file=path, created_by=user,
+        params={'filename': upload.name},
+    )
+    return submit(job)
+
+
+def enqueue_import_apply(user, target, token):
+    """为已校验的暂存数据创建导入写入任务"""
+    job = BackgroundJob.objects.create(
+        job_type='IMPORT_APPLY', target=target, created_by=user, params={'token': token},
+    )
+    return submit(job)
+
+
+def enqueue_export(user, target, filters=None, fields=None, export_format='xlsx'):
+    """创建导出任务，filters 为列表页的筛选参数，fields 为要导出的字段，export_format 见 STREAM_FORMATS"""
+    job = BackgroundJob.objects.create(
+        job_type='EXPORT', target=target, created_by=user,
+        params={'filters': filters or {}, 'fields': fields, 'format': export_format},
+    )
+    return submit(job)
+
+
+class JobProgress:
+    """按固定间隔把进度写回任务表，避免每块都产生一次写入"""
+
+    def __init__(self, job):
+        self.job = job
+        self.last_saved = 0
+
+    def set_total(self, total_rows):
+        self.job.total_rows = total_rows
+        BackgroundJob.objects.filter(pk=self.job.pk).update(total_rows=total_rows)
+
+    def __call__(self, processed_rows, force=False):
+        self.job.processed_rows = processed_rows
+        now = time.monotonic()
+        if force or now - self.last_saved >= PROGRESS_INTERVAL:
+            self.last_saved = now
+            BackgroundJob.objects.filter(pk=self.job.pk).update(processed_rows=processed_rows)
+
+
+def run_job(job):
+    """执行单个任务并记录结果"""
+    target = JOB_TARGETS[job.target]
+    progress = JobProgress(job)
+    job.status = 'RUNNING'
+    job.started_at = timezone.now()
+    job.worker_pid = os.getpid()
+    job.worker_host = get_worker_host()
+    job.save(update_fields=['status', 'started_at', 'worker_pid', 'worker_host'])
+    try:
+        if job.job_type == 'IMPORT_STAGE':
+            run_import_stage(job, target, progress)
+        elif job.job_type == 'IMPORT_APPLY':
+            run_import_apply(job, target, progress)
+        elif job.job_type == 'EXPORT':
+            run_export(job, target, progress)
+        else:
+            raise ValueError(f"未知任务类型: {job.job_type}")
+        job.status = 'SUCCESS'
+    except Exception as e:
+        logger.exception("后台任务 %s 执行失败", job.pk)
+        job.status = 'FAILED'
+        job.error = str(e)
+    job.finished_at = timezone.now()
+    job.save()
+    return job
+
+
+def run_import_stage(job, target, progress):
+    importer = target['importer_class'](user=job.created_by)
+    progress.set_total(estimate_xlsx_rows(job.input_file))
+    summary = importer.stage(job.input_file, progress=progress)
+    # 校验后的数据已写入暂存文件，原始上传文件不再需要；校验失败时保留文件以便排查和重试
+    os.remove(job.input_file)
+    progress(summary.total_rows, force=True)
+    job.result = summary.to_dict()
+
+
+def run_import_apply(job, target, progress):
+    importer = target['importer_class'](user=job.created_by)
+    staged = importer.load_staged(job.params['token'])
+    progress.set_total(staged.created + staged.updated)
+    summary = importer.apply(job.params['token'], progress=progress)
+    job.result = summary.to_dict()
+
+
+def run_export(job, target, progress):
+    filters = job.params.get('filters', {})
+    fields = job.params.get('fields')
+    export_format = job.params.get('format', 'xlsx')
+    extension = STREAM_FORMATS[export_format][1]
+    entry = ExportCacheEntry(job.target, get_version(target['model']), filters, fields, export_format)
+    queryset = target['query_class'](filters).get_queryset().order_by('id')
+    count = queryset.count()
+    progress.set_total(count)
+    path = new_job_file_path(f'.{extension}')
+    try:
+        # 数据未变化时直接复制缓存的导出文件
+        entry.copy_to(path)
+        progress(count, force=True)
+    except FileNotFoundError:
+        count = write_export(path, target['resource_class'](), queryset, export_format, progress=progress, fields=fields)
+        entry.store(path)
+    job.result_file = path
+    job.result = {
+        'rows': count,
+        'format': export_format,
+        'filename': f"{os.path.splitext(target['export_filename'])[0]}.{extension}",
+    }
+
+
+def get_job_stats(job):
+    """计算任务的吞吐量(行/秒)和预计剩余时间(秒)"""
+    throughput = None
+    eta_seconds = None
+    if job.started_at:
+        elapsed = ((job.finished_at or timezone.now()) - job.started_at).total_seconds()
+        if elapsed > 0 and job.processed_rows:
+            throughput = job.processed_rows / elapsed
+    if throughput and job.total_rows and not job.is_finished:
+        eta_seconds = max(job.total_rows - job.processed_rows, 0) / throughput
+    return throughput, eta_seconds
+
+
+def get_worker_host():
+    return socket.gethostname()
+
+
+def is_process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # 进程存在但属于其他用户
+        return True
+    return True
+
+
+def requeue_orphaned_jobs():
+    """本机上执行中但工作进程已不存在的任务重新排队，返回重新排队的任务数
+
+    其他主机上的任务无法判断进程状态，由该主机的进程池启动时处理；
+    没有记录主机的任务视为本机任务。
+    """
+    host = get_worker_host()
+    running = BackgroundJob.objects.filter(status='RUNNING', worker_host__in=[host, ''])
+    requeued = 0
+    for pk, pid in running.values_list('pk', 'worker_pid'):
+        if pid and is_process_alive(pid):
+            continue
+        # 条件更新，避免覆盖期间已结束或被重新领取的任务
+        requeued += BackgroundJob.objects.filter(pk=pk, status='RUNNING', worker_pid=pid).update(
+            status='PENDING', worker_pid=None, worker_host='',
+        )
+    return requeued
+
+
+def claim_next_job():
+    """领取最早的排队任务，通过条件更新保证同一任务只被一个进程领取"""
+    while True:
+        job = BackgroundJob.objects.filter(status='PENDING').order_by('created_at', 'id').first()
+        if job is None:
+            return None
+        claimed = BackgroundJob.objects.filter(pk=job.pk, status='PENDING').update(
+            status='RUNNING', worker_pid=os.getpid(), worker_host=get_worker_host(), started_at=timezone.now(),
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+
+
+def worker_loop(poll_interval=1.0, stop_event=None):
+    """工作进程主循环：领取并执行任务，没有任务时按间隔轮询"""
+    while stop_event is None or not stop_event.is_set():
+        close_old_connections()
+        job = claim_next_job()
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        logger.info("工作进程 %s 开始执行任务 %s", os.getpid(), job.pk)
+        run_job(job)
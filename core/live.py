@@ -0,0 +1,208 @@
+"""设备状态看板实时推送
+
+到货或安装记录写入后，对账表 refresh() 在事务提交时把涉及的条码发布到本进程的
+ChangeFeed。第一个订阅者连接时启动一个后台任务，合并短时间内的变化后计算一次分类
+计数(全部设备和最近创建的记录两种范围)和变化设备，再推送给所有订阅者：同时打开
+N 个看板，每次变化也只计算一次。
+
+其他进程(后台任务进程、其他服务进程)的写入不经过本进程的发布，后台任务每隔
+LIVE_DASHBOARD_POLL_SECONDS 秒检查一次到货和安装表的版本号，变化时重新计算计数。
+
+推送使用 Server-Sent Events，需要通过 resource_management/asgi.py 以 ASGI 方式部署。
+"""
+import asyncio
+import json
+import threading
+from collections import deque
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .dashboard import get_backend
+from .models import DeviceArrival, DeviceReconciliation, DeviceSecurityStatus, TableVersion
+from .versioning import get_table_label
+
+# 默认检查其他进程写入的间隔(秒)
+DEFAULT_POLL_SECONDS = 5
+
+# 收到变化后等待这段时间再计算，合并批量写入产生的连续变化
+DEBOUNCE_SECONDS = 0.5
+
+# 没有新事件时发送心跳注释的间隔(秒)，避免代理断开空闲连接
+KEEPALIVE_SECONDS = 15
+
+# 每个事件最多附带的设备数；待处理的条码超过 MAX_PENDING 时只推送计数
+MAX_DEVICES = 50
+MAX_PENDING = 1000
+
+# 保留最近的事件，断线重连时按 Last-Event-ID 补发
+HISTORY_SIZE = 100
+
+SOURCE_TABLES = [get_table_label(model) for model in (DeviceArrival, DeviceSecurityStatus)]
+
+
+def get_poll_seconds():
+    return float(getattr(settings, 'LIVE_DASHBOARD_POLL_SECONDS', DEFAULT_POLL_SECONDS))
+
+
+def serialize_device(device):
+    item = {'barcode': device.barcode, 'state': device.state}
+    if device.arrival:
+        item.update(device_model=device.arrival.device_model, project_name=device.arrival.project_name)
+    if device.installation:
+        item.update(
+            network_element_name=device.installation.network_element_name,
+            is_online=device.installation.is_online,
+        )
+    return item
+
+
+def format_event(event):
+    data = json.dumps(event['data'], cls=DjangoJSONEncoder, ensure_ascii=False)
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {data}\n\n"
+
+
+class ChangeFeed:
+    """进程内的看板变化源
+
+    publish() 可以在任意线程调用；订阅和计算都在事件循环中进行，数据库查询通过
+    sync_to_async 在线程中执行。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._overflow = False
+        self._loop = None
+        self._wakeup = None
+        self._changed = None
+        self._task = None
+        self._subscribers = 0
+        self._events = deque(maxlen=HISTORY_SIZE)
+        self._last_id = 0
+        self._counts = None
+        self._recent_counts = None
+        self._versions = None
+
+    def publish(self, barcodes):
+        """记录发生变化的条码并唤醒计算任务"""
+        with self._lock:
+            if not self._overflow:
+                self._pending.update(barcodes)
+                if len(self._pending) > MAX_PENDING:
+                    self._pending.clear()
+                    self._overflow = True
+            loop, wakeup = self._loop, self._wakeup
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(wakeup.set)
+
+    def _bind(self):
+        """绑定到当前事件循环，启动计算任务"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            with self._lock:
+                self._loop = loop
+                self._wakeup = asyncio.Event()
+            self._changed = asyncio.Event()
+            self._task = None
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._run())
+
+    def _take_pending(self):
+        with self._lock:
+            barcodes, overflow = self._pending, self._overflow
+            self._pending, self._overflow = set(), False
+            self._wakeup.clear()
+        return barcodes, overflow
+
+    async def _run(self):
+        # 启动时先计算一次，之后等待发布或定时检查版本号；没有订阅者时退出
+        while self._subscribers:
+            barcodes, overflow = self._take_pending()
+            data = await sync_to_async(self.compute)(barcodes, overflow)
+            if data is not None:
+                self._last_id += 1
+                self._events.append({'id': self._last_id, 'type': 'change', 'data': data})
+                changed, self._changed = self._changed, asyncio.Event()
+                changed.set()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=get_poll_seconds())
+                await asyncio.sleep(DEBOUNCE_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    def compute(self, barcodes, overflow=False):
+        """计算新的分类计数和变化的设备；没有任何变化时返回 None"""
+        versions = dict(TableVersion.objects.filter(table__in=SOURCE_TABLES).values_list('table', 'version'))
+        if not barcodes and not overflow and versions == self._versions:
+            return None
+        self._versions = versions
+
+        counts = get_backend().get_counts()
+        previous = self._counts or counts
+        self._counts = counts
+        # 看板默认范围(最近创建的记录)的计数，页面按当前范围选择
+        self._recent_counts = get_backend(limited=True).get_counts()
+        devices = []
+        removed = []
+        if barcodes:
+            barcodes = sorted(barcodes)[:MAX_DEVICES]
+            found = {
+                device.barcode: device
+                for device in DeviceReconciliation.objects.filter(barcode__in=barcodes)
+                .select_related('arrival', 'installation')
+            }
+            for barcode in barcodes:
+                if barcode in found:
+                    devices.append(serialize_device(found[barcode]))
+                else:
+                    removed.append(barcode)
+        return {
+            'counts': counts,
+            'recent_counts': self._recent_counts,
+            'delta': {state: counts[state] - previous.get(state, 0) for state in counts},
+            'devices': devices,
+            'removed': removed,
+            'truncated': overflow,
+        }
+
+    async def subscribe(self, last_event_id=None):
+        """按 SSE 格式逐条返回事件；先补发 last_event_id 之后的历史事件，再发送当前计数"""
+        self._bind()
+        self._subscribers += 1
+        try:
+            if last_event_id is not None:
+                sent = last_event_id
+                for event in list(self._events):
+                    if event['id'] > last_event_id:
+                        sent = event['id']
+                        yield format_event(event)
+            else:
+                sent = self._last_id
+                if self._counts is not None:
+                    yield format_event({
+                        'id': sent, 'type': 'counts',
+                        'data': {'counts': self._counts, 'recent_counts': self._recent_counts},
+                    })
+            while True:
+                changed = self._changed
+                pending = [event for event in list(self._events) if event['id'] > sent]
+                if not pending:
+                    try:
+                        await asyncio.wait_for(changed.wait(), timeout=KEEPALIVE_SECONDS)
+                    except asyncio.TimeoutError:
+                        yield ': keepalive\n\n'
+                    continue
+                for event in pending:
+                    sent = event['id']
+                    yield format_event(event)
+        finally:
+            self._subscribers -= 1
+
+
+feed = ChangeFeed()
+
+
+def publish(barcodes):
+    feed.publish(barcodes)
@@ -0,0 +1,201 @@
+"""用户操作日志的保留期限和归档
+
+`python manage.py archive_activity_logs` 把超过 ACTIVITY_LOG_RETENTION_DAYS 天的日志
+按日期(当前时区)追加到归档目录下的 <年>/<月>/activity-<日期>.jsonl.gz，每行一条日志，
+再删除这些记录。按 (时间, id) 顺序每次处理 ACTIVITY_LOG_ARCHIVE_BATCH_SIZE 条，
+每批在单独的短事务中删除，不会长时间占用写锁。
+
+每批先写入并同步归档文件、再删除记录；中途中断时下次会重新归档未删除的记录，
+search() 按 id 去掉重复的行。search() 只读取归档文件，按日期范围选择需要读取的分区。
+"""
+import gzip
+import json
+import os
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .delta import decode_cursor, encode_cursor
+from .models import UserActivityLog
+from .rollups import start_of_day
+from .search import deferred_index
+
+DEFAULT_RETENTION_DAYS = 180
+DEFAULT_BATCH_SIZE = 2000
+
+# 查询归档每次返回的默认条数和上限
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+PARTITION_PREFIX = 'activity-'
+PARTITION_SUFFIX = '.jsonl.gz'
+
+ARCHIVE_FIELDS = (
+    'id', 'user_id', 'user__username', 'action_type', 'content_type', 'object_id',
+    'description', 'ip_address', 'user_agent__value', 'timestamp',
+)
+
+
+def get_archive_dir():
+    """归档目录，可通过 settings.ACTIVITY_LOG_ARCHIVE_DIR 调整"""
+    archive_dir = getattr(settings, 'ACTIVITY_LOG_ARCHIVE_DIR', None) or os.path.join(settings.BASE_DIR, 'archive', 'activity_logs')
+    os.makedirs(archive_dir, exist_ok=True)
+    return archive_dir
+
+
+def get_retention_days():
+    return int(getattr(settings, 'ACTIVITY_LOG_RETENTION_DAYS', DEFAULT_RETENTION_DAYS))
+
+
+def get_cutoff(days=None, now=None):
+    """早于该时间的日志需要归档；取整到当天零点，每个日期分区一次归档完整"""
+    days = get_retention_days() if days is None else days
+    today = timezone.localtime(now or timezone.now()).date()
+    return start_of_day(today - timedelta(days=days))
+
+
+def get_partition_path(day, archive_dir=None):
+    return os.path.join(
+        archive_dir or get_archive_dir(), f'{day:%Y}', f'{day:%m}', f'{PARTITION_PREFIX}{day.isoformat()}{PARTITION_SUFFIX}',
+    )
+
+
+def serialize_log(row):
+    row = dict(row)
+    row['username'] = row.pop('user__username')
+    # 归档文件自成一体：保存完整的用户代理和描述
+    row['user_agent'] = row.pop('user_agent__value')
+    row['description'] = row['description'] or UserActivityLog.describe(
+        row['action_type'], row['content_type'], row['object_id'],
+    )
+    # 保留完整的微秒，DjangoJSONEncoder 只保留到毫秒
+    row['timestamp'] = row['timestamp'].isoformat()
+    return row
+
+
+def write_partitions(rows, archive_dir=None):
+    """按日期把日志追加到各分区文件，写入后同步到磁盘"""
+    partitions = defaultdict(list)
+    for row in rows:
+        partitions[timezone.localtime(row['timestamp']).date()].append(serialize_log(row))
+    for day, logs in partitions.items():
+        path = get_partition_path(day, archive_dir)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 追加模式每次写入一个 gzip 成员，读取时按顺序解压为一个整体
+        with open(path, 'ab') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='ab') as archive:
+                for log in logs:
+                    archive.write(json.dumps(log, cls=DjangoJSONEncoder, ensure_ascii=False).encode('utf-8'))
+                    archive.write(b'\n')
+            raw.flush()
+            os.fsync(raw.fileno())
+    return len(partitions)
+
+
+def archive(cutoff=None, batch_size=None, dry_run=False):
+    """归档并删除 cutoff 之前的日志，返回 (归档条数, 写入的分区数)"""
+    cutoff = cutoff or get_cutoff()
+    batch_size = batch_size or int(getattr(settings, 'ACTIVITY_LOG_ARCHIVE_BATCH_SIZE', DEFAULT_BATCH_SIZE))
+    expired = UserActivityLog.objects.filter(timestamp__lt=cutoff)
+    if dry_run:
+        return expired.count(), 0
+
+    archive_dir = get_archive_dir()
+    archived = 0
+    days = set()
+    while True:
+        rows = list(expired.order_by('timestamp', 'id').values(*ARCHIVE_FIELDS)[:batch_size])
+        if not rows:
+            return archived, len(days)
+        write_partitions(rows, archive_dir)
+        days.update(timezone.localtime(row['timestamp']).date() for row in rows)
+        # 删除时的索引更新合并到这一批的事务结束后执行，删除出错时不会掩盖原来的异常
+        with deferred_index(UserActivityLog), transaction.atomic():
+            UserActivityLog.objects.filter(id__in=[row['id'] for row in rows]).delete()
+        archived += len(rows)
+
+
+def list_partitions(start_day=None, end_day=None):
+    """[start_day, end_day] 内已有的分区，按日期排列"""
+    archive_dir = get_archive_dir()
+    partitions = []
+    for root, _, files in os.walk(archive_dir):
+        for name in files:
+            if not (name.startswith(PARTITION_PREFIX) and name.endswith(PARTITION_SUFFIX)):
+                continue
+            try:
+                day = date.fromisoformat(name[len(PARTITION_PREFIX):-len(PARTITION_SUFFIX)])
+            except ValueError:
+                continue
+            if (start_day is None or day >= start_day) and (end_day is None or day <= end_day):
+                partitions.append((day, os.path.join(root, name)))
+    return sorted(partitions)
+
+
+def read_partition(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as archive:
+        for line in archive:
+            if line.strip():
+                yield json.loads(line)
+
+
+def matches(log, username=None, action_type=None, content_type=None, query=None):
+    if username and log['username'] != username:
+        return False
+    if action_type and log['action_type'] != action_type:
+        return False
+    if content_type and log['content_type'] != content_type:
+        return False
+    if query:
+        query = query.lower()
+        return any(query in (log[field] or '').lower() for field in ('description', 'username', 'ip_address'))
+    return True
+
+
+def search(start=None, end=None, username=None, action_type=None, content_type=None, query=None,
+           cursor=None, limit=DEFAULT_LIMIT):
+    """按时间顺序返回归档中 [start, end) 内符合条件的日志，只读取日期范围内的分区
+
+    返回 logs、下一页的 cursor 和 has_more，游标格式与状态历史相同。
+    """
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    position = decode_cursor(cursor)['u'] if cursor else None
+    if position:
+        position = tuple(position)
+        start = max(start, position[0]) if start else position[0]
+    start_day = timezone.localtime(start).date() if start else None
+    end_day = timezone.localtime(end).date() if end else None
+
+    logs = []
+    seen = set()
+    has_more = False
+    for _, path in list_partitions(start_day, end_day):
+        entries = []
+        for log in read_partition(path):
+            # 中断后重新归档可能追加了重复的行
+            if log['id'] in seen:
+                continue
+            seen.add(log['id'])
+            moment = parse_datetime(log['timestamp'])
+            if (start and moment < start) or (end and moment >= end):
+                continue
+            if position and (moment, log['id']) <= position:
+                continue
+            if matches(log, username, action_type, content_type, query):
+                entries.append((moment, log['id'], log))
+        entries.sort(key=lambda entry: entry[:2])
+        logs.extend(entry[2] for entry in entries)
+        if len(logs) > limit:
+            has_more = True
+            logs = logs[:limit]
+            break
+
+    next_cursor = None
+    if logs:
+        next_cursor = encode_cursor({'u': [logs[-1]['timestamp'], logs[-1]['id']], 'd': None})
+    return {'logs': logs, 'cursor': next_cursor or cursor, 'has_more': has_more}
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from core import log_archive
+
+
+class Command(BaseCommand):
+    help = '把超过保留期限的用户操作日志归档为按日期分区的压缩文件并删除；建议每天执行一次'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='保留最近多少天的日志，默认为 settings.ACTIVITY_LOG_RETENTION_DAYS')
+        parser.add_argument('--batch-size', type=int, help='每批归档和删除的条数')
+        parser.add_argument('--dry-run', action='store_true', help='只统计需要归档的条数')
+
+    def handle(self, *args, **options):
+        cutoff = log_archive.get_cutoff(options['days'])
+        archived, partitions = log_archive.archive(cutoff, options['batch_size'], options['dry_run'])
+        if options['dry_run']:
+            self.stdout.write(f"{cutoff:%Y-%m-%d} 之前共有 {archived} 条日志需要归档")
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"归档完成: {archived} 条日志写入 {partitions} 个日期分区 ({log_archive.get_archive_dir()})"
+        ))
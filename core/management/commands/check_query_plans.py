@@ -0,0 +1,182 @@
+import re
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from core.barcodes import barcode_filter
+from core.dashboard import INSTALLATION_ORDERING, QueryBackend, ReconciliationBackend, get_window_hours
+from core.delta import after
+from core.models import (
+    DailyDeviceRollup, DeletedRecord, DeviceArrival, DeviceDelivery, DeviceReconciliation, DeviceSecurityStatus,
+    DeviceStatusChange, HourlyDeviceRollup, UserActivityLog,
+)
+from core.pagination import keyset_filter
+from core.rollups import start_of_day
+from core.search import search_filter
+from core.versioning import get_table_label
+from core.views import (
+    DeviceArrivalListView, DeviceDeliveryListView, DeviceSecurityStatusListView, UserActivityLogListView,
+)
+
+# 查询计划中的扫描，捕获 (表名, 索引名)：SQLite 为 SCAN，PostgreSQL 为 Seq Scan
+SCAN_PATTERNS = {
+    'sqlite': re.compile(r'\bSCAN (\w+)(?: USING (?:COVERING )?INDEX (\w+))?$', re.MULTILINE),
+    'postgresql': re.compile(r'\bSeq Scan on (\w+)()'),
+}
+
+# 需要额外排序的查询计划，只提示不判定失败
+SORT_PATTERNS = {
+    'sqlite': re.compile(r'USE TEMP B-TREE FOR (?:ORDER BY|RIGHT PART OF ORDER BY)'),
+    'postgresql': re.compile(r'\bSort\b'),
+}
+
+# 示例参数，查询计划与具体取值无关
+SAMPLE_BARCODE = 'BC00001234'
+SAMPLE_TEXT = '示例关键词'
+SAMPLE_ID = 1
+PAGE_SIZE = 20
+
+
+def list_queries(name, model, ordering, queryset=None):
+    """列表页第一页和后续页(键集条件)的查询"""
+    queryset = (model.objects.all() if queryset is None else queryset).order_by(*ordering)
+    key = [timezone.now() if field.lstrip('-') != 'id' else SAMPLE_ID for field in ordering]
+    return [
+        (f'{name}: 第一页', queryset[:PAGE_SIZE + 1]),
+        (f'{name}: 后续页', queryset.filter(keyset_filter(ordering, key))[:PAGE_SIZE + 1]),
+    ]
+
+
+def get_canonical_queries():
+    """各视图的典型查询，返回 [(名称, 查询集)]"""
+    now = timezone.now()
+    today_start = start_of_day(timezone.localdate())
+    window_start = today_start - timedelta(days=90)
+    query_backend = QueryBackend(get_window_hours())
+    reconciliation_backend = ReconciliationBackend(get_window_hours())
+    since = reconciliation_backend.since
+    queries = []
+
+    device_views = (
+        ('设备到货', DeviceArrival, DeviceArrivalListView),
+        ('设备出货', DeviceDelivery, DeviceDeliveryListView),
+        ('设备安装', DeviceSecurityStatus, DeviceSecurityStatusListView),
+    )
+    for label, model, view in device_views:
+        ordering = view.keyset_ordering
+        queries += list_queries(f'{label}列表', model, ordering)
+        queries += [
+            (f'{label}列表: 条码搜索', model.objects.filter(search_filter(model, SAMPLE_BARCODE) | barcode_filter(model, SAMPLE_BARCODE)).order_by(*ordering)[:PAGE_SIZE + 1]),
+            (f'{label}列表: 关键词搜索', model.objects.filter(search_filter(model, SAMPLE_TEXT)).order_by(*ordering)[:PAGE_SIZE + 1]),
+            (f'{label}编辑/删除', model.objects.filter(created_by_id=SAMPLE_ID, pk=SAMPLE_ID)),
+            (f'{label}增量导出', model.objects.filter(updated_at__lte=now).filter(after([now, SAMPLE_ID], 'updated_at')).order_by('updated_at', 'id')[:1001]),
+            (f'{label}删除记录', DeletedRecord.objects.filter(table=get_table_label(model), deleted_at__lte=now).filter(after([now, SAMPLE_ID], 'deleted_at')).order_by('deleted_at', 'id')[:1001]),
+        ]
+    for label, is_online in (('在线', True), ('离线', False)):
+        queries += list_queries(
+            f'设备安装列表: {label}筛选', DeviceSecurityStatus, DeviceSecurityStatusListView.keyset_ordering,
+            DeviceSecurityStatus.objects.filter(is_online=is_online),
+        )
+
+    queries += [
+        ('条码查询: 到货', DeviceArrival.objects.filter(barcode=SAMPLE_BARCODE)),
+        ('条码查询: 出货', DeviceDelivery.objects.filter(barcode=SAMPLE_BARCODE).order_by('-delivery_date', '-id')),
+        ('条码查询: 安装', DeviceSecurityStatus.objects.filter(asset_serial_number=SAMPLE_BARCODE).order_by('-last_check_time', '-id')),
+        ('设备状态看板: 分类计数', DeviceReconciliation.objects.order_by().values_list('state').annotate(total=Count('id'))),
+        ('设备状态看板: 分类分页', DeviceReconciliation.objects.filter(state='online').select_related('arrival', 'installation').order_by('barcode')[PAGE_SIZE:PAGE_SIZE * 2]),
+        ('设备状态看板: 时间范围计数', DeviceReconciliation.objects.filter(Q(arrival_created_at__gte=since) | Q(installation_created_at__gte=since))),
+        *[
+            (f'设备状态看板: 时间范围分页({state})', DeviceReconciliation.objects.filter(reconciliation_backend.get_state_filter(state)).order_by('barcode')[PAGE_SIZE:PAGE_SIZE * 2])
+            for state in ('online', 'offline', 'other')
+        ],
+        ('设备状态看板: 显示的安装记录', DeviceSecurityStatus.objects.filter(asset_serial_number__in=[SAMPLE_BARCODE]).order_by(*INSTALLATION_ORDERING)),
+        ('设备状态看板: 今日安装', DeviceSecurityStatus.objects.filter(created_at__gte=today_start, created_at__lt=now).order_by().values('is_online')),
+        ('设备状态看板: 每日汇总', DailyDeviceRollup.objects.filter(period_start__gte=window_start, period_start__lt=today_start)),
+        ('设备状态看板: 小时汇总', HourlyDeviceRollup.objects.filter(period_start__gte=today_start, period_start__lt=now)),
+        ('设备状态看板(子查询): 在线/脱网计数', query_backend.arrivals().filter(query_backend.has_installation())),
+        ('设备状态看板(子查询): 在线分页', query_backend.arrivals().filter(query_backend.has_installation()).order_by('barcode')[PAGE_SIZE:PAGE_SIZE * 2]),
+        ('设备状态看板(子查询): 其他设备', query_backend.other_serials().order_by('asset_serial_number')[PAGE_SIZE:PAGE_SIZE * 2]),
+    ]
+
+    history = DeviceStatusChange.objects.filter(after([now, SAMPLE_ID], 'changed_at')).order_by('changed_at', 'id')
+    queries += [
+        ('状态历史: 序列号', history.filter(asset_serial_number=SAMPLE_BARCODE)[:PAGE_SIZE + 1]),
+        ('状态历史: 网元', history.filter(network_element_name=SAMPLE_TEXT)[:PAGE_SIZE + 1]),
+        ('状态历史: 时间范围', history.filter(changed_at__lt=now)[:PAGE_SIZE + 1]),
+    ]
+
+    ordering = UserActivityLogListView.keyset_ordering
+    queries += list_queries('操作日志', UserActivityLog, ordering)
+    queries += list_queries('操作日志: 用户筛选', UserActivityLog, ordering, UserActivityLog.objects.filter(user_id=SAMPLE_ID))
+    queries += list_queries('操作日志: 操作类型筛选', UserActivityLog, ordering, UserActivityLog.objects.filter(action_type='CREATE'))
+    queries += list_queries('操作日志: 内容类型筛选', UserActivityLog, ordering, UserActivityLog.objects.filter(content_type='DEVICE_ARRIVAL'))
+    queries += list_queries('操作日志: 日期筛选', UserActivityLog, ordering, UserActivityLog.objects.filter(timestamp__gte=today_start, timestamp__lt=now))
+    queries.append(
+        ('操作日志: 关键词搜索', UserActivityLog.objects.filter(search_filter(UserActivityLog, SAMPLE_TEXT)).order_by(*ordering)[:PAGE_SIZE + 1]),
+    )
+    return queries
+
+
+class Command(BaseCommand):
+    help = '对各视图的典型查询执行 EXPLAIN，存在全表扫描时返回失败'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true', help='输出每条查询的完整查询计划')
+
+    def get_partial_indexes(self, connection):
+        """SQLite 部分索引只包含满足条件的行，沿它扫描不是全表扫描"""
+        if connection.vendor != 'sqlite':
+            return set()
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND sql LIKE '% WHERE %'")
+            return {row[0] for row in cursor.fetchall()}
+
+    def find_full_scans(self, queryset, plan, pattern, partial_indexes):
+        """返回全表扫描的表名
+
+        没有筛选条件时沿索引按顺序读取(配合 LIMIT)是正常的；有筛选条件时沿普通索引
+        逐行扫描同样要读完整张表，只有部分索引例外。
+        """
+        scanned = []
+        for table, index in pattern.findall(plan):
+            if not index or (queryset.query.where and index not in partial_indexes):
+                scanned.append(table)
+        return scanned
+
+    def explain(self, queryset):
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql':
+            # 小表上 PostgreSQL 会优先顺序扫描，关闭后才能看出是否有可用的索引
+            with transaction.atomic(using=queryset.db), connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                return queryset.explain()
+        return queryset.explain()
+
+    def handle(self, *args, **options):
+        connection = connections['default']
+        if connection.vendor not in SCAN_PATTERNS:
+            raise CommandError(f"不支持的数据库: {connection.vendor}")
+        scan_pattern = SCAN_PATTERNS[connection.vendor]
+        sort_pattern = SORT_PATTERNS[connection.vendor]
+        partial_indexes = self.get_partial_indexes(connection)
+
+        failures = []
+        for name, queryset in get_canonical_queries():
+            plan = self.explain(queryset)
+            scanned = self.find_full_scans(queryset, plan, scan_pattern, partial_indexes)
+            if scanned:
+                failures.append(name)
+                self.stdout.write(self.style.ERROR(f"[全表扫描] {name}: {', '.join(scanned)}"))
+            elif sort_pattern.search(plan):
+                self.stdout.write(self.style.WARNING(f"[额外排序] {name}"))
+            else:
+                self.stdout.write(f"[OK] {name}")
+            if options['verbose_plans'] or scanned:
+                self.stdout.write(plan)
+
+        if failures:
+            raise CommandError(f"{len(failures)} 条查询存在全表扫描")
+        self.stdout.write(self.style.SUCCESS("所有查询均使用索引"))
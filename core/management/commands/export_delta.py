@@ -0,0 +1,62 @@
+import json
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+
+from core.delta import DEFAULT_LIMIT, InvalidCursor, fetch_delta
+from core.jobs import JOB_TARGETS
+
+
+class Command(BaseCommand):
+    help = '增量导出设备数据：输出游标之后变化和删除的记录(每行一个 JSON 事件)，并保存新的游标'
+
+    def add_arguments(self, parser):
+        parser.add_argument('target', choices=sorted(JOB_TARGETS), help='数据表')
+        parser.add_argument('--cursor', help='上次导出返回的游标，不指定时从头导出')
+        parser.add_argument(
+            '--cursor-file',
+            help='游标文件：存在时从中读取游标，导出完成后写回新的游标',
+        )
+        parser.add_argument('--output', help='输出文件，默认输出到标准输出')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_LIMIT, help='每批读取的事件数')
+
+    def handle(self, *args, **options):
+        target = JOB_TARGETS[options['target']]
+        cursor = options['cursor']
+        cursor_file = options['cursor_file']
+        if cursor is None and cursor_file and os.path.exists(cursor_file):
+            with open(cursor_file, encoding='utf-8') as f:
+                cursor = f.read().strip() or None
+
+        output = open(options['output'], 'w', encoding='utf-8') if options['output'] else self.stdout
+        upserts = deletes = 0
+        try:
+            while True:
+                try:
+                    delta = fetch_delta(target['model'], target['resource_class'](), cursor, options['batch_size'])
+                except InvalidCursor as e:
+                    raise CommandError(str(e))
+                for event in delta['events']:
+                    output.write(json.dumps(event, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n')
+                    if event['op'] == 'upsert':
+                        upserts += 1
+                    else:
+                        deletes += 1
+                cursor = delta['cursor']
+                if not delta['has_more']:
+                    break
+        finally:
+            if options['output']:
+                output.close()
+
+        # 全部输出成功后才保存游标，中途失败时下次从原位置重新导出
+        if cursor_file:
+            temp_path = f'{cursor_file}.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(cursor)
+            os.replace(temp_path, cursor_file)
+        else:
+            self.stderr.write(f"新游标: {cursor}")
+        self.stderr.write(f"{target['label']}: 变化 {upserts} 条, 删除 {deletes} 条")
@@ -0,0 +1,77 @@
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core.models import UserActivityLog, UserAgent
+
+# 外键列按 8 字节整数计算
+FOREIGN_KEY_BYTES = 8
+
+
+def text_bytes(value):
+    return len(value.encode('utf-8')) if value else 0
+
+
+def get_table_bytes(model):
+    """SQLite 下用 dbstat 统计表及其索引占用的字节数，不可用时返回 None"""
+    connection = connections[model.objects.db]
+    if connection.vendor != 'sqlite':
+        return None
+    table = model._meta.db_table
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT SUM(pgsize) FROM dbstat WHERE name = %s OR name IN '
+                '(SELECT name FROM sqlite_master WHERE type = \'index\' AND tbl_name = %s)',
+                [table, table],
+            )
+            return cursor.fetchone()[0] or 0
+    except Exception:
+        return None
+
+
+class Command(BaseCommand):
+    help = '统计操作日志每行的存储字节数：用户代理和描述按原来的整行保存与去重/生成方式的对比'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sample', type=int, default=10000, help='统计最近多少条日志')
+
+    def handle(self, *args, **options):
+        rows = list(
+            UserActivityLog.objects.order_by('-id').values_list(
+                'action_type', 'content_type', 'object_id', 'description', 'user_agent_id', 'user_agent__value',
+            )[:options['sample']]
+        )
+        if not rows:
+            self.stdout.write('没有操作日志')
+            return
+
+        agents = {}
+        inline_agent = inline_description = stored_agent = stored_description = 0
+        for action_type, content_type, object_id, description, agent_id, agent in rows:
+            inline_agent += text_bytes(agent)
+            inline_description += text_bytes(description or UserActivityLog.describe(action_type, content_type, object_id))
+            stored_agent += FOREIGN_KEY_BYTES if agent_id else 0
+            stored_description += text_bytes(description)
+            if agent_id:
+                agents[agent_id] = text_bytes(agent)
+        # 样本引用的 UserAgent 行分摊到每条日志
+        agent_table = sum(agents.values()) + len(agents) * (64 + FOREIGN_KEY_BYTES)
+
+        count = len(rows)
+        before = (inline_agent + inline_description) / count
+        after = (stored_agent + stored_description + agent_table) / count
+        self.stdout.write(f"样本: 最近 {count} 条日志，引用 {len(agents)} 种用户代理")
+        self.stdout.write(f"用户代理: 整行保存 {inline_agent / count:.1f} 字节/行，去重后 {(stored_agent + agent_table) / count:.1f} 字节/行")
+        self.stdout.write(f"操作描述: 整行保存 {inline_description / count:.1f} 字节/行，生成后 {stored_description / count:.1f} 字节/行")
+        self.stdout.write(self.style.SUCCESS(
+            f"两列合计: {before:.1f} -> {after:.1f} 字节/行 (减少 {(1 - after / before) * 100 if before else 0:.0f}%)"
+        ))
+
+        table_bytes = get_table_bytes(UserActivityLog)
+        if table_bytes is not None:
+            total = UserActivityLog.objects.count()
+            agent_bytes = get_table_bytes(UserAgent) or 0
+            self.stdout.write(
+                f"SQLite 实际占用(含索引): 日志表 {table_bytes / max(total, 1):.1f} 字节/行 ({total} 行)，"
+                f"用户代理表 {agent_bytes} 字节"
+            )
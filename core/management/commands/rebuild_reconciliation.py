@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core.reconciliation import rebuild
+
+
+class Command(BaseCommand):
+    help = '按到货和安装记录重建设备对账表，用于数据回填或对账结果与数据不一致时'
+
+    def handle(self, *args, **options):
+        count = rebuild()
+        self.stdout.write(self.style.SUCCESS(f"设备对账表已重建: {count} 个条码"))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from core.search import SEARCH_FIELDS, rebuild, uses_fts
+
+
+class Command(BaseCommand):
+    help = '重建多字段模糊搜索索引(SQLite FTS5)，用于初次部署或索引与数据不一致时'
+
+    def handle(self, *args, **options):
+        for model in SEARCH_FIELDS:
+            if not uses_fts(model):
+                self.stdout.write(f"{model._meta.verbose_name}: 当前数据库不使用 FTS 索引，跳过")
+                continue
+            count = rebuild(model)
+            self.stdout.write(self.style.SUCCESS(f"{model._meta.verbose_name}: 已索引 {count} 条记录"))
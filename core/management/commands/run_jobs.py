@@ -0,0 +1,52 @@
+import multiprocessing
+import signal
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core.jobs import requeue_orphaned_jobs, worker_loop
+
+
+def run_worker(poll_interval, stop_event):
+    """子进程入口：忽略 Ctrl+C，由父进程通过 stop_event 通知在当前任务结束后退出"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    worker_loop(poll_interval, stop_event)
+
+
+class Command(BaseCommand):
+    help = '启动本地工作进程池，执行排队中的后台导入导出任务'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help='工作进程数量')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='没有任务时的轮询间隔(秒)')
+
+    def handle(self, *args, **options):
+        # 上次异常退出时仍处于执行中的任务重新排队，其他仍在运行的进程池的任务不受影响
+        requeued = requeue_orphaned_jobs()
+        if requeued:
+            self.stdout.write(f"重新排队 {requeued} 个未完成的任务")
+
+        # 子进程不能复用父进程的数据库连接
+        connections.close_all()
+        stop_event = multiprocessing.Event()
+        processes = [
+            multiprocessing.Process(target=run_worker, args=(options['poll_interval'], stop_event), daemon=True)
+            for _ in range(options['workers'])
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write(self.style.SUCCESS(f"已启动 {len(processes)} 个工作进程，按 Ctrl+C 停止"))
+
+        def stop(signum, frame):
+            stop_event.set()
+
+        signal.signal(signal.SIGTERM, stop)
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            stop_event.set()
+            for process in processes:
+                process.join()
+        self.stdout.write("工作进程已停止")
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from core import rollups
+
+
+class Command(BaseCommand):
+    help = '汇总到货和安装记录的小时/每日数量，供设备状态看板统计任意时间范围；建议每小时执行一次'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='清空汇总表并全部重新汇总')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            days = rollups.rebuild()
+        else:
+            days = rollups.update()
+        self.stdout.write(self.style.SUCCESS(f"汇总完成: 重新汇总 {days} 天"))
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:52
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_useractivitylog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BackgroundJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('job_type', models.CharField(choices=[('IMPORT_STAGE', '导入校验'), ('IMPORT_APPLY', '导入写入'), ('EXPORT', '导出')], max_length=20, verbose_name='任务类型')),
+                ('target', models.CharField(max_length=50, verbose_name='数据表')),
+                ('status', models.CharField(choices=[('PENDING', '排队中'), ('RUNNING', '执行中'), ('SUCCESS', '已完成'), ('FAILED', '失败')], default='PENDING', max_length=20, verbose_name='状态')),
+                ('params', models.JSONField(blank=True, default=dict, verbose_name='任务参数')),
+                ('input_file', models.CharField(blank=True, max_length=255, verbose_name='输入文件')),
+                ('result_file', models.CharField(blank=True, max_length=255, verbose_name='结果文件')),
+                ('result', models.JSONField(blank=True, default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='执行结果')),
+                ('error', models.TextField(blank=True, verbose_name='错误信息')),
+                ('total_rows', models.PositiveIntegerField(blank=True, null=True, verbose_name='总行数')),
+                ('processed_rows', models.PositiveIntegerField(default=0, verbose_name='已处理行数')),
+                ('worker_pid', models.IntegerField(blank=True, null=True, verbose_name='工作进程')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='开始时间')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='结束时间')),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='background_jobs', to=settings.AUTH_USER_MODEL, verbose_name='创建人')),
+            ],
+            options={
+                'verbose_name': '后台任务',
+                'verbose_name_plural': '后台任务',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='core_backgr_status_e66a68_idx')],
+            },
+        ),
+    ]
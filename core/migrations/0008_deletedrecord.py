@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_tableversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletedRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table', models.CharField(max_length=100, verbose_name='数据表')),
+                ('object_id', models.BigIntegerField(verbose_name='记录ID')),
+                ('key', models.CharField(blank=True, max_length=100, verbose_name='业务标识')),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='删除时间')),
+            ],
+            options={
+                'verbose_name': '删除记录',
+                'verbose_name_plural': '删除记录',
+                'indexes': [models.Index(fields=['table', 'deleted_at', 'id'], name='core_delete_table_d92dc3_idx')],
+            },
+        ),
+    ]
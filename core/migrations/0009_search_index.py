@@ -0,0 +1,86 @@
+# 多字段模糊搜索索引：SQLite 使用 FTS5 trigram 虚拟表，PostgreSQL 使用 pg_trgm GIN 索引
+
+from django.db import migrations
+
+# 表名 -> [(索引列名, 取值 SQL 表达式)]
+SQLITE_SEARCH_TABLES = {
+    'core_devicearrival': [
+        ('project_name', 't.project_name'),
+        ('device_model', 't.device_model'),
+        ('barcode', 't.barcode'),
+    ],
+    'core_devicedelivery': [
+        ('device_model', 't.device_model'),
+        ('barcode', 't.barcode'),
+        ('recipient_unit', 't.recipient_unit'),
+        ('recipient', 't.recipient'),
+    ],
+    'core_devicesecuritystatus': [
+        ('network_element_name', 't.network_element_name'),
+        ('asset_serial_number', 't.asset_serial_number'),
+    ],
+    'core_useractivitylog': [
+        ('description', 't.description'),
+        ('user_username', '(SELECT username FROM core_user u WHERE u.id = t.user_id)'),
+        ('ip_address', 't.ip_address'),
+    ],
+}
+
+# PostgreSQL 上需要三元组索引的 (表名, 列名)
+POSTGRES_TRGM_COLUMNS = [
+    ('core_devicearrival', 'project_name'),
+    ('core_devicearrival', 'device_model'),
+    ('core_devicearrival', 'barcode'),
+    ('core_devicedelivery', 'device_model'),
+    ('core_devicedelivery', 'barcode'),
+    ('core_devicedelivery', 'recipient_unit'),
+    ('core_devicedelivery', 'recipient'),
+    ('core_devicesecuritystatus', 'network_element_name'),
+    ('core_devicesecuritystatus', 'asset_serial_number'),
+    ('core_useractivitylog', 'description'),
+    ('core_useractivitylog', 'ip_address'),
+    ('core_user', 'username'),
+]
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for table, columns in SQLITE_SEARCH_TABLES.items():
+            column_list = ', '.join(f'"{column}"' for column, expression in columns)
+            schema_editor.execute(
+                f'CREATE VIRTUAL TABLE "{table}_search" USING fts5({column_list}, tokenize=\'trigram\')'
+            )
+            # 为已有数据建立索引
+            values = ', '.join(f"COALESCE({expression}, '')" for column, expression in columns)
+            schema_editor.execute(
+                f'INSERT INTO "{table}_search" (rowid, {column_list}) SELECT t.id, {values} FROM "{table}" t'
+            )
+    elif vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for table, column in POSTGRES_TRGM_COLUMNS:
+            # Django 的 icontains 在 PostgreSQL 上生成 UPPER(col::text) LIKE UPPER(%s)
+            schema_editor.execute(
+                f'CREATE INDEX "{table}_{column}_trgm" ON "{table}" USING gin ((UPPER("{column}"::text)) gin_trgm_ops)'
+            )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for table in SQLITE_SEARCH_TABLES:
+            schema_editor.execute(f'DROP TABLE IF EXISTS "{table}_search"')
+    elif vendor == 'postgresql':
+        for table, column in POSTGRES_TRGM_COLUMNS:
+            schema_editor.execute(f'DROP INDEX IF EXISTS "{table}_{column}_trgm"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_deletedrecord'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
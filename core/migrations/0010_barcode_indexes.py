@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_search_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='devicedelivery',
+            name='barcode',
+            field=models.CharField(db_index=True, max_length=100, verbose_name='条码'),
+        ),
+        migrations.AlterField(
+            model_name='devicesecuritystatus',
+            name='asset_serial_number',
+            field=models.CharField(db_index=True, max_length=100, verbose_name='资产序列号'),
+        ),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_barcode_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='useractivitylog',
+            name='core_userac_user_id_7f1b6d_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='useractivitylog',
+            name='core_userac_action__f27195_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='useractivitylog',
+            name='core_userac_content_361e83_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='useractivitylog',
+            name='core_userac_timesta_384b3d_idx',
+        ),
+        migrations.AddIndex(
+            model_name='devicearrival',
+            index=models.Index(fields=['created_at', 'id'], name='core_device_created_a036bc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='devicearrival',
+            index=models.Index(fields=['updated_at', 'id'], name='core_device_updated_e673cc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='devicedelivery',
+            index=models.Index(fields=['created_at', 'id'], name='core_device_created_23daf3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='devicedelivery',
+            index=models.Index(fields=['updated_at', 'id'], name='core_device_updated_fca577_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='devicesecuritystatus',
+            index=models.Index(fields=['last_check_time', 'id'], name='core_device_last_ch_c51576_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='devicesecuritystatus',
+            index=models.Index(condition=models.Q(('is_online', True)), fields=['last_check_time', 'id'], name='security_online_check_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='devicesecuritystatus',
+            index=models.Index(condition=models.Q(('is_online', False)), fields=['last_check_time', 'id'], name='security_offline_check_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='devicesecuritystatus',
+            index=models.Index(fields=['created_at', 'is_online'], name='core_device_created_b0f7a8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='devicesecuritystatus',
+            index=models.Index(fields=['updated_at', 'id'], name='core_device_updated_d16da8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='useractivitylog',
+            index=models.Index(fields=['user', 'timestamp', 'id'], name='core_userac_user_id_96ed82_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='useractivitylog',
+            index=models.Index(fields=['action_type', 'timestamp', 'id'], name='core_userac_action__ae6e12_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='useractivitylog',
+            index=models.Index(fields=['content_type', 'timestamp', 'id'], name='core_userac_content_1f1525_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='useractivitylog',
+            index=models.Index(fields=['timestamp', 'id'], name='core_userac_timesta_9c2f3c_idx'),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BATCH_SIZE = 2000
+
+
+def backfill(apps, schema_editor):
+    """按已有的到货和安装记录生成对账表，之后由信号和导入增量维护"""
+    DeviceArrival = apps.get_model('core', 'DeviceArrival')
+    DeviceSecurityStatus = apps.get_model('core', 'DeviceSecurityStatus')
+    DeviceReconciliation = apps.get_model('core', 'DeviceReconciliation')
+    arrivals = dict(DeviceArrival.objects.exclude(barcode='').values_list('barcode', 'id'))
+    installations = {}
+    for serial, pk in (
+        DeviceSecurityStatus.objects.exclude(asset_serial_number='')
+        .order_by('asset_serial_number', '-last_check_time', '-id')
+        .values_list('asset_serial_number', 'id')
+    ):
+        installations.setdefault(serial, pk)
+    rows = []
+    for barcode in sorted(set(arrivals) | set(installations)):
+        arrival_id = arrivals.get(barcode)
+        installation_id = installations.get(barcode)
+        if arrival_id and installation_id:
+            state = 'online'
+        elif arrival_id:
+            state = 'offline'
+        else:
+            state = 'other'
+        rows.append(DeviceReconciliation(
+            barcode=barcode, state=state, arrival_id=arrival_id, installation_id=installation_id,
+        ))
+    DeviceReconciliation.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeviceReconciliation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('barcode', models.CharField(max_length=100, unique=True, verbose_name='条码')),
+                ('state', models.CharField(choices=[('online', '在线设备'), ('offline', '脱网设备'), ('other', '其他设备')], max_length=10, verbose_name='分类')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('arrival', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.devicearrival', verbose_name='到货记录')),
+                ('installation', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.devicesecuritystatus', verbose_name='安装记录')),
+            ],
+            options={
+                'verbose_name': '设备对账',
+                'verbose_name_plural': '设备对账',
+                'indexes': [models.Index(fields=['state', 'barcode'], name='core_device_state_be091c_idx')],
+            },
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_devicereconciliation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyDeviceRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_start', models.DateTimeField(unique=True, verbose_name='起始时间')),
+                ('arrivals', models.PositiveIntegerField(default=0, verbose_name='到货数')),
+                ('installations', models.PositiveIntegerField(default=0, verbose_name='安装数')),
+                ('online_installations', models.PositiveIntegerField(default=0, verbose_name='在线安装数')),
+                ('offline_installations', models.PositiveIntegerField(default=0, verbose_name='离线安装数')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+            ],
+            options={
+                'verbose_name': '设备每日汇总',
+                'verbose_name_plural': '设备每日汇总',
+            },
+        ),
+        migrations.CreateModel(
+            name='HourlyDeviceRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_start', models.DateTimeField(unique=True, verbose_name='起始时间')),
+                ('arrivals', models.PositiveIntegerField(default=0, verbose_name='到货数')),
+                ('installations', models.PositiveIntegerField(default=0, verbose_name='安装数')),
+                ('online_installations', models.PositiveIntegerField(default=0, verbose_name='在线安装数')),
+                ('offline_installations', models.PositiveIntegerField(default=0, verbose_name='离线安装数')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('is_dirty', models.BooleanField(default=False, verbose_name='待重新汇总')),
+            ],
+            options={
+                'verbose_name': '设备小时汇总',
+                'verbose_name_plural': '设备小时汇总',
+            },
+        ),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:29
+
+import django.utils.timezone
+from django.db import migrations, models
+
+BATCH_SIZE = 2000
+
+
+def backfill(apps, schema_editor):
+    """已有的安装记录各补一条新增记录(变化时间取创建时间)，并清空汇总表，下次 update_rollups 时全部重新汇总"""
+    DeviceSecurityStatus = apps.get_model('core', 'DeviceSecurityStatus')
+    DeviceStatusChange = apps.get_model('core', 'DeviceStatusChange')
+    changes = []
+    for installation in DeviceSecurityStatus.objects.order_by('id').iterator(chunk_size=BATCH_SIZE):
+        changes.append(DeviceStatusChange(
+            installation_id=installation.id,
+            asset_serial_number=installation.asset_serial_number or '',
+            network_element_name=installation.network_element_name or '',
+            was_online=None,
+            is_online=installation.is_online,
+            changed_at=installation.created_at,
+        ))
+        if len(changes) >= BATCH_SIZE:
+            DeviceStatusChange.objects.bulk_create(changes)
+            changes = []
+    DeviceStatusChange.objects.bulk_create(changes)
+    apps.get_model('core', 'HourlyDeviceRollup').objects.all().delete()
+    apps.get_model('core', 'DailyDeviceRollup').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_device_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailydevicerollup',
+            name='offline_delta',
+            field=models.IntegerField(default=0, verbose_name='离线数变化'),
+        ),
+        migrations.AddField(
+            model_name='dailydevicerollup',
+            name='online_delta',
+            field=models.IntegerField(default=0, verbose_name='在线数变化'),
+        ),
+        migrations.AddField(
+            model_name='dailydevicerollup',
+            name='status_changes',
+            field=models.PositiveIntegerField(default=0, verbose_name='状态变化次数'),
+        ),
+        migrations.AddField(
+            model_name='hourlydevicerollup',
+            name='offline_delta',
+            field=models.IntegerField(default=0, verbose_name='离线数变化'),
+        ),
+        migrations.AddField(
+            model_name='hourlydevicerollup',
+            name='online_delta',
+            field=models.IntegerField(default=0, verbose_name='在线数变化'),
+        ),
+        migrations.AddField(
+            model_name='hourlydevicerollup',
+            name='status_changes',
+            field=models.PositiveIntegerField(default=0, verbose_name='状态变化次数'),
+        ),
+        migrations.CreateModel(
+            name='DeviceStatusChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('installation_id', models.BigIntegerField(verbose_name='安装记录ID')),
+                ('asset_serial_number', models.CharField(max_length=100, verbose_name='资产序列号')),
+                ('network_element_name', models.CharField(max_length=100, verbose_name='网元名称')),
+                ('was_online', models.BooleanField(blank=True, null=True, verbose_name='变化前是否在线')),
+                ('is_online', models.BooleanField(blank=True, null=True, verbose_name='变化后是否在线')),
+                ('changed_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='变化时间')),
+            ],
+            options={
+                'verbose_name': '设备状态变化',
+                'verbose_name_plural': '设备状态变化',
+                'indexes': [models.Index(fields=['asset_serial_number', 'changed_at', 'id'], name='core_device_asset_s_6617e4_idx'), models.Index(fields=['network_element_name', 'changed_at', 'id'], name='core_device_network_b197f4_idx'), models.Index(fields=['changed_at', 'id'], name='core_device_changed_009003_idx')],
+            },
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,183 @@
+# 操作日志的用户代理改为引用去重的 UserAgent 表，能由操作类型、内容类型和对象ID生成的描述不再保存
+
+import hashlib
+from collections import defaultdict
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BATCH_SIZE = 2000
+
+ACTION_DESCRIPTIONS = {
+    'CREATE': '创建了',
+    'UPDATE': '更新了',
+    'DELETE': '删除了',
+    'VIEW': '查看了',
+    'IMPORT': '导入了',
+    'EXPORT': '导出了',
+    'OTHER': '操作了',
+}
+CONTENT_DESCRIPTIONS = {
+    'DEVICE_ARRIVAL': '设备到货记录',
+    'DEVICE_DELIVERY': '设备出货记录',
+    'DEVICE_SECURITY': '设备安装状态',
+    'USER': '用户信息',
+    'SYSTEM': '系统',
+}
+SESSION_DESCRIPTIONS = {
+    'LOGIN': '用户登录',
+    'LOGOUT': '用户登出',
+}
+
+SEARCH_TABLE = 'core_useractivitylog_search'
+USERNAME_EXPRESSION = '(SELECT username FROM core_user u WHERE u.id = t.user_id)'
+
+# 搜索索引增加对象ID列，通用描述不再保存后仍可按对象ID搜索
+SEARCH_COLUMNS = [
+    ('description', 't.description'),
+    ('object_id', 't.object_id'),
+    ('user_username', USERNAME_EXPRESSION),
+    ('ip_address', 't.ip_address'),
+]
+PREVIOUS_SEARCH_COLUMNS = [
+    ('description', 't.description'),
+    ('user_username', USERNAME_EXPRESSION),
+    ('ip_address', 't.ip_address'),
+]
+
+
+def describe(action_type, content_type, object_id):
+    """与 UserActivityLog.describe() 相同"""
+    if action_type in SESSION_DESCRIPTIONS:
+        return SESSION_DESCRIPTIONS[action_type]
+    description = f"{ACTION_DESCRIPTIONS.get(action_type, '操作了')}{CONTENT_DESCRIPTIONS.get(content_type, '未知内容')}"
+    return f"{description} ID:{object_id}" if object_id else description
+
+
+def iter_batches(queryset, *fields):
+    last_id = 0
+    while True:
+        rows = list(queryset.filter(id__gt=last_id).order_by('id').values_list('id', *fields)[:BATCH_SIZE])
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def backfill(apps, schema_editor):
+    """用户代理去重后写入 UserAgent 表，与生成结果相同的描述置空；每批按取值分组更新"""
+    UserActivityLog = apps.get_model('core', 'UserActivityLog')
+    UserAgent = apps.get_model('core', 'UserAgent')
+    agents = {}
+    fields = ('user_agent', 'action_type', 'content_type', 'object_id', 'description')
+    for rows in iter_batches(UserActivityLog.objects.all(), *fields):
+        new = {row[1]: hashlib.sha256(row[1].encode('utf-8')).hexdigest() for row in rows if row[1] and row[1] not in agents}
+        if new:
+            UserAgent.objects.bulk_create(
+                [UserAgent(digest=digest, value=value) for value, digest in new.items()], ignore_conflicts=True,
+            )
+            values = {digest: value for value, digest in new.items()}
+            for digest, pk in UserAgent.objects.filter(digest__in=list(values)).values_list('digest', 'id'):
+                agents[values[digest]] = pk
+
+        by_agent = defaultdict(list)
+        derived = []
+        for pk, user_agent, action_type, content_type, object_id, description in rows:
+            if user_agent:
+                by_agent[agents[user_agent]].append(pk)
+            if description == describe(action_type, content_type, object_id):
+                derived.append(pk)
+        for agent_id, ids in by_agent.items():
+            UserActivityLog.objects.filter(id__in=ids).update(user_agent_ref_id=agent_id)
+        if derived:
+            UserActivityLog.objects.filter(id__in=derived).update(description='')
+
+
+def restore(apps, schema_editor):
+    """回滚时把用户代理和描述写回日志表"""
+    UserActivityLog = apps.get_model('core', 'UserActivityLog')
+    fields = ('user_agent_ref__value', 'action_type', 'content_type', 'object_id', 'description')
+    for rows in iter_batches(UserActivityLog.objects.all(), *fields):
+        by_agent = defaultdict(list)
+        by_description = defaultdict(list)
+        for pk, user_agent, action_type, content_type, object_id, description in rows:
+            if user_agent:
+                by_agent[user_agent].append(pk)
+            if not description:
+                by_description[describe(action_type, content_type, object_id)].append(pk)
+        for user_agent, ids in by_agent.items():
+            UserActivityLog.objects.filter(id__in=ids).update(user_agent=user_agent)
+        for description, ids in by_description.items():
+            UserActivityLog.objects.filter(id__in=ids).update(description=description)
+
+
+def create_search_table(schema_editor, columns):
+    schema_editor.execute(f'DROP TABLE IF EXISTS "{SEARCH_TABLE}"')
+    column_list = ', '.join(f'"{column}"' for column, expression in columns)
+    schema_editor.execute(f'CREATE VIRTUAL TABLE "{SEARCH_TABLE}" USING fts5({column_list}, tokenize=\'trigram\')')
+    values = ', '.join(f"COALESCE({expression}, '')" for column, expression in columns)
+    schema_editor.execute(
+        f'INSERT INTO "{SEARCH_TABLE}" (rowid, {column_list}) SELECT t.id, {values} FROM "core_useractivitylog" t'
+    )
+
+
+def rebuild_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        create_search_table(schema_editor, SEARCH_COLUMNS)
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX "core_useractivitylog_object_id_trgm" ON "core_useractivitylog" '
+            'USING gin ((UPPER("object_id"::text)) gin_trgm_ops)'
+        )
+
+
+def restore_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        create_search_table(schema_editor, PREVIOUS_SEARCH_COLUMNS)
+    elif vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS "core_useractivitylog_object_id_trgm"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_activity_log_timestamp'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserAgent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64, unique=True, verbose_name='摘要')),
+                ('value', models.TextField(verbose_name='用户代理')),
+            ],
+            options={
+                'verbose_name': '用户代理',
+                'verbose_name_plural': '用户代理',
+            },
+        ),
+        migrations.AddField(
+            model_name='useractivitylog',
+            name='user_agent_ref',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='core.useragent', verbose_name='用户代理'),
+        ),
+        migrations.AlterField(
+            model_name='useractivitylog',
+            name='description',
+            field=models.TextField(blank=True, default='', verbose_name='操作描述'),
+        ),
+        migrations.RunPython(backfill, restore),
+        migrations.RemoveField(
+            model_name='useractivitylog',
+            name='user_agent',
+        ),
+        migrations.RenameField(
+            model_name='useractivitylog',
+            old_name='user_agent_ref',
+            new_name='user_agent',
+        ),
+        migrations.RunPython(rebuild_search_index, restore_search_index),
+    ]
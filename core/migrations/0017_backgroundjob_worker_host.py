@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_user_agent_and_derived_descriptions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='backgroundjob',
+            name='worker_host',
+            field=models.CharField(blank=True, max_length=255, verbose_name='工作主机'),
+        ),
+    ]
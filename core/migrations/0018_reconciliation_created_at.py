@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:18
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill(apps, schema_editor):
+    """按已有的到货和安装记录填写创建时间，之后由对账表增量维护"""
+    DeviceArrival = apps.get_model('core', 'DeviceArrival')
+    DeviceSecurityStatus = apps.get_model('core', 'DeviceSecurityStatus')
+    DeviceReconciliation = apps.get_model('core', 'DeviceReconciliation')
+    DeviceReconciliation.objects.update(
+        arrival_created_at=Subquery(
+            DeviceArrival.objects.filter(pk=OuterRef('arrival_id')).values('created_at')
+        ),
+        installation_created_at=Subquery(
+            DeviceSecurityStatus.objects.filter(asset_serial_number=OuterRef('barcode'))
+            .order_by('-created_at').values('created_at')[:1]
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_backgroundjob_worker_host'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='devicereconciliation',
+            name='arrival_created_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='到货记录创建时间'),
+        ),
+        migrations.AddField(
+            model_name='devicereconciliation',
+            name='installation_created_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='最近创建的安装记录时间'),
+        ),
+        migrations.AddIndex(
+            model_name='devicereconciliation',
+            index=models.Index(fields=['arrival_created_at'], name='core_device_arrival_0981aa_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='devicereconciliation',
+            index=models.Index(fields=['installation_created_at'], name='core_device_install_1554a7_idx'),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
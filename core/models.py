@@ -1,5 +1,7 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 class User(AbstractUser):
@@ -31,6 +33,12 @@ class DeviceArrival(models.Model):
         verbose_name = '设备到货清单'
         verbose_name_plural = verbose_name
         ordering = ['-arrival_date']
+        indexes = [
+            # 列表页和看板按创建时间排序、筛选
+            models.Index(fields=['created_at', 'id']),
+            # 增量导出按更新时间翻页
+            models.Index(fields=['updated_at', 'id']),
+        ]
 
     def __str__(self):
         return f"{self.project_name} - {self.device_model} - {self.barcode}"
@@ -38,7 +46,7 @@ class DeviceArrival(models.Model):
 class DeviceDelivery(models.Model):
     """设备出货清单"""
     delivery_date = models.DateField(verbose_name='领用日期')
-    barcode = models.CharField(max_length=100, verbose_name='条码')
+    barcode = models.CharField(max_length=100, db_index=True, verbose_name='条码')
     device_model = models.CharField(max_length=100, verbose_name='设备型号')
     recipient_unit = models.CharField(max_length=100, verbose_name='领用单位')
     recipient = models.CharField(max_length=50, verbose_name='领用人')
@@ -50,6 +58,10 @@ class DeviceDelivery(models.Model):
         verbose_name = '设备出货清单'
         verbose_name_plural = verbose_name
         ordering = ['-delivery_date']
+        indexes = [
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['updated_at', 'id']),
+        ]
 
     def __str__(self):
         return f"{self.device_model} - {self.barcode} - {self.recipient}"
@@ -58,7 +70,7 @@ class DeviceSecurityStatus(models.Model):
     """设备安装状态"""
     network_element_name = models.CharField(max_length=100, verbose_name='网元名称')
     is_online = models.BooleanField(default=True, verbose_name='是否在线')
-    asset_serial_number = models.CharField(max_length=100, verbose_name='资产序列号')
+    asset_serial_number = models.CharField(max_length=100, db_index=True, verbose_name='资产序列号')
     check_date = models.DateField(verbose_name='检查日期', auto_now=False, auto_now_add=False, null=True, blank=True)
     last_check_time = models.DateTimeField(auto_now=True, verbose_name='最后检查时间')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
@@ -69,10 +81,33 @@ class DeviceSecurityStatus(models.Model):
         verbose_name = '设备安装状态'
         verbose_name_plural = verbose_name
         ordering = ['-last_check_time']
+        indexes = [
+            # 列表页按最后检查时间排序，可按在线状态筛选
+            models.Index(fields=['last_check_time', 'id']),
+            # 布尔筛选在 SQL 中是 WHERE "is_online"(不是等值比较)，用部分索引按在线状态分开
+            models.Index(fields=['last_check_time', 'id'], condition=models.Q(is_online=True), name='security_online_check_idx'),
+            models.Index(fields=['last_check_time', 'id'], condition=models.Q(is_online=False), name='security_offline_check_idx'),
+            # 看板按创建时间统计在线/离线数量
+            models.Index(fields=['created_at', 'is_online']),
+            models.Index(fields=['updated_at', 'id']),
+        ]
 
     def __str__(self):
         return f"{self.network_element_name} - {'在线' if self.is_online else '离线'}"
 
+class UserAgent(models.Model):
+    """操作日志引用的用户代理，相同的字符串只保存一次"""
+    # 按内容的 SHA-256 查找，不在长文本上建唯一索引
+    digest = models.CharField(max_length=64, unique=True, verbose_name='摘要')
+    value = models.TextField(verbose_name='用户代理')
+    
+    class Meta:
+        verbose_name = '用户代理'
+        verbose_name_plural = verbose_name
+    
+    def __str__(self):
+        return self.value
+
 class UserActivityLog(models.Model):
     """用户操作日志"""
     ACTION_TYPES = (
@@ -95,25 +130,270 @@ class UserActivityLog(models.Model):
         ('SYSTEM', '系统'),
     )
     
+    # 生成操作描述用的动词和对象
+    ACTION_DESCRIPTIONS = {
+        'CREATE': '创建了',
+        'UPDATE': '更新了',
+        'DELETE': '删除了',
+        'VIEW': '查看了',
+        'IMPORT': '导入了',
+        'EXPORT': '导出了',
+        'OTHER': '操作了',
+    }
+    CONTENT_DESCRIPTIONS = {
+        'DEVICE_ARRIVAL': '设备到货记录',
+        'DEVICE_DELIVERY': '设备出货记录',
+        'DEVICE_SECURITY': '设备安装状态',
+        'USER': '用户信息',
+        'SYSTEM': '系统',
+    }
+    SESSION_DESCRIPTIONS = {
+        'LOGIN': '用户登录',
+        'LOGOUT': '用户登出',
+    }
+    
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='activity_logs', verbose_name='用户')
     action_type = models.CharField(max_length=20, choices=ACTION_TYPES, verbose_name='操作类型')
     content_type = models.CharField(max_length=20, choices=CONTENT_TYPES, verbose_name='内容类型')
     object_id = models.CharField(max_length=50, blank=True, null=True, verbose_name='对象ID')
-    description = models.TextField(verbose_name='操作描述')
+    # 只保存无法由操作类型、内容类型和对象ID生成的描述，显示时用 get_description()
+    description = models.TextField(blank=True, default='', verbose_name='操作描述')
     ip_address = models.GenericIPAddressField(blank=True, null=True, verbose_name='IP地址')
-    user_agent = models.TextField(blank=True, null=True, verbose_name='用户代理')
-    timestamp = models.DateTimeField(auto_now_add=True, verbose_name='时间戳')
+    user_agent = models.ForeignKey(
+        UserAgent, on_delete=models.PROTECT, blank=True, null=True, related_name='+', verbose_name='用户代理',
+    )
+    # 日志异步批量写入，时间戳在记录时确定而不是写入时
+    timestamp = models.DateTimeField(default=timezone.now, verbose_name='时间戳')
     
     class Meta:
         verbose_name = '用户操作日志'
         verbose_name_plural = verbose_name
         ordering = ['-timestamp']
         indexes = [
-            models.Index(fields=['user']),
-            models.Index(fields=['action_type']),
-            models.Index(fields=['content_type']),
-            models.Index(fields=['timestamp']),
+            # 各筛选条件都与时间倒序分页组合使用
+            models.Index(fields=['user', 'timestamp', 'id']),
+            models.Index(fields=['action_type', 'timestamp', 'id']),
+            models.Index(fields=['content_type', 'timestamp', 'id']),
+            models.Index(fields=['timestamp', 'id']),
         ]
     
+    @classmethod
+    def describe(cls, action_type, content_type, object_id=None):
+        """由操作类型、内容类型和对象ID生成的描述"""
+        if action_type in cls.SESSION_DESCRIPTIONS:
+            return cls.SESSION_DESCRIPTIONS[action_type]
+        description = f"{cls.ACTION_DESCRIPTIONS.get(action_type, '操作了')}{cls.CONTENT_DESCRIPTIONS.get(content_type, '未知内容')}"
+        return f"{description} ID:{object_id}" if object_id else description
+    
+    @classmethod
+    def description_filter(cls, query):
+        """描述留空(由其他字段生成)且生成的描述包含 query 的条件；没有可能匹配的描述时返回空条件
+        
+        生成的描述只有有限几种前缀，把关键词换算为操作类型、内容类型和对象ID的条件。
+        """
+        query = query.lower()
+        condition = models.Q()
+        for action_type, text in cls.SESSION_DESCRIPTIONS.items():
+            if query in text.lower():
+                condition |= models.Q(action_type=action_type)
+        for action_type, action_text in cls.ACTION_DESCRIPTIONS.items():
+            for content_type, content_text in cls.CONTENT_DESCRIPTIONS.items():
+                combination = models.Q(action_type=action_type, content_type=content_type)
+                text = f'{action_text}{content_text}'.lower()
+                marker = f'{text} id:'
+                if query in text:
+                    condition |= combination
+                elif query in marker:
+                    condition |= combination & models.Q(object_id__gt='')
+                else:
+                    # 关键词从描述的末尾延伸到对象ID
+                    for end in range(1, len(query)):
+                        if marker.endswith(query[:end]):
+                            condition |= combination & models.Q(object_id__istartswith=query[end:])
+        return condition & models.Q(description='') if condition else condition
+    
+    def get_description(self):
+        return self.description or self.describe(self.action_type, self.content_type, self.object_id)
+    get_description.short_description = '操作描述'
+    
     def __str__(self):
         return f"{self.user.username} - {self.get_action_type_display()} - {self.timestamp}"
+
+class BackgroundJob(models.Model):
+    """后台导入导出任务"""
+    JOB_TYPES = (
+        ('IMPORT_STAGE', '导入校验'),
+        ('IMPORT_APPLY', '导入写入'),
+        ('EXPORT', '导出'),
+    )
+    
+    STATUSES = (
+        ('PENDING', '排队中'),
+        ('RUNNING', '执行中'),
+        ('SUCCESS', '已完成'),
+        ('FAILED', '失败'),
+    )
+    
+    job_type = models.CharField(max_length=20, choices=JOB_TYPES, verbose_name='任务类型')
+    target = models.CharField(max_length=50, verbose_name='数据表')
+    status = models.CharField(max_length=20, choices=STATUSES, default='PENDING', verbose_name='状态')
+    params = models.JSONField(default=dict, blank=True, verbose_name='任务参数')
+    input_file = models.CharField(max_length=255, blank=True, verbose_name='输入文件')
+    result_file = models.CharField(max_length=255, blank=True, verbose_name='结果文件')
+    result = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder, verbose_name='执行结果')
+    error = models.TextField(blank=True, verbose_name='错误信息')
+    total_rows = models.PositiveIntegerField(null=True, blank=True, verbose_name='总行数')
+    processed_rows = models.PositiveIntegerField(default=0, verbose_name='已处理行数')
+    worker_pid = models.IntegerField(null=True, blank=True, verbose_name='工作进程')
+    worker_host = models.CharField(max_length=255, blank=True, verbose_name='工作主机')
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='background_jobs', verbose_name='创建人')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name='开始时间')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='结束时间')
+    
+    class Meta:
+        verbose_name = '后台任务'
+        verbose_name_plural = verbose_name
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_job_type_display()} - {self.target} - {self.get_status_display()}"
+    
+    @property
+    def is_finished(self):
+        return self.status in ('SUCCESS', 'FAILED')
+
+class TableVersion(models.Model):
+    """数据表版本号
+
+    每次写入设备数据表都会递增对应的版本号，导出缓存等按版本号判断数据是否变化。
+    """
+    table = models.CharField(max_length=100, unique=True, verbose_name='数据表')
+    version = models.PositiveBigIntegerField(default=0, verbose_name='版本号')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+    
+    class Meta:
+        verbose_name = '数据表版本'
+        verbose_name_plural = verbose_name
+    
+    def __str__(self):
+        return f"{self.table} v{self.version}"
+
+class DeletedRecord(models.Model):
+    """设备数据删除记录(墓碑)，供增量导出通知下游删除"""
+    table = models.CharField(max_length=100, verbose_name='数据表')
+    object_id = models.BigIntegerField(verbose_name='记录ID')
+    key = models.CharField(max_length=100, blank=True, verbose_name='业务标识')
+    deleted_at = models.DateTimeField(default=timezone.now, verbose_name='删除时间')
+    
+    class Meta:
+        verbose_name = '删除记录'
+        verbose_name_plural = verbose_name
+        indexes = [
+            models.Index(fields=['table', 'deleted_at', 'id']),
+        ]
+    
+    def __str__(self):
+        return f"{self.table} #{self.object_id} {self.key}"
+
+class DeviceReconciliation(models.Model):
+    """到货与安装记录的对账结果，按条码保存设备当前所属的看板分类
+
+    由 reconciliation 模块在设备数据写入时增量维护。同时保存到货记录和最近一条安装记录的
+    创建时间，看板只统计最近创建的记录时也可以直接读取对账表。
+    """
+    STATES = (
+        ('online', '在线设备'),
+        ('offline', '脱网设备'),
+        ('other', '其他设备'),
+    )
+    
+    barcode = models.CharField(max_length=100, unique=True, verbose_name='条码')
+    state = models.CharField(max_length=10, choices=STATES, verbose_name='分类')
+    arrival = models.ForeignKey(
+        DeviceArrival, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', verbose_name='到货记录',
+    )
+    installation = models.ForeignKey(
+        DeviceSecurityStatus, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', verbose_name='安装记录',
+    )
+    # 看板只统计最近创建的记录时按这两个时间分类
+    arrival_created_at = models.DateTimeField(null=True, blank=True, verbose_name='到货记录创建时间')
+    installation_created_at = models.DateTimeField(null=True, blank=True, verbose_name='最近创建的安装记录时间')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+    
+    class Meta:
+        verbose_name = '设备对账'
+        verbose_name_plural = verbose_name
+        indexes = [
+            # 看板按分类计数并按条码分页
+            models.Index(fields=['state', 'barcode']),
+            # 看板按时间范围统计
+            models.Index(fields=['arrival_created_at']),
+            models.Index(fields=['installation_created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.barcode} - {self.get_state_display()}"
+
+class DeviceStatusChange(models.Model):
+    """设备在线状态变化记录，只追加不修改
+
+    新增安装记录时 was_online 为空，删除时 is_online 为空，其余只在在线状态变化时记录。
+    """
+    installation_id = models.BigIntegerField(verbose_name='安装记录ID')
+    asset_serial_number = models.CharField(max_length=100, verbose_name='资产序列号')
+    network_element_name = models.CharField(max_length=100, verbose_name='网元名称')
+    was_online = models.BooleanField(null=True, blank=True, verbose_name='变化前是否在线')
+    is_online = models.BooleanField(null=True, blank=True, verbose_name='变化后是否在线')
+    changed_at = models.DateTimeField(default=timezone.now, verbose_name='变化时间')
+    
+    class Meta:
+        verbose_name = '设备状态变化'
+        verbose_name_plural = verbose_name
+        indexes = [
+            # 按序列号、网元或时间范围查询，按时间顺序翻页
+            models.Index(fields=['asset_serial_number', 'changed_at', 'id']),
+            models.Index(fields=['network_element_name', 'changed_at', 'id']),
+            models.Index(fields=['changed_at', 'id']),
+        ]
+    
+    def __str__(self):
+        return f"{self.network_element_name} {self.was_online} -> {self.is_online}"
+
+class DeviceRollup(models.Model):
+    """按时间段汇总的到货、安装数量和在线状态变化，由 update_rollups 命令定期维护"""
+    period_start = models.DateTimeField(unique=True, verbose_name='起始时间')
+    arrivals = models.PositiveIntegerField(default=0, verbose_name='到货数')
+    installations = models.PositiveIntegerField(default=0, verbose_name='安装数')
+    online_installations = models.PositiveIntegerField(default=0, verbose_name='在线安装数')
+    offline_installations = models.PositiveIntegerField(default=0, verbose_name='离线安装数')
+    # 时间段内的在线状态变化，累加得到任意时刻的在线/离线设备数
+    status_changes = models.PositiveIntegerField(default=0, verbose_name='状态变化次数')
+    online_delta = models.IntegerField(default=0, verbose_name='在线数变化')
+    offline_delta = models.IntegerField(default=0, verbose_name='离线数变化')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+    
+    class Meta:
+        abstract = True
+    
+    def __str__(self):
+        return f"{timezone.localtime(self.period_start):%Y-%m-%d %H:%M} 到货{self.arrivals} 安装{self.installations}"
+
+class HourlyDeviceRollup(DeviceRollup):
+    """设备数据小时汇总"""
+    # 汇总后有记录被删除时由信号标记，下次汇总时重新计算
+    is_dirty = models.BooleanField(default=False, verbose_name='待重新汇总')
+    
+    class Meta:
+        verbose_name = '设备小时汇总'
+        verbose_name_plural = verbose_name
+
+class DailyDeviceRollup(DeviceRollup):
+    """设备数据每日汇总，只包含已完整汇总的日期"""
+    
+    class Meta:
+        verbose_name = '设备每日汇总'
+        verbose_name_plural = verbose_name
@@ -0,0 +1,303 @@
+"""列表分页
+
+键集分页按 (排序时间, id) 定位，用游标代替页码：每页只查询当前页及前后几页的行，
+不执行 OFFSET，第 5000 页与第 1 页的开销相同。总数单独缓存(按表版本号失效)或估算，
+不再每页执行 COUNT(*)。页码链接只生成当前页附近的窗口。
+
+settings.LIST_PAGINATION 为 'offset' 时退回页码分页，同样使用缓存的总数和窗口页码。
+"""
+import base64
+import hashlib
+import json
+import math
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from .caching import get_or_compute
+
+# 当前页前后各显示的页码数
+PAGE_WINDOW = 2
+
+# 总数缓存时间(秒)，未跟踪版本号的表依赖该时间过期
+DEFAULT_COUNT_CACHE_TIMEOUT = 60
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def get_count_cache_timeout():
+    return int(getattr(settings, 'LIST_COUNT_CACHE_TIMEOUT', DEFAULT_COUNT_CACHE_TIMEOUT))
+
+
+def estimate_table_rows(model):
+    """无筛选条件时用数据库统计信息估算行数，不支持的数据库返回 None"""
+    connection = connections[model.objects.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT reltuples FROM pg_class WHERE oid = %s::regclass", [model._meta.db_table])
+        row = cursor.fetchone()
+    # 从未 ANALYZE 的表 reltuples 为 -1
+    if row is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class CachedCount:
+    """查询集总数：优先用估算值，否则缓存精确值
+
+    缓存键包含查询语句和表版本号，数据写入后自动失效。
+    """
+
+    def __init__(self, queryset, version=None, allow_estimate=True):
+        self.queryset = queryset
+        self.version = version
+        self.allow_estimate = allow_estimate
+        self.is_estimate = False
+
+    def get_cache_key(self):
+        query = self.queryset.order_by().query
+        digest = hashlib.sha256(str(query).encode('utf-8')).hexdigest()[:32]
+        return f'list-count:{self.queryset.model._meta.label}:{self.version}:{digest}'
+
+    def get(self):
+        if self.allow_estimate and not self.queryset.query.where:
+            estimate = estimate_table_rows(self.queryset.model)
+            if estimate is not None:
+                self.is_estimate = True
+                return estimate
+        try:
+            key = self.get_cache_key()
+        except Exception:
+            # 部分查询无法转换为 SQL 文本，直接计数
+            return self.queryset.count()
+        return get_or_compute('list-count', key, self.queryset.count, get_count_cache_timeout())
+
+
+class CachedCountPaginator(Paginator):
+    """页码分页，总数使用 CachedCount"""
+
+    def __init__(self, *args, counter=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.counter = counter
+
+    @cached_property
+    def count(self):
+        if self.counter is None:
+            return super().count
+        return self.counter.get()
+
+    @property
+    def count_is_estimate(self):
+        return self.counter is not None and self.counter.is_estimate
+
+
+def encode_cursor(direction, key, number):
+    data = json.dumps({'d': direction, 'k': key, 'n': number}, separators=(',', ':'), default=str)
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def keyset_filter(ordering, values, reverse=False):
+    """按排序字段构造"位于 values 之后"的条件；reverse 时为"位于之前\"
+
+    OR 条件外再加上第一个字段的闭区间，数据库才能沿索引定位起点而不是从头扫描。
+    """
+    condition = Q()
+    equal = {}
+    bound = None
+    for field, value in zip(ordering, values):
+        descending = field.startswith('-')
+        name = field.lstrip('-')
+        if reverse:
+            descending = not descending
+        if bound is None:
+            bound = Q(**{f'{name}__{"lte" if descending else "gte"}': value})
+        condition |= Q(**equal, **{f'{name}__{"lt" if descending else "gt"}': value})
+        equal[name] = value
+    return bound & condition if bound is not None else condition
+
+
+def reverse_ordering(ordering):
+    return tuple(field[1:] if field.startswith('-') else f'-{field}' for field in ordering)
+
+
+class KeysetPaginator:
+    """键集分页器
+
+    ordering 为排序字段(最后一个字段必须唯一，通常是 id)。游标记录方向、
+    边界行的排序键和页码；页码只用于显示，随插入删除可能有偏差。
+    """
+
+    def __init__(self, queryset, per_page, ordering, counter=None, window=PAGE_WINDOW):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        self.counter = counter
+        self.window = window
+
+    @cached_property
+    def count(self):
+        if self.counter is None:
+            return None
+        return self.counter.get()
+
+    @property
+    def count_is_estimate(self):
+        return self.counter is not None and self.counter.is_estimate
+
+    @property
+    def num_pages(self):
+        if self.count is None:
+            return None
+        return max(1, math.ceil(self.count / self.per_page))
+
+    def get_key(self, obj):
+        return [getattr(obj, field.lstrip('-')) for field in self.ordering]
+
+    def decode_cursor(self, cursor):
+        try:
+            data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            state = json.loads(data)
+            direction = state['d']
+            if direction not in ('after', 'before', 'last'):
+                raise ValueError(direction)
+            key = None
+            if direction != 'last':
+                model = self.queryset.model
+                key = [
+                    model._meta.get_field(field.lstrip('-')).to_python(value)
+                    for field, value in zip(self.ordering, state['k'])
+                ]
+                if len(key) != len(self.ordering):
+                    raise ValueError(state['k'])
+            return direction, key, max(1, int(state['n']))
+        except Exception as e:
+            raise InvalidCursor(f"无效的分页游标: {cursor}") from e
+
+    def fetch(self, ordering, key=None, reverse=False, limit=None):
+        queryset = self.queryset.order_by(*ordering)
+        if key is not None:
+            queryset = queryset.filter(keyset_filter(self.ordering, key, reverse=reverse))
+        return list(queryset[:limit])
+
+    def page(self, cursor=None):
+        """返回游标对应的一页；cursor 为空时返回第一页"""
+        size = self.per_page
+        ahead_limit = size * (self.window + 1) + 1
+        behind_limit = size * self.window + 1
+        backward = reverse_ordering(self.ordering)
+
+        if not cursor:
+            direction, key, number = 'after', None, 1
+        else:
+            direction, key, number = self.decode_cursor(cursor)
+
+        if direction == 'after':
+            rows = self.fetch(self.ordering, key, limit=ahead_limit)
+            current, ahead = rows[:size], rows[size:]
+            if key and not current:
+                # 游标之后的记录已被删除，显示最后一页
+                return self.page(encode_cursor('last', None, number))
+            behind = self.fetch(backward, self.get_key(current[0]), reverse=True, limit=behind_limit) if key and current else []
+        else:
+            page_size = size
+            if direction == 'last':
+                number = self.num_pages or number
+                if self.count and not self.count_is_estimate:
+                    # 总数准确时末页只取余下的行，分界与从第一页向后翻一致
+                    page_size = self.count - (number - 1) * size
+                rows = self.fetch(backward, limit=page_size + size * self.window + 1)
+            else:
+                rows = self.fetch(backward, key, reverse=True, limit=ahead_limit)
+            current, behind = list(reversed(rows[:page_size])), rows[page_size:]
+            if len(current) < page_size or not behind:
+                # 已经回到开头，按第一页重新取，保证第一页的分界一致
+                return self.page()
+            ahead = self.fetch(self.ordering, self.get_key(current[-1]), limit=size * self.window + 1)
+
+        # 往前已经到开头时按实际行数校正页码
+        if not behind:
+            number = 1
+        elif len(behind) < behind_limit:
+            number = math.ceil(len(behind) / size) + 1
+        return KeysetPage(self, current, ahead, behind, number)
+
+
+class KeysetPage:
+    """键集分页的一页，提供与 Django Page 相近的接口供模板使用"""
+
+    def __init__(self, paginator, object_list, ahead, behind, number):
+        self.paginator = paginator
+        self.object_list = object_list
+        self.number = number
+        self.ahead = ahead
+        self.behind = behind
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return bool(self.ahead)
+
+    def has_previous(self):
+        return bool(self.behind)
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def start_index(self):
+        if not self.object_list:
+            return 0
+        return (self.number - 1) * self.paginator.per_page + 1
+
+    def end_index(self):
+        return self.start_index() + len(self.object_list) - 1 if self.object_list else 0
+
+    def get_window(self):
+        """返回当前页附近的 [(页码, 游标)]，游标为 None 表示第一页"""
+        paginator = self.paginator
+        size = paginator.per_page
+        window = []
+        # 前面的页：behind 按倒序排列，第 k 页之前的游标是其后一页的第一行
+        boundary = self.object_list[0] if self.object_list else None
+        for k in range(1, paginator.window + 1):
+            if len(self.behind) <= (k - 1) * size:
+                break
+            if len(self.behind) <= k * size and len(self.behind) < size * paginator.window + 1:
+                window.append((self.number - k, None))
+                break
+            window.append((self.number - k, encode_cursor('before', paginator.get_key(boundary), self.number - k)))
+            boundary = self.behind[k * size - 1]
+        window.reverse()
+        window.append((self.number, ''))
+        # 后面的页：第 k 页从上一页最后一行之后开始
+        boundary = self.object_list[-1] if self.object_list else None
+        for k in range(1, paginator.window + 1):
+            if len(self.ahead) <= (k - 1) * size:
+                break
+            window.append((self.number + k, encode_cursor('after', paginator.get_key(boundary), self.number + k)))
+            boundary = self.ahead[min(k * size, len(self.ahead)) - 1]
+        return window
+
+    def next_cursor(self):
+        if not self.has_next():
+            return None
+        return encode_cursor('after', self.paginator.get_key(self.object_list[-1]), self.number + 1)
+
+    def previous_cursor(self):
+        if not self.has_previous():
+            return None
+        if len(self.behind) <= self.paginator.per_page:
+            return ''
+        return encode_cursor('before', self.paginator.get_key(self.object_list[0]), self.number - 1)
+
+    def last_cursor(self):
+        return encode_cursor('last', None, self.paginator.num_pages or self.number + 1)
@@ -0,0 +1,154 @@
+"""到货与安装对账
+
+设备状态看板把条码分为三类：既有到货记录又有安装记录的为在线设备，只有到货记录的为
+脱网设备，只有安装记录的为其他设备。DeviceReconciliation 按条码保存分类结果，设备数据
+写入时只重新计算涉及的条码，看板只需按分类计数和分页；对账行同时保存到货记录和最近
+一条安装记录的创建时间，只统计最近创建的记录时按时间重新分类。重新计算的条码同时发布
+给实时看板(见 live 模块)。
+`python manage.py rebuild_reconciliation` 可全量重建。
+"""
+import threading
+from contextlib import contextmanager
+from functools import partial
+
+from django.db import transaction
+
+from . import live
+from .dashboard import INSTALLATION_ORDERING
+from .models import DeviceArrival, DeviceReconciliation, DeviceSecurityStatus
+
+# 对账的数据表及其条码字段
+SOURCES = {
+    DeviceArrival: 'barcode',
+    DeviceSecurityStatus: 'asset_serial_number',
+}
+
+# 对账行引用各数据表记录的字段
+REFERENCE_FIELDS = {
+    DeviceArrival: 'arrival',
+    DeviceSecurityStatus: 'installation',
+}
+
+# 每批重新计算的条码数
+REFRESH_BATCH_SIZE = 500
+
+_state = threading.local()
+
+
+def classify(has_arrival, has_installation):
+    if has_arrival and has_installation:
+        return 'online'
+    if has_arrival:
+        return 'offline'
+    return 'other'
+
+
+def refresh(barcodes):
+    """重新计算指定条码的分类；到货和安装记录都不存在的条码删除对账行"""
+    barcodes = sorted({barcode for barcode in barcodes if barcode})
+    for start in range(0, len(barcodes), REFRESH_BATCH_SIZE):
+        batch = barcodes[start:start + REFRESH_BATCH_SIZE]
+        arrivals = {
+            barcode: (pk, created_at)
+            for barcode, pk, created_at in DeviceArrival.objects.filter(barcode__in=batch).values_list('barcode', 'id', 'created_at')
+        }
+        installations = {}
+        installation_times = {}
+        for serial, pk, created_at in (
+            DeviceSecurityStatus.objects.filter(asset_serial_number__in=batch)
+            .order_by(*INSTALLATION_ORDERING)
+            .values_list('asset_serial_number', 'id', 'created_at')
+        ):
+            installations.setdefault(serial, pk)
+            # 按时间范围统计时只要有一条安装记录在范围内即可，记录最近的创建时间
+            installation_times[serial] = max(created_at, installation_times.get(serial, created_at))
+
+        rows = []
+        missing = []
+        for barcode in batch:
+            arrival_id, arrival_created_at = arrivals.get(barcode, (None, None))
+            installation_id = installations.get(barcode)
+            if arrival_id is None and installation_id is None:
+                missing.append(barcode)
+                continue
+            rows.append(DeviceReconciliation(
+                barcode=barcode,
+                state=classify(arrival_id is not None, installation_id is not None),
+                arrival_id=arrival_id,
+                installation_id=installation_id,
+                arrival_created_at=arrival_created_at,
+                installation_created_at=installation_times.get(barcode),
+            ))
+        if missing:
+            DeviceReconciliation.objects.filter(barcode__in=missing).delete()
+        if rows:
+            DeviceReconciliation.objects.bulk_create(
+                rows, update_conflicts=True, unique_fields=['barcode'],
+                update_fields=['state', 'arrival', 'installation', 'arrival_created_at', 'installation_created_at', 'updated_at'],
+            )
+        # 提交后推送给实时看板
+        transaction.on_commit(partial(live.publish, batch))
+
+
+def get_referencing_barcodes(model, pks):
+    """对账表中仍引用这些记录的条码；记录的条码被修改后，这些是需要重新计算的旧条码"""
+    field = REFERENCE_FIELDS[model]
+    pks = list(pks)
+    barcodes = set()
+    for start in range(0, len(pks), REFRESH_BATCH_SIZE):
+        barcodes.update(
+            DeviceReconciliation.objects.filter(**{f'{field}__in': pks[start:start + REFRESH_BATCH_SIZE]})
+            .values_list('barcode', flat=True)
+        )
+    return barcodes
+
+
+def schedule(model, instance, created=False):
+    """记录写入或删除后重新计算涉及的条码；在 deferred_refresh() 中时延迟到结束时统一执行"""
+    barcode = getattr(instance, SOURCES[model])
+    pending = getattr(_state, 'pending', None)
+    if pending is None:
+        barcodes = {barcode}
+        if not created:
+            barcodes.update(get_referencing_barcodes(model, [instance.pk]))
+        refresh(barcodes)
+        return
+    pending['barcodes'].add(barcode)
+    if not created:
+        pending['references'].setdefault(model, set()).add(instance.pk)
+
+
+@contextmanager
+def deferred_refresh():
+    """期间逐行保存的记录在结束时(包括出错时)分批重新计算"""
+    if getattr(_state, 'pending', None) is not None:
+        # 已在外层延迟
+        yield
+        return
+    _state.pending = {'barcodes': set(), 'references': {}}
+    try:
+        yield
+    finally:
+        pending, _state.pending = _state.pending, None
+        barcodes = pending['barcodes']
+        for model, pks in pending['references'].items():
+            barcodes.update(get_referencing_barcodes(model, pks))
+        refresh(barcodes)
+
+
+def rebuild():
+    """清空并按到货和安装记录重建对账表，返回对账行数"""
+    with transaction.atomic():
+        DeviceReconciliation.objects.all().delete()
+        for model, field in SOURCES.items():
+            last_id = 0
+            while True:
+                rows = list(
+                    model.objects.filter(id__gt=last_id).order_by('id')
+                    .values_list('id', field)[:REFRESH_BATCH_SIZE * 4]
+                )
+                if not rows:
+                    break
+                refresh(barcode for pk, barcode in rows)
+                last_id = rows[-1][0]
+        return DeviceReconciliation.objects.count()
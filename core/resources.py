@@ -1,10 +1,109 @@
 from import_export import resources, fields
+from import_export.results import RowResult
 from import_export.widgets import ForeignKeyWidget, DateWidget
 from datetime import datetime, date
+from functools import partial
+from django.db import transaction
 from django.utils import timezone
 from .models import DeviceArrival, DeviceDelivery, DeviceSecurityStatus, User
+from .reconciliation import deferred_refresh
+from .search import deferred_index
+from .versioning import bump_version, suppress_bumps
 
-class DeviceArrivalResource(resources.ModelResource):
+
+class HeaderAliasMixin:
+    """表头别名映射
+
+    每个文件只根据表头解析一次列名别名，生成编译好的行转换函数；
+    逐行处理时只做固定的列投影和默认值填充，不再遍历别名列表。
+    """
+    # (规范列名, 可能的列名, 是否取第一个有值的列)
+    # 第三项为 False 时按表头中第一个出现的列名映射，为 True 时逐行取第一个非空的候选列
+    column_aliases = ()
+    
+    _row_transformer = None
+    
+    def get_import_defaults(self):
+        """每次导入只计算一次的默认值"""
+        return {
+            'today': date.today().strftime('%Y-%m-%d'),
+            'timestamp': int(datetime.now().timestamp()),
+        }
+    
+    def resolve_headers(self, headers):
+        """根据表头解析别名，返回 (直接映射列表, 取首个非空值的映射列表)"""
+        header_set = set(headers)
+        projections = []
+        fallbacks = []
+        for canonical, aliases, first_non_empty in self.column_aliases:
+            present = tuple(alias for alias in aliases if alias in header_set)
+            if not present:
+                continue
+            if first_non_empty:
+                fallbacks.append((canonical, present))
+            elif present[0] != canonical:
+                projections.append((canonical, present[0]))
+        return projections, fallbacks
+    
+    def fill_defaults(self, row, defaults, row_number):
+        """为缺失的必要字段填充默认值，由子类实现"""
+    
+    def compile_row_transformer(self, headers):
+        """生成针对该表头的行转换函数"""
+        projections, fallbacks = self.resolve_headers(headers)
+        defaults = self.get_import_defaults()
+        fill_defaults = self.fill_defaults
+        
+        def transform(row, row_number=0):
+            for canonical, column in projections:
+                row[canonical] = row[column]
+            for canonical, columns in fallbacks:
+                for column in columns:
+                    value = row[column]
+                    if value:
+                        row[canonical] = value
+                        break
+            fill_defaults(row, defaults, row_number)
+        
+        return transform
+    
+    def get_row_transformer(self, headers):
+        """返回本次导入编译好的行转换函数"""
+        if self._row_transformer is None:
+            self._row_transformer = self.compile_row_transformer(headers)
+        return self._row_transformer
+    
+    def before_import(self, dataset, **kwargs):
+        """导入开始前根据表头编译行转换函数"""
+        super().before_import(dataset, **kwargs)
+        headers = list(dataset.headers)
+        self._row_transformer = self.compile_row_transformer(headers)
+        # 补齐缺少的规范列，表头只有别名时也能通过标识字段检查
+        for canonical, aliases, first_non_empty in self.column_aliases:
+            if canonical not in headers:
+                dataset.append_col([None] * len(dataset), header=canonical)
+    
+    def import_data(self, *args, **kwargs):
+        """逐行保存期间暂停表版本号递增、搜索索引和对账表更新，导入结束后统一执行"""
+        with suppress_bumps(self._meta.model), deferred_index(self._meta.model), deferred_refresh():
+            return super().import_data(*args, **kwargs)
+    
+    def after_import(self, dataset, result, **kwargs):
+        """有写入时在导入事务提交后递增一次表版本号，试运行和回滚的导入不递增"""
+        super().after_import(dataset, result, **kwargs)
+        changed = sum(result.totals[import_type] for import_type in (
+            RowResult.IMPORT_TYPE_NEW, RowResult.IMPORT_TYPE_UPDATE, RowResult.IMPORT_TYPE_DELETE,
+        ))
+        if changed and not kwargs.get('dry_run'):
+            transaction.on_commit(partial(bump_version, self._meta.model))
+    
+    def before_import_row(self, row, **kwargs):
+        """导入前处理行数据"""
+        transform = self.get_row_transformer(list(row.keys()))
+        transform(row, kwargs.get('row_number', 0))
+
+
+class DeviceArrivalResource(HeaderAliasMixin, resources.ModelResource):
     """设备到货清单导入导出资源类"""
     created_by = fields.Field(
         column_name="创建人",
@@ -44,47 +143,21 @@ class DeviceArrivalResource(resources.ModelResource):
         import_id_fields = ['barcode']  # 使用条码作为唯一标识
         skip_unchanged = True
     
-    def before_import_row(self, row, **kwargs):
-        """导入前处理行数据"""
-        # 尝试查找各种可能的列名映射
+    column_aliases = (
         # 项目名称可能的列名
-        project_name_fields = ['项目名称', '项目', '工程名称', '项目名', '工程', '工程名', '站点名称', '站点', '名称']
+        ('项目名称', ['项目名称', '项目', '工程名称', '项目名', '工程', '工程名', '站点名称', '站点', '名称'], False),
         # 到货日期可能的列名
-        date_fields = ['到货日期', '日期', '时间', '到货时间', '安装日期', '入库日期', '入库时间']
+        ('到货日期', ['到货日期', '日期', '时间', '到货时间', '安装日期', '入库日期', '入库时间'], True),
         # 设备型号可能的列名
-        model_fields = ['设备型号', '型号', '规格型号', '设备规格', '规格', '型号规格']
+        ('设备型号', ['设备型号', '型号', '规格型号', '设备规格', '规格', '型号规格'], False),
         # 条码可能的列名
-        barcode_fields = ['条码', '设备条码', '设备编号', '编号', 'ID', 'SN', '序列号', '资产编号']
-        
-        # 查找并映射项目名称
-        for field in project_name_fields:
-            if field in row:
-                row['项目名称'] = row[field]
-                break
-        
-        # 查找并映射到货日期
-        date_found = False
-        for field in date_fields:
-            if field in row and row[field]:
-                row['到货日期'] = row[field]
-                date_found = True
-                break
-        
+        ('条码', ['条码', '设备条码', '设备编号', '编号', 'ID', 'SN', '序列号', '资产编号'], False),
+    )
+    
+    def fill_defaults(self, row, defaults, row_number):
         # 如果没有日期字段,设置为当前日期
-        if not date_found or not row.get('到货日期'):
-            row['到货日期'] = date.today().strftime('%Y-%m-%d')
-        
-        # 查找并映射设备型号
-        for field in model_fields:
-            if field in row:
-                row['设备型号'] = row[field]
-                break
-        
-        # 查找并映射条码
-        for field in barcode_fields:
-            if field in row:
-                row['条码'] = row[field]
-                break
+        if not row.get('到货日期'):
+            row['到货日期'] = defaults['today']
         
         # 检查必要字段是否都有值,如果没有,提供默认值
         if not row.get('项目名称'):
@@ -95,11 +168,10 @@ class DeviceArrivalResource(resources.ModelResource):
         
         if not row.get('条码'):
             # 生成一个基于时间戳的唯一条码
-            timestamp = int(datetime.now().timestamp())
-            row['条码'] = f"AUTO-{timestamp}-{kwargs.get('row_number', 0)}"
+            row['条码'] = f"AUTO-{defaults['timestamp']}-{row_number}"
 
 
-class DeviceDeliveryResource(resources.ModelResource):
+class DeviceDeliveryResource(HeaderAliasMixin, resources.ModelResource):
     """设备出货清单导入导出资源类"""
     created_by = fields.Field(
         column_name="创建人",
@@ -144,56 +216,24 @@ class DeviceDeliveryResource(resources.ModelResource):
         export_order = ('id', 'delivery_date', 'device_model', 'barcode', 'recipient_unit', 'recipient', 'created_by')
         import_id_fields = ['barcode']  # 使用条码作为唯一标识
         skip_unchanged = True
-
-    def before_import_row(self, row, **kwargs):
-        """导入前处理行数据"""
-        # 尝试查找各种可能的列名映射
+    
+    column_aliases = (
         # 出货日期可能的列名
-        date_fields = ['出货日期', '日期', '时间', '出货时间', '交付日期', '交付时间']
+        ('出货日期', ['出货日期', '日期', '时间', '出货时间', '交付日期', '交付时间'], True),
         # 设备型号可能的列名
-        model_fields = ['设备型号', '型号', '规格型号', '设备规格', '规格', '型号规格']
+        ('设备型号', ['设备型号', '型号', '规格型号', '设备规格', '规格', '型号规格'], False),
         # 条码可能的列名
-        barcode_fields = ['条码', '设备条码', '设备编号', '编号', 'ID', 'SN', '序列号', '资产编号']
+        ('条码', ['条码', '设备条码', '设备编号', '编号', 'ID', 'SN', '序列号', '资产编号'], False),
         # 接收单位可能的列名
-        unit_fields = ['接收单位', '单位', '收货单位', '收货方', '目标单位', '客户单位', '客户']
+        ('接收单位', ['接收单位', '单位', '收货单位', '收货方', '目标单位', '客户单位', '客户'], False),
         # 接收人可能的列名
-        recipient_fields = ['接收人', '收货人', '签收人', '负责人', '客户联系人']
-        
-        # 查找并映射出货日期
-        date_found = False
-        for field in date_fields:
-            if field in row and row[field]:
-                row['出货日期'] = row[field]
-                date_found = True
-                break
-        
+        ('接收人', ['接收人', '收货人', '签收人', '负责人', '客户联系人'], False),
+    )
+    
+    def fill_defaults(self, row, defaults, row_number):
         # 如果没有日期字段,设置为当前日期
-        if not date_found or not row.get('出货日期'):
-            row['出货日期'] = date.today().strftime('%Y-%m-%d')
-        
-        # 查找并映射设备型号
-        for field in model_fields:
-            if field in row:
-                row['设备型号'] = row[field]
-                break
-        
-        # 查找并映射条码
-        for field in barcode_fields:
-            if field in row:
-                row['条码'] = row[field]
-                break
-        
-        # 查找并映射接收单位
-        for field in unit_fields:
-            if field in row:
-                row['接收单位'] = row[field]
-                break
-        
-        # 查找并映射接收人
-        for field in recipient_fields:
-            if field in row:
-                row['接收人'] = row[field]
-                break
+        if not row.get('出货日期'):
+            row['出货日期'] = defaults['today']
         
         # 检查必要字段是否都有值,如果没有,提供默认值
         if not row.get('设备型号'):
@@ -201,8 +241,7 @@ class DeviceDeliveryResource(resources.ModelResource):
         
         if not row.get('条码'):
             # 生成一个基于时间戳的唯一条码
-            timestamp = int(datetime.now().timestamp())
-            row['条码'] = f"AUTO-{timestamp}-{kwargs.get('row_number', 0)}"
+            row['条码'] = f"AUTO-{defaults['timestamp']}-{row_number}"
         
         if not row.get('接收单位'):
             row['接收单位'] = '未指定单位'
@@ -211,7 +250,7 @@ class DeviceDeliveryResource(resources.ModelResource):
             row['接收人'] = '未指定接收人'
 
 
-class DeviceSecurityStatusResource(resources.ModelResource):
+class DeviceSecurityStatusResource(HeaderAliasMixin, resources.ModelResource):
     """设备安全状态导入导出资源类"""
     created_by = fields.Field(
         column_name="创建人",
@@ -258,73 +297,39 @@ class DeviceSecurityStatusResource(resources.ModelResource):
         import_id_fields = ['asset_serial_number']  # 使用资产序列号作为唯一标识
         skip_unchanged = True
     
-    def dehydrate_online_status_display(self, device_status):
-        """处理在线状态字段的显示"""
-        return "在线" if device_status.is_online else "离线"
-        
-    def before_import_row(self, row, **kwargs):
-        """导入前处理行数据"""
-        # 尝试查找各种可能的列名映射
+    column_aliases = (
         # 网元名称可能的列名
-        name_fields = ['网元名称', '名称', '设备名称', '网元', '设备']
-        # 在线状态可能的列名
-        status_fields = ['在线状态', '状态', '是否在线', '在线', '运行状态']
+        ('网元名称', ['网元名称', '名称', '设备名称', '网元', '设备'], False),
         # 资产序列号可能的列名
-        serial_fields = ['资产序列号', '序列号', 'SN', 'S/N', '编号', '资产编号']
+        ('资产序列号', ['资产序列号', '序列号', 'SN', 'S/N', '编号', '资产编号'], True),
         # 检查日期可能的列名
-        check_date_fields = ['检查日期', '检查时间', '更新时间', '状态更新时间']
+        ('检查日期', ['检查日期', '检查时间', '更新时间', '状态更新时间'], True),
         # 最后检查时间可能的列名
-        check_time_fields = ['最后检查时间', '检查时间', '更新时间', '状态更新时间']
-        
-        # 查找并映射网元名称
-        for field in name_fields:
-            if field in row:
-                row['网元名称'] = row[field]
-                break
-        
-        # 查找并映射资产序列号
-        serial_found = False
-        serial_value = None
-        for field in serial_fields:
-            if field in row and row[field]:
-                row['资产序列号'] = row[field]
-                serial_value = row[field]
-                serial_found = True
-                break
-        
+        ('最后检查时间', ['最后检查时间', '检查时间', '更新时间', '状态更新时间'], True),
+    )
+    
+    def dehydrate_online_status_display(self, device_status):
+        """处理在线状态字段的显示"""
+        return "在线" if device_status.is_online else "离线"
+    
+    def fill_defaults(self, row, defaults, row_number):
         # 如果资产序列号为空或不存在，标记这行跳过导入
-        if not serial_found or not serial_value or not str(serial_value).strip():
+        serial_value = row.get('资产序列号')
+        if not serial_value or not str(serial_value).strip():
             # 根据django-import-export库的机制，通过将必需字段设置为空以防止这行被导入
             row['资产序列号'] = None
-            # 提前返回，不处理后续逻辑
             return
         
         # 有资产序列号的记录自动设置为在线
         row['在线状态'] = True
         
-        # 查找并映射检查日期
-        check_date_found = False
-        for field in check_date_fields:
-            if field in row and row[field]:
-                row['检查日期'] = row[field]
-                check_date_found = True
-                break
-        
         # 如果没有检查日期字段,设置为当前日期
-        if not check_date_found or not row.get('检查日期'):
-            row['检查日期'] = date.today().strftime('%Y-%m-%d')
-        
-        # 查找并映射最后检查时间
-        check_time_found = False
-        for field in check_time_fields:
-            if field in row and row[field]:
-                row['最后检查时间'] = row[field]
-                check_time_found = True
-                break
+        if not row.get('检查日期'):
+            row['检查日期'] = defaults['today']
         
         # 如果没有检查时间字段,设置为当前日期
-        if not check_time_found or not row.get('最后检查时间'):
-            row['最后检查时间'] = date.today().strftime('%Y-%m-%d')
+        if not row.get('最后检查时间'):
+            row['最后检查时间'] = defaults['today']
         
         # 检查必要字段是否都有值,如果没有,提供默认值
         if not row.get('网元名称'):
@@ -0,0 +1,272 @@
+"""到货、安装数量和在线状态变化的小时/每日汇总
+
+HourlyDeviceRollup 按小时、DailyDeviceRollup 按天保存每个时间段内创建的到货记录数、
+安装记录数及其中在线/离线的数量，以及状态变化记录(DeviceStatusChange)带来的在线数和
+离线数变化量。`python manage.py update_rollups` 定期汇总已结束的小时，并重新计算上次
+汇总后有记录被修改或删除的日期；每日汇总只包含完整汇总过的日期。
+
+get_counts() 统计任意时间范围：完整的日期读每日汇总，首尾不足一天的部分读小时汇总，
+最后一次汇总之后的部分直接统计数据表，查询次数与时间范围的长短无关。
+"""
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import Count, Min, Max, Q, Sum
+from django.db.models.functions import TruncDate, TruncHour
+from django.utils import timezone
+
+from .models import DailyDeviceRollup, DeviceArrival, DeviceSecurityStatus, DeviceStatusChange, HourlyDeviceRollup
+
+COUNT_FIELDS = (
+    'arrivals', 'installations', 'online_installations', 'offline_installations',
+    'status_changes', 'online_delta', 'offline_delta',
+)
+STATUS_FIELDS = ('online_delta', 'offline_delta', 'status_changes')
+
+# 汇总的数据表及其时间字段
+SOURCES = {
+    DeviceArrival: 'created_at',
+    DeviceSecurityStatus: 'created_at',
+    DeviceStatusChange: 'changed_at',
+}
+
+HOUR = timedelta(hours=1)
+DAY = timedelta(days=1)
+
+# 不限开始时间时的起点
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+# 重新汇总上次汇总前这段时间内修改的记录，覆盖汇总时尚未提交的事务
+LOOKBACK = timedelta(hours=1)
+
+
+def start_of_day(day):
+    """当前时区某天的零点；按时间范围筛选可以使用时间字段上的索引，__date 查找不能"""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def floor_hour(value):
+    return timezone.localtime(value).replace(minute=0, second=0, microsecond=0)
+
+
+# 状态变化记录的汇总：新增记录 was_online 为空，删除记录 is_online 为空
+STATUS_AGGREGATES = {
+    'status_changes': Count('id'),
+    'online_delta': Count('id', filter=Q(is_online=True)) - Count('id', filter=Q(was_online=True)),
+    'offline_delta': Count('id', filter=Q(is_online=False)) - Count('id', filter=Q(was_online=False)),
+}
+
+
+def count_records(start, end):
+    """直接统计 [start, end) 内创建的记录"""
+    counts = dict.fromkeys(COUNT_FIELDS, 0)
+    if start >= end:
+        return counts
+    counts['arrivals'] = DeviceArrival.objects.filter(created_at__gte=start, created_at__lt=end).count()
+    installations = DeviceSecurityStatus.objects.filter(created_at__gte=start, created_at__lt=end).aggregate(
+        online=Count('id', filter=Q(is_online=True)),
+        offline=Count('id', filter=Q(is_online=False)),
+    )
+    counts['online_installations'] = installations['online']
+    counts['offline_installations'] = installations['offline']
+    counts['installations'] = installations['online'] + installations['offline']
+    counts.update(DeviceStatusChange.objects.filter(changed_at__gte=start, changed_at__lt=end).aggregate(**STATUS_AGGREGATES))
+    return counts
+
+
+def get_watermark():
+    """小时汇总覆盖到的时间(不含)；从未汇总时返回 None"""
+    last = HourlyDeviceRollup.objects.aggregate(last=Max('period_start'))['last']
+    return last + HOUR if last else None
+
+
+def split_range(start, end, daily=True):
+    """把 [start, end) 分为读每日汇总的日期范围、读小时汇总的若干时间段和最后一次汇总之后的部分
+
+    返回 (日期范围或 None, [小时范围], 直接统计的开始时间)。
+    """
+    watermark = get_watermark() or start
+    rolled_end = max(start, min(floor_hour(end), watermark))
+    if rolled_end <= start:
+        return None, [], rolled_end
+    first_day = start_of_day(timezone.localtime(start).date())
+    if first_day < start:
+        first_day = start_of_day(timezone.localtime(start).date() + DAY)
+    last_day = start_of_day(timezone.localtime(rolled_end).date())
+    if not daily or first_day >= last_day:
+        return None, [(start, rolled_end)], rolled_end
+    return (first_day, last_day), [(start, first_day), (last_day, rolled_end)], rolled_end
+
+
+def hours_filter(hours):
+    condition = Q()
+    for hour_start, hour_end in hours:
+        if hour_start < hour_end:
+            condition |= Q(period_start__gte=hour_start, period_start__lt=hour_end)
+    return condition
+
+
+def get_counts(start, end=None):
+    """[start, end) 内的到货、安装数量和状态变化量，start 按整点对齐，为 None 时从头统计"""
+    end = end or timezone.now()
+    start = floor_hour(start) if start else EPOCH
+    totals = dict.fromkeys(COUNT_FIELDS, 0)
+    if start >= end:
+        return totals
+
+    days, hours, live_start = split_range(start, end)
+    sums = [Sum(field) for field in COUNT_FIELDS]
+    rows = []
+    if days:
+        rows.append(DailyDeviceRollup.objects.filter(period_start__gte=days[0], period_start__lt=days[1]).aggregate(*sums))
+    if hours:
+        rows.append(HourlyDeviceRollup.objects.filter(hours_filter(hours)).aggregate(*sums))
+    for row in rows:
+        for field in COUNT_FIELDS:
+            totals[field] += row[f'{field}__sum'] or 0
+
+    # 最后一次汇总之后的部分
+    live = count_records(live_start, end)
+    for field in COUNT_FIELDS:
+        totals[field] += live[field]
+    return totals
+
+
+def iter_status_deltas(start, end, daily=True):
+    """按时间段返回 [start, end) 内的 (起始时间, 在线数变化, 离线数变化, 状态变化次数)
+
+    daily 为 False 时不读每日汇总，全部按小时返回。
+    """
+    days, hours, live_start = split_range(start, end, daily)
+    if days:
+        yield from DailyDeviceRollup.objects.filter(
+            period_start__gte=days[0], period_start__lt=days[1],
+        ).values_list('period_start', *STATUS_FIELDS)
+    if hours:
+        yield from HourlyDeviceRollup.objects.filter(hours_filter(hours)).values_list('period_start', *STATUS_FIELDS)
+    if live_start < end:
+        yield from (
+            DeviceStatusChange.objects.filter(changed_at__gte=live_start, changed_at__lt=end)
+            .annotate(hour=TruncHour('changed_at')).order_by().values('hour')
+            .annotate(**STATUS_AGGREGATES).values_list('hour', *STATUS_FIELDS)
+        )
+
+
+def summarize(start, end):
+    """重新汇总 [start, end) 内的各小时，以及其中完整的日期"""
+    hours = {}
+    # 按 UTC 逐小时递增，避免夏令时切换时的本地时间歧义
+    period = start.astimezone(dt_timezone.utc)
+    while period < end:
+        hours[period] = HourlyDeviceRollup(period_start=period)
+        period += HOUR
+
+    for row in (
+        DeviceArrival.objects.filter(created_at__gte=start, created_at__lt=end)
+        .annotate(hour=TruncHour('created_at')).order_by().values('hour').annotate(total=Count('id'))
+    ):
+        hours[row['hour']].arrivals = row['total']
+    for row in (
+        DeviceSecurityStatus.objects.filter(created_at__gte=start, created_at__lt=end)
+        .annotate(hour=TruncHour('created_at')).order_by().values('hour')
+        .annotate(online=Count('id', filter=Q(is_online=True)), offline=Count('id', filter=Q(is_online=False)))
+    ):
+        rollup = hours[row['hour']]
+        rollup.online_installations = row['online']
+        rollup.offline_installations = row['offline']
+        rollup.installations = row['online'] + row['offline']
+    for row in (
+        DeviceStatusChange.objects.filter(changed_at__gte=start, changed_at__lt=end)
+        .annotate(hour=TruncHour('changed_at')).order_by().values('hour').annotate(**STATUS_AGGREGATES)
+    ):
+        rollup = hours[row['hour']]
+        for field in STATUS_FIELDS:
+            setattr(rollup, field, row[field])
+
+    days = {}
+    for period, rollup in hours.items():
+        day = start_of_day(timezone.localtime(period).date())
+        if day < start or day + DAY > end:
+            continue
+        daily = days.setdefault(day, DailyDeviceRollup(period_start=day))
+        for field in COUNT_FIELDS:
+            setattr(daily, field, getattr(daily, field) + getattr(rollup, field))
+
+    HourlyDeviceRollup.objects.bulk_create(
+        hours.values(), update_conflicts=True, unique_fields=['period_start'],
+        update_fields=[*COUNT_FIELDS, 'is_dirty', 'updated_at'],
+    )
+    if days:
+        DailyDeviceRollup.objects.bulk_create(
+            days.values(), update_conflicts=True, unique_fields=['period_start'],
+            update_fields=[*COUNT_FIELDS, 'updated_at'],
+        )
+
+
+def get_changed_days(since):
+    """上次汇总后有记录被修改或删除的日期
+
+    状态变化记录只追加，变化时间就是写入时间，由 update() 从上次汇总前 LOOKBACK 开始重新汇总覆盖。
+    """
+    days = {
+        timezone.localtime(period).date()
+        for period in HourlyDeviceRollup.objects.filter(is_dirty=True).values_list('period_start', flat=True)
+    }
+    for model in (DeviceArrival, DeviceSecurityStatus):
+        days.update(
+            model.objects.filter(updated_at__gte=since)
+            .annotate(day=TruncDate('created_at')).order_by().values_list('day', flat=True).distinct()
+        )
+    return days
+
+
+def update(now=None):
+    """汇总到当前整点，返回重新汇总的天数"""
+    end = floor_hour(now or timezone.now())
+    watermark = get_watermark()
+    if watermark is None:
+        first = min(
+            (value for value in (
+                model.objects.aggregate(first=Min(field))['first'] for model, field in SOURCES.items()
+            ) if value),
+            default=None,
+        )
+        if first is None:
+            return 0
+        days = set()
+        day = timezone.localtime(first).date()
+    else:
+        last_run = HourlyDeviceRollup.objects.aggregate(last=Max('updated_at'))['last']
+        days = get_changed_days(last_run - LOOKBACK)
+        day = timezone.localtime(min(watermark - LOOKBACK, end)).date()
+    while start_of_day(day) < end:
+        days.add(day)
+        day += DAY
+
+    # 相邻的日期合并为一次查询
+    ranges = []
+    for day in sorted(days):
+        day_start = start_of_day(day)
+        if day_start >= end:
+            continue
+        if ranges and ranges[-1][1] == day_start:
+            ranges[-1][1] = day_start + DAY
+        else:
+            ranges.append([day_start, day_start + DAY])
+    with transaction.atomic():
+        for start, stop in ranges:
+            summarize(start, min(stop, end))
+    return len(days)
+
+
+def mark_dirty(created_at):
+    """删除记录后标记所在小时，下次汇总时重新计算"""
+    HourlyDeviceRollup.objects.filter(period_start=floor_hour(created_at)).update(is_dirty=True)
+
+
+def rebuild(now=None):
+    """清空并重新汇总全部数据"""
+    with transaction.atomic():
+        HourlyDeviceRollup.objects.all().delete()
+        DailyDeviceRollup.objects.all().delete()
+        return update(now)
@@ -0,0 +1,156 @@
+"""多字段模糊搜索
+
+SQLite 下每张表对应一个 FTS5 trigram 虚拟表(<表名>_search)，rowid 即记录 id，
+任意位置的子串搜索走三元组索引而不再全表扫描；索引通过 post_save/post_delete 信号
+和批量导入同步，`python manage.py rebuild_search_index` 可重建。PostgreSQL 下迁移
+创建 pg_trgm GIN 索引，icontains 直接使用该索引。逐行保存的批量导入用 deferred_index()
+把索引更新合并到结束时分批执行。少于 3 个字符的关键词无法使用
+三元组索引，仍按 icontains 查询。不保存、显示时才生成的内容(如操作日志的通用描述)
+由 DERIVED_SEARCH 中的函数换算为其他字段的条件。
+"""
+import threading
+from contextlib import contextmanager
+
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import DeviceArrival, DeviceDelivery, DeviceSecurityStatus, UserActivityLog
+
+# 参与搜索的字段，关联字段用 __ 表示
+SEARCH_FIELDS = {
+    DeviceArrival: ('project_name', 'device_model', 'barcode'),
+    DeviceDelivery: ('device_model', 'barcode', 'recipient_unit', 'recipient'),
+    DeviceSecurityStatus: ('network_element_name', 'asset_serial_number'),
+    UserActivityLog: ('description', 'object_id', 'user__username', 'ip_address'),
+}
+
+# 显示时才生成的搜索内容：模型 -> 返回匹配条件的函数
+DERIVED_SEARCH = {
+    UserActivityLog: UserActivityLog.description_filter,
+}
+
+# 三元组索引能处理的最短关键词
+MIN_QUERY_LENGTH = 3
+
+# 批量更新索引时每批的记录数
+INDEX_BATCH_SIZE = 500
+
+# 已确认存在索引表的数据库别名和表名
+_available = {}
+
+_state = threading.local()
+
+
+def get_search_table(model):
+    return f'{model._meta.db_table}_search'
+
+
+def get_search_columns(model):
+    return [field.replace('__', '_') for field in SEARCH_FIELDS[model]]
+
+
+def get_connection(model):
+    return connections[model.objects.db]
+
+
+def uses_fts(model):
+    """当前数据库是否为 SQLite 且已创建该表的 FTS 索引"""
+    connection = get_connection(model)
+    if connection.vendor != 'sqlite' or model not in SEARCH_FIELDS:
+        return False
+    key = (connection.alias, get_search_table(model))
+    if key not in _available:
+        with connection.cursor() as cursor:
+            _available[key] = get_search_table(model) in connection.introspection.table_names(cursor)
+    return _available[key]
+
+
+def fts_phrase(query):
+    """把关键词转为 FTS5 短语，trigram 分词下短语即子串匹配"""
+    return '"' + query.replace('"', '""') + '"'
+
+
+def search_filter(model, query):
+    """返回在搜索字段和生成的内容中模糊匹配 query 的条件"""
+    if len(query) >= MIN_QUERY_LENGTH and uses_fts(model):
+        table = get_search_table(model)
+        condition = Q(id__in=RawSQL(f'SELECT rowid FROM "{table}" WHERE "{table}" MATCH %s', [fts_phrase(query)]))
+    else:
+        condition = Q()
+        for field in SEARCH_FIELDS[model]:
+            condition |= Q(**{f'{field}__icontains': query})
+    if model in DERIVED_SEARCH:
+        condition |= DERIVED_SEARCH[model](query)
+    return condition
+
+
+def index_objects(model, ids):
+    """重建指定记录的索引行；已删除的记录只移除索引"""
+    if not ids or not uses_fts(model):
+        return
+    table = get_search_table(model)
+    columns = get_search_columns(model)
+    placeholders = ', '.join(['%s'] * (len(columns) + 1))
+    column_list = ', '.join(f'"{column}"' for column in columns)
+    ids = list(ids)
+    with get_connection(model).cursor() as cursor:
+        for start in range(0, len(ids), INDEX_BATCH_SIZE):
+            batch = ids[start:start + INDEX_BATCH_SIZE]
+            cursor.execute(
+                f'DELETE FROM "{table}" WHERE rowid IN ({", ".join(["%s"] * len(batch))})', batch,
+            )
+            rows = model.objects.filter(id__in=batch).values_list('id', *SEARCH_FIELDS[model])
+            cursor.executemany(
+                f'INSERT INTO "{table}" (rowid, {column_list}) VALUES ({placeholders})',
+                [[value if value is not None else '' for value in row] for row in rows],
+            )
+
+
+def remove_objects(model, ids):
+    if not ids or not uses_fts(model):
+        return
+    table = get_search_table(model)
+    with get_connection(model).cursor() as cursor:
+        cursor.executemany(f'DELETE FROM "{table}" WHERE rowid = %s', [[pk] for pk in ids])
+
+
+def rebuild(model):
+    """清空并重建整张表的索引，返回索引的记录数"""
+    if not uses_fts(model):
+        return 0
+    with get_connection(model).cursor() as cursor:
+        cursor.execute(f'DELETE FROM "{get_search_table(model)}"')
+    count = 0
+    last_id = 0
+    while True:
+        # 按 id 分批，不在读取游标打开期间写入
+        ids = list(model.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:INDEX_BATCH_SIZE * 4])
+        if not ids:
+            return count
+        index_objects(model, ids)
+        count += len(ids)
+        last_id = ids[-1]
+
+
+def is_deferred(model):
+    return model in getattr(_state, 'deferred', {})
+
+
+def defer_objects(model, ids):
+    """延迟期间只记录需要更新索引的记录 id"""
+    _state.deferred[model].update(ids)
+
+
+@contextmanager
+def deferred_index(*models):
+    """期间逐行保存的记录在结束时(包括出错时)统一更新索引"""
+    previous = getattr(_state, 'deferred', {})
+    _state.deferred = {**previous, **{model: set() for model in models if model not in previous}}
+    try:
+        yield
+    finally:
+        deferred, _state.deferred = _state.deferred, previous
+        for model in models:
+            if model not in previous:
+                index_objects(model, sorted(deferred[model]))
@@ -0,0 +1,90 @@
+"""数据表写入信号：版本号、删除记录、搜索索引、条码缓存、对账表、汇总表和状态历史"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+
+from . import barcodes, reconciliation, rollups, status_history
+from .delta import record_deletion
+from .models import DeviceSecurityStatus
+from .search import SEARCH_FIELDS, defer_objects, index_objects, is_deferred, remove_objects
+from .versioning import TRACKED_MODELS, bump_on_commit, is_suppressed
+
+
+def bump_table_version(sender, **kwargs):
+    """写入或删除后递增表版本号"""
+    if not is_suppressed(sender):
+        bump_on_commit(sender)
+
+
+def write_tombstone(sender, instance, **kwargs):
+    """删除后记录墓碑，增量导出据此通知下游"""
+    record_deletion(instance)
+
+
+def invalidate_barcode_cache(sender, **kwargs):
+    """事务提交后清空条码缓存，避免提交前被其他请求重新缓存旧数据"""
+    transaction.on_commit(barcodes.invalidate)
+
+
+def update_reconciliation(sender, instance, created=False, **kwargs):
+    """到货或安装记录写入、删除后重新计算涉及条码的看板分类"""
+    reconciliation.schedule(sender, instance, created=created)
+
+
+def mark_rollup_dirty(sender, instance, **kwargs):
+    """删除到货或安装记录后标记所在小时的汇总待重新计算"""
+    rollups.mark_dirty(instance.created_at)
+
+
+def remember_online_state(sender, instance, **kwargs):
+    status_history.remember_state(instance)
+
+
+def load_online_state(sender, instance, **kwargs):
+    status_history.load_previous_state(instance)
+
+
+def record_status_change(sender, instance, created=False, **kwargs):
+    """安装记录新增或在线状态变化时追加状态历史"""
+    status_history.record_save(instance, created)
+
+
+def record_status_removal(sender, instance, **kwargs):
+    status_history.record_delete(instance)
+
+
+def update_search_index(sender, instance, **kwargs):
+    """写入后更新搜索索引，批量导入期间延迟到导入结束"""
+    if is_deferred(sender):
+        defer_objects(sender, [instance.pk])
+    else:
+        index_objects(sender, [instance.pk])
+
+
+def remove_search_index(sender, instance, **kwargs):
+    if is_deferred(sender):
+        # 延迟更新时记录已不存在，只会移除索引行
+        defer_objects(sender, [instance.pk])
+    else:
+        remove_objects(sender, [instance.pk])
+
+
+for model in TRACKED_MODELS:
+    post_save.connect(bump_table_version, sender=model, dispatch_uid=f'bump_version_save_{model.__name__}')
+    post_delete.connect(bump_table_version, sender=model, dispatch_uid=f'bump_version_delete_{model.__name__}')
+    post_delete.connect(write_tombstone, sender=model, dispatch_uid=f'tombstone_{model.__name__}')
+    post_save.connect(invalidate_barcode_cache, sender=model, dispatch_uid=f'barcode_save_{model.__name__}')
+    post_delete.connect(invalidate_barcode_cache, sender=model, dispatch_uid=f'barcode_delete_{model.__name__}')
+
+for model in reconciliation.SOURCES:
+    post_save.connect(update_reconciliation, sender=model, dispatch_uid=f'reconciliation_save_{model.__name__}')
+    post_delete.connect(update_reconciliation, sender=model, dispatch_uid=f'reconciliation_delete_{model.__name__}')
+    post_delete.connect(mark_rollup_dirty, sender=model, dispatch_uid=f'rollup_delete_{model.__name__}')
+
+for model in SEARCH_FIELDS:
+    post_save.connect(update_search_index, sender=model, dispatch_uid=f'search_save_{model.__name__}')
+    post_delete.connect(remove_search_index, sender=model, dispatch_uid=f'search_delete_{model.__name__}')
+
+post_init.connect(remember_online_state, sender=DeviceSecurityStatus, dispatch_uid='status_history_init')
+pre_save.connect(load_online_state, sender=DeviceSecurityStatus, dispatch_uid='status_history_pre_save')
+post_save.connect(record_status_change, sender=DeviceSecurityStatus, dispatch_uid='status_history_save')
+post_delete.connect(record_status_removal, sender=DeviceSecurityStatus, dispatch_uid='status_history_delete')
@@ -0,0 +1,166 @@
+"""设备在线状态历史
+
+DeviceSecurityStatus 只保存当前的在线状态。安装记录新增、删除或在线状态变化时向
+DeviceStatusChange 追加一条变化记录；逐条保存通过信号记录，批量导入由导入器调用
+record_bulk()。
+
+变化记录按小时/每日汇总为在线数和离线数的变化量(见 rollups 模块)，get_trend() 从
+汇总表累加出各时间点的在线/离线设备数，读取量只与图表的点数有关。
+"""
+import math
+from datetime import timedelta
+
+from django.utils import timezone
+
+from . import rollups
+from .delta import after, decode_cursor, encode_cursor
+from .models import DeviceSecurityStatus, DeviceStatusChange
+
+# 保存加载时的在线状态，保存时据此判断是否变化
+LOADED_ATTR = '_loaded_is_online'
+
+# 范围查询每次返回的默认条数和上限
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 5000
+
+# 趋势图默认和最多的点数
+DEFAULT_POINTS = 200
+MAX_POINTS = 1000
+
+
+def remember_state(instance):
+    """记录实例加载时的在线状态；only()/defer() 未加载该字段时不记录"""
+    setattr(instance, LOADED_ATTR, instance.__dict__.get('is_online'))
+
+
+def load_previous_state(instance):
+    """加载时没有读取在线状态的已有记录，保存前从数据库补充"""
+    if instance.pk is not None and getattr(instance, LOADED_ATTR, None) is None:
+        setattr(instance, LOADED_ATTR, (
+            DeviceSecurityStatus.objects.filter(pk=instance.pk).values_list('is_online', flat=True).first()
+        ))
+
+
+def build_change(instance, was_online, is_online, changed_at=None):
+    return DeviceStatusChange(
+        installation_id=instance.pk,
+        asset_serial_number=instance.asset_serial_number or '',
+        network_element_name=instance.network_element_name or '',
+        was_online=was_online,
+        is_online=is_online,
+        changed_at=changed_at or timezone.now(),
+    )
+
+
+def record_save(instance, created):
+    """新增或在线状态变化时记录"""
+    was_online = None if created else getattr(instance, LOADED_ATTR, None)
+    if was_online is None or was_online != instance.is_online:
+        build_change(instance, was_online, instance.is_online).save()
+    setattr(instance, LOADED_ATTR, instance.is_online)
+
+
+def record_delete(instance):
+    was_online = getattr(instance, LOADED_ATTR, None)
+    build_change(instance, instance.is_online if was_online is None else was_online, None).save()
+
+
+def record_bulk(created, updated):
+    """bulk_create/bulk_update 不触发信号，由导入器在批量写入后调用"""
+    now = timezone.now()
+    changes = [build_change(instance, None, instance.is_online, now) for instance in created]
+    for instance in updated:
+        was_online = getattr(instance, LOADED_ATTR, None)
+        if was_online != instance.is_online:
+            changes.append(build_change(instance, was_online, instance.is_online, now))
+        setattr(instance, LOADED_ATTR, instance.is_online)
+    DeviceStatusChange.objects.bulk_create(changes, batch_size=1000)
+    return len(changes)
+
+
+def serialize_change(change):
+    return {
+        'id': change.id,
+        'installation_id': change.installation_id,
+        'asset_serial_number': change.asset_serial_number,
+        'network_element_name': change.network_element_name,
+        'was_online': change.was_online,
+        'is_online': change.is_online,
+        'changed_at': change.changed_at,
+    }
+
+
+def fetch_changes(serial=None, network_element=None, start=None, end=None, cursor=None, limit=DEFAULT_LIMIT):
+    """按时间顺序返回 [start, end) 内的状态变化，可按序列号或网元名称筛选
+
+    返回 changes、下一页的 cursor 和 has_more。
+    """
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    changes = DeviceStatusChange.objects.all()
+    if serial:
+        changes = changes.filter(asset_serial_number=serial)
+    if network_element:
+        changes = changes.filter(network_element_name=network_element)
+    if start:
+        changes = changes.filter(changed_at__gte=start)
+    if end:
+        changes = changes.filter(changed_at__lt=end)
+    # 沿用增量导出的游标格式，位置记在 'u' 中
+    position = decode_cursor(cursor)['u'] if cursor else None
+    if position:
+        changes = changes.filter(after(position, 'changed_at'))
+    rows = list(changes.order_by('changed_at', 'id')[:limit + 1])
+    page = rows[:limit]
+    next_cursor = None
+    if page:
+        last = page[-1]
+        next_cursor = encode_cursor({'u': [last.changed_at.isoformat(), last.id], 'd': None})
+    return {
+        'changes': [serialize_change(change) for change in page],
+        'cursor': next_cursor or cursor,
+        'has_more': len(rows) > limit,
+    }
+
+
+def get_trend(start, end=None, points=DEFAULT_POINTS):
+    """[start, end) 内在线/离线设备数的趋势
+
+    按点数选择步长(整小时或整天)，每个点是该时间段结束时的设备数和段内的状态变化次数。
+    """
+    end = end or timezone.now()
+    points = max(1, min(int(points), MAX_POINTS))
+    start = rollups.floor_hour(start)
+    step_hours = max(1, math.ceil((end - start) / rollups.HOUR / points))
+    if step_hours >= 24:
+        step_hours = math.ceil(step_hours / 24) * 24
+        start = rollups.start_of_day(timezone.localtime(start).date())
+    step = timedelta(hours=step_hours)
+
+    baseline = rollups.get_counts(None, start)
+    online = baseline['online_delta']
+    offline = baseline['offline_delta']
+
+    buckets = []
+    bucket_start = start
+    while bucket_start < end:
+        buckets.append([bucket_start, 0, 0, 0])
+        bucket_start += step
+    for period, online_delta, offline_delta, status_changes in rollups.iter_status_deltas(
+        start, end, daily=step_hours % 24 == 0,
+    ):
+        bucket = buckets[min(int((period - start) / step), len(buckets) - 1)]
+        bucket[1] += online_delta
+        bucket[2] += offline_delta
+        bucket[3] += status_changes
+
+    trend = []
+    for bucket_start, online_delta, offline_delta, status_changes in buckets:
+        online += online_delta
+        offline += offline_delta
+        trend.append({
+            'time': min(bucket_start + step, end),
+            'online': online,
+            'offline': offline,
+            'changes': status_changes,
+        })
+    return {'step_hours': step_hours, 'points': trend}
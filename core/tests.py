@@ -1,3 +1,1687 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import io
+import json
+import os
+import queue
+import shutil
+import tempfile
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.http import FileResponse
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import Workbook, load_workbook
+from tablib import Dataset
+
+from . import (
+    activity_log, barcodes, caching, export_cache, jobs, live, log_archive, reconciliation, rollups, search, status_history,
+)
+from .activity_routes import ActivityRoute, ActivityThrottle, build_route_table, get_policy
+from .dashboard import QueryBackend, ReconciliationBackend, get_backend
+from .delta import InvalidCursor, fetch_delta
+from .exporters import get_export_columns, parse_export_fields, stream_csv, stream_xlsx, write_export
+from .filters import DeviceArrivalQuery
+from .importers import DeviceArrivalImporter, DeviceSecurityStatusImporter, StagingNotFound, iter_xlsx_rows
+from .management.commands.check_query_plans import SCAN_PATTERNS, Command as CheckQueryPlansCommand
+from .models import (
+    BackgroundJob, DeviceArrival, DeviceDelivery, DeviceReconciliation, DeviceSecurityStatus, DeviceStatusChange, User,
+    UserActivityLog, UserAgent,
+)
+from .pagination import CachedCount, KeysetPaginator
+from .resources import DeviceArrivalResource
+from .versioning import bump_on_commit, get_version
+
+
+def make_workbook(headers, rows):
+    """生成内存中的 xlsx 文件"""
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(headers)
+    for row in rows:
+        sheet.append(row)
+    output = io.BytesIO()
+    workbook.save(output)
+    output.seek(0)
+    return output
+
+
+class TempDirMixin:
+    """每个测试使用单独的临时目录"""
+
+    def make_temp_dir(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path, ignore_errors=True)
+        return path
+
+    def use_temp_dir(self, setting):
+        """把 setting 指向的目录换成临时目录"""
+        settings_override = override_settings(**{setting: self.make_temp_dir()})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+class ImporterTestMixin(TempDirMixin):
+    arrival_headers = ['项目名称', '到货日期', '设备型号', '条码']
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('importer', password='secret')
+        self.other = User.objects.create_user('other', password='secret')
+        self.use_temp_dir('IMPORT_STAGING_DIR')
+
+    def make_file(self, count, start=0):
+        return make_workbook(self.arrival_headers, [
+            [f'项目{i}', '2024-01-02', f'型号{i}', f'BC{i:06d}'] for i in range(start, start + count)
+        ])
+
+    def corrupt_last_row(self, importer, token):
+        """破坏最后一块中的一行，写入该块时违反非空约束"""
+        _, rows_path = importer.get_staging_paths(token)
+        with open(rows_path, encoding='utf-8') as rows_file:
+            rows = [json.loads(line) for line in rows_file]
+        rows[-1]['device_model'] = None
+        with open(rows_path, 'w', encoding='utf-8') as rows_file:
+            rows_file.writelines(json.dumps(row, ensure_ascii=False) + '\n' for row in rows)
+
+
+class DeviceArrivalImporterTests(ImporterTestMixin, TestCase):
+
+    def test_iter_rows_skips_blank_rows_and_pads_columns(self):
+        upload = make_workbook(['条码', '型号', '备注'], [['BC1', '型号A'], [None, None, None], ['BC2', '型号B', '说明']])
+        rows = list(iter_xlsx_rows(upload))
+        self.assertEqual([row_number for row_number, row in rows], [1, 3])
+        self.assertEqual(rows[0][1], {'条码': 'BC1', '型号': '型号A', '备注': None})
+
+    def test_apply_writes_all_chunks(self):
+        importer = DeviceArrivalImporter(user=self.user, chunk_size=2)
+        summary = importer.apply(importer.stage(self.make_file(5)).token)
+        self.assertEqual((summary.created, summary.updated), (5, 0))
+        self.assertEqual(DeviceArrival.objects.count(), 5)
+        arrival = DeviceArrival.objects.get(barcode='BC000003')
+        self.assertEqual((arrival.project_name, arrival.arrival_date), ('项目3', date(2024, 1, 2)))
+
+    def count_write_queries(self, count, start):
+        importer = DeviceArrivalImporter(user=self.user, chunk_size=count)
+        token = importer.stage(self.make_file(count, start)).token
+        chunk = next(importer.iter_staged_chunks(token))
+        with CaptureQueriesContext(connection) as queries:
+            importer.write_chunk(chunk, importer.load_staged(token))
+        return len(queries)
+
+    def test_chunk_queries_independent_of_rows(self):
+        # 每块固定几次批量查询和写入，与块内行数无关
+        self.assertEqual(self.count_write_queries(2, 0), self.count_write_queries(20, 100))
+
+    def test_created_by_kept_on_update(self):
+        DeviceArrival.objects.create(
+            project_name='旧项目', arrival_date=date(2024, 1, 1), device_model='型号0', barcode='BC000000', created_by=self.other,
+        )
+        importer = DeviceArrivalImporter(user=self.user, chunk_size=2)
+        summary = importer.apply(importer.stage(self.make_file(3)).token)
+        self.assertEqual((summary.created, summary.updated), (2, 1))
+        updated = DeviceArrival.objects.get(barcode='BC000000')
+        self.assertEqual(updated.project_name, '项目0')
+        # 更新已有记录不改变创建人，新记录的创建人为上传者
+        self.assertEqual(updated.created_by, self.other)
+        self.assertEqual(set(DeviceArrival.objects.exclude(barcode='BC000000').values_list('created_by', flat=True)), {self.user.pk})
+
+    def test_duplicate_barcodes_keep_last_row(self):
+        upload = make_workbook(self.arrival_headers, [
+            ['项目A', '2024-01-02', '型号', 'BC000001'],
+            ['项目B', '2024-01-03', '型号', 'BC000001'],
+        ])
+        summary = DeviceArrivalImporter(user=self.user).run(upload)
+        self.assertEqual((summary.created, summary.skipped), (1, 1))
+        self.assertEqual(DeviceArrival.objects.get().project_name, '项目B')
+
+    def test_invalid_date_reported(self):
+        upload = make_workbook(self.arrival_headers, [['项目', '不是日期', '型号', 'BC000001']])
+        summary = DeviceArrivalImporter(user=self.user).run(upload)
+        self.assertEqual(summary.error_count, 1)
+        self.assertEqual(summary.errors[0][0], 1)
+        self.assertFalse(DeviceArrival.objects.exists())
+
+    def test_bad_chunk_raises_database_error(self):
+        importer = DeviceArrivalImporter(user=self.user, chunk_size=2)
+        token = importer.stage(self.make_file(5)).token
+        self.corrupt_last_row(importer, token)
+        # 抛出原来的数据库错误，暂存数据保留
+        with self.assertRaises(IntegrityError):
+            importer.apply(token)
+        self.assertEqual(importer.load_staged(token).created, 5)
+
+
+class DeviceSecurityStatusImporterTests(ImporterTestMixin, TestCase):
+    headers = ['网元名称', '资产序列号', '检查日期']
+
+    def test_rows_without_serial_skipped(self):
+        upload = make_workbook(self.headers, [['网元A', 'SN0001', '2024-01-02'], ['网元B', None, '2024-01-02']])
+        summary = DeviceSecurityStatusImporter(user=self.user).run(upload)
+        self.assertEqual((summary.created, summary.skipped), (1, 1))
+        status = DeviceSecurityStatus.objects.get()
+        self.assertEqual((status.asset_serial_number, status.is_online), ('SN0001', True))
+
+    def test_update_touches_last_check_time(self):
+        importer = DeviceSecurityStatusImporter(user=self.user)
+        importer.run(make_workbook(self.headers, [['网元A', 'SN0001', '2024-01-02']]))
+        checked = DeviceSecurityStatus.objects.get().last_check_time
+        summary = importer.run(make_workbook(self.headers, [['网元B', 'SN0001', '2024-01-03']]))
+        self.assertEqual(summary.updated, 1)
+        status = DeviceSecurityStatus.objects.get()
+        self.assertEqual(status.network_element_name, '网元B')
+        self.assertGreater(status.last_check_time, checked)
+
+
+class ImportStagingTests(ImporterTestMixin, TestCase):
+
+    def test_stage_does_not_write(self):
+        summary = DeviceArrivalImporter(user=self.user, chunk_size=2).stage(self.make_file(5))
+        self.assertEqual((summary.total_rows, summary.created, summary.error_count), (5, 5, 0))
+        self.assertEqual(len(summary.samples), 5)
+        self.assertFalse(DeviceArrival.objects.exists())
+
+    def test_staged_rows_belong_to_uploader(self):
+        summary = DeviceArrivalImporter(user=self.user).stage(self.make_file(2))
+        with self.assertRaises(StagingNotFound):
+            DeviceArrivalImporter(user=self.other).load_staged(summary.token)
+        with self.assertRaises(StagingNotFound):
+            DeviceArrivalImporter(user=self.other).apply(summary.token)
+        with self.assertRaises(StagingNotFound):
+            DeviceSecurityStatusImporter(user=self.user).load_staged(summary.token)
+
+    def test_apply_uses_staged_rows_once(self):
+        importer = DeviceArrivalImporter(user=self.user)
+        token = importer.stage(self.make_file(3)).token
+        # 确认时不再读取上传文件，只写入暂存的行
+        with mock.patch('core.importers.iter_xlsx_rows') as read_rows:
+            importer.apply(token)
+        read_rows.assert_not_called()
+        self.assertEqual(DeviceArrival.objects.count(), 3)
+        # 写入后暂存文件删除，同一令牌不能再次确认
+        with self.assertRaises(StagingNotFound):
+            importer.load_staged(token)
+
+    def test_preview_counts_updates_and_skips(self):
+        importer = DeviceArrivalImporter(user=self.user)
+        importer.run(self.make_file(3))
+        DeviceArrival.objects.filter(barcode='BC000000').update(project_name='旧项目')
+        summary = importer.stage(self.make_file(4))
+        self.assertEqual((summary.created, summary.updated, summary.skipped), (1, 1, 2))
+        self.assertEqual([action for row_number, action, values in summary.samples], ['update', 'create'])
+
+    def test_errors_block_confirm(self):
+        upload = make_workbook(self.arrival_headers, [
+            ['项目', '2024-01-02', '型号', 'BC000001'],
+            ['项目', '不是日期', '型号', 'BC000002'],
+        ])
+        importer = DeviceArrivalImporter(user=self.user)
+        summary = importer.stage(upload)
+        self.assertTrue(summary.has_errors())
+        with self.assertRaises(StagingNotFound):
+            importer.apply(summary.token)
+        self.assertFalse(DeviceArrival.objects.exists())
+
+
+@override_settings(BACKGROUND_JOBS=False, ACTIVITY_LOG_ASYNC=False)
+class ImportViewTests(ImporterTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.use_temp_dir('JOB_FILES_DIR')
+        self.client.force_login(self.user)
+
+    def upload(self, content):
+        return SimpleUploadedFile('arrivals.xlsx', content.read())
+
+    def test_preview_then_confirm(self):
+        url = reverse('device_arrival_import')
+        response = self.client.post(url, {'import_file': self.upload(self.make_file(3))})
+        stage_job = BackgroundJob.objects.get(job_type='IMPORT_STAGE')
+        self.assertRedirects(response, reverse('job_detail', args=[stage_job.pk]))
+        self.assertFalse(DeviceArrival.objects.exists())
+
+        preview = self.client.get(reverse('job_detail', args=[stage_job.pk]))
+        self.assertTemplateUsed(preview, 'core/import_preview.html')
+        token = preview.context['summary'].token
+
+        response = self.client.post(url, {'token': token})
+        apply_job = BackgroundJob.objects.get(job_type='IMPORT_APPLY')
+        self.assertRedirects(response, reverse('job_detail', args=[apply_job.pk]))
+        self.assertEqual(apply_job.status, 'SUCCESS')
+        self.assertEqual(DeviceArrival.objects.count(), 3)
+
+    def test_cancel_discards_staged_rows(self):
+        url = reverse('device_arrival_import')
+        self.client.post(url, {'import_file': self.upload(self.make_file(2))})
+        token = BackgroundJob.objects.get().result['token']
+        self.client.post(url, {'token': token, 'cancel': '1'})
+        response = self.client.post(url, {'token': token})
+        self.assertRedirects(response, url, fetch_redirect_response=False)
+        self.assertFalse(BackgroundJob.objects.filter(job_type='IMPORT_APPLY').exists())
+        self.assertFalse(DeviceArrival.objects.exists())
+
+
+@override_settings(ACTIVITY_LOG_ASYNC=False)
+class BackgroundJobTests(ImporterTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.use_temp_dir('JOB_FILES_DIR')
+        self.use_temp_dir('EXPORT_CACHE_DIR')
+
+    def create_job(self, **kwargs):
+        kwargs.setdefault('job_type', 'EXPORT')
+        return BackgroundJob.objects.create(target='device_arrival', created_by=self.user, **kwargs)
+
+    def save_upload(self, content):
+        path = jobs.new_job_file_path('.xlsx')
+        with open(path, 'wb') as upload:
+            upload.write(content.read())
+        return path
+
+    def test_submit_runs_inline_by_default(self):
+        job = jobs.enqueue_export(self.user, 'device_arrival')
+        self.assertEqual(job.status, 'SUCCESS')
+
+    @override_settings(BACKGROUND_JOBS=True)
+    def test_submit_queues_when_background_enabled(self):
+        job = jobs.enqueue_export(self.user, 'device_arrival')
+        self.assertEqual(BackgroundJob.objects.get(pk=job.pk).status, 'PENDING')
+
+    def test_claim_takes_oldest_pending_job_once(self):
+        first = self.create_job()
+        self.create_job()
+        claimed = jobs.claim_next_job()
+        self.assertEqual(claimed.pk, first.pk)
+        self.assertEqual((claimed.status, claimed.worker_pid), ('RUNNING', os.getpid()))
+        self.assertNotEqual(jobs.claim_next_job().pk, first.pk)
+        self.assertIsNone(jobs.claim_next_job())
+
+    def test_requeue_only_dead_local_workers(self):
+        host = jobs.get_worker_host()
+        dead = self.create_job(status='RUNNING', worker_pid=123456, worker_host=host)
+        alive = self.create_job(status='RUNNING', worker_pid=os.getpid(), worker_host=host)
+        remote = self.create_job(status='RUNNING', worker_pid=123456, worker_host='other-host')
+        with mock.patch.object(jobs, 'is_process_alive', side_effect=lambda pid: pid == os.getpid()):
+            self.assertEqual(jobs.requeue_orphaned_jobs(), 1)
+        statuses = dict(BackgroundJob.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses, {dead.pk: 'PENDING', alive.pk: 'RUNNING', remote.pk: 'RUNNING'})
+        self.assertIsNone(BackgroundJob.objects.get(pk=dead.pk).worker_pid)
+
+    def test_stage_removes_upload_after_success(self):
+        path = self.save_upload(self.make_file(2))
+        job = jobs.run_job(self.create_job(job_type='IMPORT_STAGE', input_file=path))
+        self.assertEqual(job.status, 'SUCCESS')
+        self.assertEqual(job.result['total_rows'], 2)
+        self.assertFalse(os.path.exists(path))
+
+    def test_failed_stage_keeps_upload(self):
+        path = self.save_upload(self.make_file(2))
+        with mock.patch.object(DeviceArrivalImporter, 'stage', side_effect=ValueError('校验失败')):
+            job = jobs.run_job(self.create_job(job_type='IMPORT_STAGE', input_file=path))
+        self.assertEqual((job.status, job.error), ('FAILED', '校验失败'))
+        self.assertTrue(os.path.exists(path))
+
+    def test_apply_job_writes_staged_rows(self):
+        token = DeviceArrivalImporter(user=self.user).stage(self.make_file(3)).token
+        job = jobs.run_job(self.create_job(job_type='IMPORT_APPLY', params={'token': token}))
+        self.assertEqual((job.status, job.processed_rows, job.total_rows), ('SUCCESS', 3, 3))
+        self.assertEqual(DeviceArrival.objects.count(), 3)
+
+    def test_export_job_download(self):
+        DeviceArrivalImporter(user=self.user).run(self.make_file(3))
+        job = jobs.enqueue_export(self.user, 'device_arrival', export_format='csv')
+        self.assertEqual(job.result, {'rows': 3, 'format': 'csv', 'filename': 'device_arrivals.csv'})
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('job_download', args=[job.pk]))
+        self.assertTrue(response['Content-Type'].startswith('text/csv'))
+        self.assertIn('device_arrivals.csv', response['Content-Disposition'])
+        self.assertIn('BC000002', b''.join(response.streaming_content).decode('utf-8-sig'))
+
+    def test_status_view_limited_to_owner(self):
+        job = jobs.enqueue_export(self.user, 'device_arrival')
+        self.client.force_login(self.user)
+        data = self.client.get(reverse('job_status', args=[job.pk])).json()
+        self.assertEqual((data['status'], data['result']['rows']), ('SUCCESS', 0))
+        self.assertEqual(data['download_url'], reverse('job_download', args=[job.pk]))
+        self.client.force_login(self.other)
+        self.assertEqual(self.client.get(reverse('job_status', args=[job.pk])).status_code, 404)
+
+
+class HeaderAliasTests(TestCase):
+
+    def test_resolve_headers_once(self):
+        projections, fallbacks = DeviceArrivalResource().resolve_headers(['工程', '日期', '时间', '型号', 'SN'])
+        self.assertEqual(projections, [('项目名称', '工程'), ('设备型号', '型号'), ('条码', 'SN')])
+        self.assertEqual(fallbacks, [('到货日期', ('日期', '时间'))])
+
+    def test_canonical_headers_need_no_projection(self):
+        projections, fallbacks = DeviceArrivalResource().resolve_headers(['项目名称', '设备型号', '条码'])
+        self.assertEqual((projections, fallbacks), ([], []))
+
+    def test_transformer_projects_and_fills_defaults(self):
+        transform = DeviceArrivalResource().compile_row_transformer(['工程', '日期', '时间', '型号', 'SN'])
+        row = {'工程': '项目A', '日期': None, '时间': '2024-01-02', '型号': None, 'SN': 'BC1'}
+        transform(row, 1)
+        self.assertEqual(
+            (row['项目名称'], row['到货日期'], row['设备型号'], row['条码']), ('项目A', '2024-01-02', '未知型号', 'BC1'),
+        )
+        # 没有条码时按导入时间戳和行号生成，同一次导入的时间戳相同
+        first, second = (dict.fromkeys(['工程', '日期', '时间', '型号', 'SN']) for _ in range(2))
+        transform(first, 1)
+        transform(second, 2)
+        self.assertTrue(first['条码'].startswith('AUTO-'))
+        self.assertEqual(first['条码'].rsplit('-', 1)[0], second['条码'].rsplit('-', 1)[0])
+
+    def test_resource_import_with_alias_headers(self):
+        dataset = Dataset(headers=['工程', '日期', '型号', 'SN'])
+        dataset.append(['项目A', '2024-01-02', '型号A', 'BC1'])
+        dataset.append(['项目B', '2024-01-03', '型号B', 'BC2'])
+        result = DeviceArrivalResource().import_data(dataset, dry_run=False)
+        self.assertFalse(result.has_errors() or result.has_validation_errors())
+        arrival = DeviceArrival.objects.get(barcode='BC2')
+        self.assertEqual((arrival.project_name, arrival.arrival_date, arrival.device_model), ('项目B', date(2024, 1, 3), '型号B'))
+
+
+class ImportLookupTests(ImporterTestMixin, TestCase):
+
+    def count_stage_queries(self, count, chunk_size):
+        importer = DeviceArrivalImporter(user=self.user)
+        importer.run(self.make_file(count))
+        upload = self.make_file(count)
+        with CaptureQueriesContext(connection) as queries:
+            DeviceArrivalImporter(user=self.user, chunk_size=chunk_size).stage(upload)
+        return len(queries)
+
+    def test_stage_queries_per_chunk(self):
+        # 已存在的记录每块只查询一次，查询次数只与块数有关
+        self.assertEqual(self.count_stage_queries(6, 2), self.count_stage_queries(60, 20))
+
+    def test_apply_does_not_load_users(self):
+        importer = DeviceArrivalImporter(user=self.user, chunk_size=10)
+        importer.run(self.make_file(10))
+        DeviceArrival.objects.update(project_name='旧项目')
+        token = importer.stage(self.make_file(10)).token
+        with CaptureQueriesContext(connection) as queries:
+            importer.apply(token)
+        # 创建人取自上传者，更新时不逐行读取用户表
+        self.assertFalse([query for query in queries if 'core_user' in query['sql']])
+        self.assertEqual(DeviceArrival.objects.filter(project_name='旧项目').count(), 0)
+
+
+def create_arrivals(user, count, **kwargs):
+    """批量创建到货记录，条码为 BC000000 起的连续编号"""
+    values = {'project_name': '项目', 'arrival_date': date(2024, 1, 2), 'device_model': '型号', **kwargs}
+    return [
+        DeviceArrival.objects.create(barcode=f'BC{i:06d}', created_by=user, **values)
+        for i in range(count)
+    ]
+
+
+class ExporterTests(TempDirMixin, TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('exporter', password='secret')
+        create_arrivals(self.user, 3, project_name='项目\x01A')
+        self.resource = DeviceArrivalResource()
+        self.queryset = DeviceArrival.objects.order_by('id')
+
+    def test_columns_follow_foreign_keys(self):
+        columns = get_export_columns(self.resource, ['barcode', 'created_by'])
+        self.assertEqual([(header, lookup) for header, lookup, render in columns], [('条码', 'barcode'), ('创建人', 'created_by__username')])
+
+    def test_stream_xlsx_readable(self):
+        content = b''.join(stream_xlsx(get_export_columns(self.resource), self.queryset))
+        rows = list(load_workbook(io.BytesIO(content), read_only=True).active.values)
+        self.assertEqual(rows[0], ('id', '项目名称', '到货日期', '设备型号', '条码', '创建人'))
+        self.assertEqual(len(rows), 4)
+        # 控制字符从文本中去掉
+        self.assertEqual(rows[1][1:], ('项目A', '2024-01-02', '型号', 'BC000000', 'exporter'))
+
+    def test_stream_csv_gzip_matches_plain(self):
+        columns = get_export_columns(self.resource, ['barcode'])
+        plain = b''.join(stream_csv(columns, self.queryset))
+        compressed = b''.join(stream_csv(columns, self.queryset, compress=True))
+        self.assertEqual(gzip.decompress(compressed), plain)
+        self.assertEqual(plain.decode('utf-8-sig').split(), ['条码', 'BC000000', 'BC000001', 'BC000002'])
+
+    def test_write_export_counts_rows(self):
+        path = os.path.join(self.make_temp_dir(), 'export.xlsx')
+        progress = mock.Mock()
+        self.assertEqual(write_export(path, self.resource, self.queryset, 'xlsx', progress=progress, fields=['barcode']), 3)
+        progress.assert_called_with(3)
+        rows = list(load_workbook(path, read_only=True).active.values)
+        self.assertEqual(rows, [('条码',), ('BC000000',), ('BC000001',), ('BC000002',)])
+
+    def test_streaming_does_not_load_models(self):
+        columns = get_export_columns(self.resource)
+        with CaptureQueriesContext(connection) as queries:
+            b''.join(stream_csv(columns, self.queryset))
+        self.assertEqual(len(queries), 1)
+
+
+@override_settings(ACTIVITY_LOG_ASYNC=False)
+class ExportViewTests(TempDirMixin, TestCase):
+
+    def setUp(self):
+        self.use_temp_dir('EXPORT_CACHE_DIR')
+        self.use_temp_dir('JOB_FILES_DIR')
+        self.user = User.objects.create_user('exporter', password='secret')
+        create_arrivals(self.user, 3)
+        DeviceArrival.objects.filter(barcode='BC000001').update(project_name='特殊项目')
+        self.client.force_login(self.user)
+        self.url = reverse('device_arrival_export')
+
+    def read_csv(self, response):
+        content = b''.join(response.streaming_content).decode('utf-8-sig')
+        return [line.split(',') for line in content.split()]
+
+    def test_parse_fields_keeps_export_order(self):
+        resource = DeviceArrivalResource()
+        self.assertEqual(parse_export_fields(resource, ['barcode,project_name', 'unknown']), ['project_name', 'barcode'])
+        self.assertIsNone(parse_export_fields(resource, ['unknown']))
+
+    def test_stream_applies_filters_and_fields(self):
+        response = self.client.get(self.url, {'format': 'csv', 'q': '特殊', 'fields': 'barcode,project_name'})
+        self.assertEqual(self.read_csv(response), [['项目名称', '条码'], ['特殊项目', 'BC000001']])
+
+    def test_job_export_applies_filters_and_fields(self):
+        response = self.client.get(self.url, {'job_format': 'csv', 'q': '特殊', 'fields': 'barcode'})
+        job = BackgroundJob.objects.get()
+        self.assertRedirects(response, reverse('job_detail', args=[job.pk]))
+        self.assertEqual((job.params['filters'], job.params['fields'], job.result['rows']), ({'q': '特殊'}, ['barcode'], 1))
+        download = self.client.get(reverse('job_download', args=[job.pk]))
+        self.assertEqual(self.read_csv(download), [['条码'], ['BC000001']])
+
+    def test_unknown_format_rejected(self):
+        self.assertEqual(self.client.get(self.url, {'format': 'pdf'}).status_code, 404)
+        self.assertEqual(self.client.get(self.url, {'job_format': 'pdf'}).status_code, 404)
+
+
+@override_settings(ACTIVITY_LOG_ASYNC=False)
+class ExportCacheTests(TempDirMixin, TestCase):
+
+    def setUp(self):
+        self.use_temp_dir('EXPORT_CACHE_DIR')
+        self.user = User.objects.create_user('exporter', password='secret')
+        with self.captureOnCommitCallbacks(execute=True):
+            create_arrivals(self.user, 2)
+        self.client.force_login(self.user)
+        self.url = reverse('device_arrival_export')
+
+    def export(self, **headers):
+        response = self.client.get(self.url, {'format': 'csv'}, headers=headers)
+        if response.status_code == 200:
+            response.content_bytes = b''.join(response.streaming_content)
+        return response
+
+    def test_second_request_served_from_cache(self):
+        first = self.export()
+        self.assertNotIsInstance(first, FileResponse)
+        second = self.export()
+        self.assertIsInstance(second, FileResponse)
+        self.assertEqual(second.content_bytes, first.content_bytes)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertIn('private', second['Cache-Control'])
+
+    def test_matching_etag_not_modified(self):
+        etag = self.export()['ETag']
+        self.assertEqual(self.export(if_none_match=etag).status_code, 304)
+
+    def test_write_changes_etag(self):
+        first = self.export()
+        with self.captureOnCommitCallbacks(execute=True):
+            DeviceArrival.objects.create(
+                project_name='项目', arrival_date=date(2024, 1, 2), device_model='型号', barcode='BC999999', created_by=self.user,
+            )
+        response = self.export(if_none_match=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+        self.assertIn(b'BC999999', response.content_bytes)
+
+    def test_evict_least_recently_used(self):
+        cache_dir = export_cache.get_cache_dir()
+        for age, name in enumerate(['new', 'middle', 'old', 'writing.part']):
+            path = os.path.join(cache_dir, name)
+            with open(path, 'wb') as cache_file:
+                cache_file.write(b'x' * 100)
+            os.utime(path, (1000000 - age * 100, 1000000 - age * 100))
+        self.assertEqual(export_cache.evict(max_bytes=250), 200)
+        self.assertEqual(sorted(os.listdir(cache_dir)), ['middle', 'new', 'writing.part'])
+
+
+class ImportVersionTests(TestCase):
+
+    def make_dataset(self, *dates):
+        dataset = Dataset(headers=['项目名称', '到货日期', '设备型号', '条码'])
+        for i, value in enumerate(dates):
+            dataset.append(['项目', value, '型号', f'BC{i:06d}'])
+        return dataset
+
+    def import_data(self, dataset, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return DeviceArrivalResource().import_data(dataset, **kwargs)
+
+    def test_committed_import_bumps_once(self):
+        self.import_data(self.make_dataset('2024-01-02', '2024-01-03'), dry_run=False)
+        self.assertEqual(get_version(DeviceArrival).version, 1)
+
+    def test_dry_run_does_not_bump(self):
+        self.import_data(self.make_dataset('2024-01-02'), dry_run=True)
+        self.assertFalse(DeviceArrival.objects.exists())
+        self.assertEqual(get_version(DeviceArrival).version, 0)
+
+    def test_rolled_back_import_does_not_bump(self):
+        result = self.import_data(self.make_dataset('2024-01-02', '不是日期'), dry_run=False, rollback_on_validation_errors=True)
+        self.assertTrue(result.has_validation_errors())
+        self.assertFalse(DeviceArrival.objects.exists())
+        self.assertEqual(get_version(DeviceArrival).version, 0)
+
+    def test_unchanged_import_does_not_bump(self):
+        self.import_data(self.make_dataset('2024-01-02'), dry_run=False)
+        self.import_data(self.make_dataset('2024-01-02'), dry_run=False)
+        self.assertEqual(get_version(DeviceArrival).version, 1)
+
+
+@override_settings(DELTA_EXPORT_SAFETY_LAG=0)
+class DeltaExportTests(TestCase):
+
+    def create_arrival(self, barcode):
+        return DeviceArrival.objects.create(
+            project_name='项目', arrival_date=date(2024, 1, 1), device_model='型号', barcode=barcode,
+        )
+
+    def fetch(self, cursor=None, limit=100):
+        return fetch_delta(DeviceArrival, DeviceArrivalResource(), cursor, limit)
+
+    def test_resume_with_interleaved_deletes(self):
+        first, second, third = (self.create_arrival(f'BC{i}') for i in range(3))
+        second_id, third_id = second.pk, third.pk
+        page = self.fetch(limit=2)
+        self.assertEqual([(event['op'], event['id']) for event in page['events']], [('upsert', first.pk), ('upsert', second_id)])
+        self.assertTrue(page['has_more'])
+
+        # 已读取和尚未读取的记录各删除一条，再修改一条已读取的记录
+        second.delete()
+        third.delete()
+        first.device_model = '新型号'
+        first.save()
+
+        page = self.fetch(page['cursor'])
+        events = {(event['op'], event['id']) for event in page['events']}
+        self.assertEqual(events, {('delete', second_id), ('delete', third_id), ('upsert', first.pk)})
+        self.assertFalse(page['has_more'])
+        tombstone = next(event for event in page['events'] if event['id'] == third_id)
+        self.assertEqual(tombstone['key'], 'BC2')
+        upsert = next(event for event in page['events'] if event['op'] == 'upsert')
+        self.assertEqual(upsert['data']['设备型号'], '新型号')
+
+        # 从最新的游标继续时没有重复事件
+        self.assertEqual(self.fetch(page['cursor'])['events'], [])
+
+    def test_cursor_pages_cover_every_change_once(self):
+        ids = [self.create_arrival(f'BC{i}').pk for i in range(5)]
+        DeviceArrival.objects.get(pk=ids[1]).delete()
+        seen = []
+        cursor = None
+        while True:
+            page = self.fetch(cursor, limit=2)
+            seen += [(event['op'], event['id']) for event in page['events']]
+            cursor = page['cursor']
+            if not page['has_more']:
+                break
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertEqual(set(seen), {('upsert', pk) for pk in ids if pk != ids[1]} | {('delete', ids[1])})
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(InvalidCursor):
+            self.fetch('not-a-cursor')
+
+
+@override_settings(DELTA_EXPORT_SAFETY_LAG=0)
+class ChunkCommitTests(ImporterTestMixin, TransactionTestCase):
+
+    def test_each_chunk_committed_before_next(self):
+        importer = DeviceArrivalImporter(user=self.user, chunk_size=2)
+        token = importer.stage(self.make_file(5)).token
+        seen = []
+        cursors = [None]
+
+        def progress(processed):
+            # 每块提交后才回调，此时增量导出已能读到这一块
+            self.assertFalse(connection.in_atomic_block)
+            page = fetch_delta(DeviceArrival, DeviceArrivalResource(), cursors[-1])
+            seen.extend(event['data']['条码'] for event in page['events'])
+            cursors.append(page['cursor'])
+            self.assertEqual(len(seen), processed)
+
+        importer.apply(token, progress=progress)
+        self.assertEqual(seen, [f'BC{i:06d}' for i in range(5)])
+
+    def test_failed_chunk_keeps_committed_chunks_and_retry_completes(self):
+        importer = DeviceArrivalImporter(user=self.user, chunk_size=2)
+        token = importer.stage(self.make_file(5)).token
+        self.corrupt_last_row(importer, token)
+        with self.assertRaises(IntegrityError):
+            importer.apply(token)
+        self.assertEqual(DeviceArrival.objects.count(), 4)
+
+        # 修正暂存行后用同一令牌重试，已写入的行按未变化跳过
+        _, rows_path = importer.get_staging_paths(token)
+        with open(rows_path, encoding='utf-8') as rows_file:
+            rows = [json.loads(line) for line in rows_file]
+        rows[-1]['device_model'] = '型号4'
+        with open(rows_path, 'w', encoding='utf-8') as rows_file:
+            rows_file.writelines(json.dumps(row, ensure_ascii=False) + '\n' for row in rows)
+        summary = importer.apply(token)
+        self.assertEqual((summary.created, summary.updated, summary.skipped), (1, 0, 4))
+        self.assertEqual(DeviceArrival.objects.count(), 5)
+
+
+class KeysetPaginatorTests(TestCase):
+    ordering = ('-created_at', '-id')
+
+    def setUp(self):
+        cache.clear()
+        for i in range(7):
+            DeviceArrival.objects.create(
+                project_name='项目', arrival_date=date(2024, 1, 1), device_model='型号', barcode=f'BC{i}',
+            )
+        self.expected = list(DeviceArrival.objects.order_by(*self.ordering).values_list('id', flat=True))
+
+    def paginator(self):
+        queryset = DeviceArrival.objects.all()
+        return KeysetPaginator(queryset, 3, self.ordering, counter=CachedCount(queryset))
+
+    def ids(self, page):
+        return [arrival.pk for arrival in page]
+
+    def test_next_previous_and_last(self):
+        paginator = self.paginator()
+        first = paginator.page()
+        self.assertEqual(self.ids(first), self.expected[:3])
+        self.assertFalse(first.has_previous())
+
+        second = paginator.page(first.next_cursor())
+        self.assertEqual((self.ids(second), second.number), (self.expected[3:6], 2))
+        third = paginator.page(second.next_cursor())
+        self.assertEqual((self.ids(third), third.number), (self.expected[6:], 3))
+        self.assertFalse(third.has_next())
+
+        # 上一页游标：第二页之前是第一页，第三页之前是第二页
+        self.assertEqual(second.previous_cursor(), '')
+        back = paginator.page(third.previous_cursor())
+        self.assertEqual((self.ids(back), back.number), (self.expected[3:6], 2))
+
+        last = paginator.page(first.last_cursor())
+        self.assertEqual((self.ids(last), last.number), (self.expected[6:], 3))
+
+    def test_window_cursors_match_sequential_paging(self):
+        paginator = self.paginator()
+        first = paginator.page()
+        for number, cursor in first.get_window():
+            if number > 1:
+                self.assertEqual(self.ids(paginator.page(cursor)), self.expected[(number - 1) * 3:number * 3])
+
+    def test_deleted_boundary_row(self):
+        paginator = self.paginator()
+        first = paginator.page()
+        cursor = first.next_cursor()
+        # 游标只记录排序键，边界行被删除后仍从同一位置继续
+        DeviceArrival.objects.filter(pk=self.expected[2]).delete()
+        self.assertEqual(self.ids(paginator.page(cursor)), self.expected[3:6])
+
+    def test_all_rows_after_cursor_deleted(self):
+        paginator = self.paginator()
+        cursor = paginator.page(paginator.page().next_cursor()).next_cursor()
+        DeviceArrival.objects.filter(pk__in=self.expected[6:]).delete()
+        cache.clear()
+        # 游标之后已没有记录时显示最后一页
+        page = self.paginator().page(cursor)
+        self.assertEqual(self.ids(page), self.expected[3:6])
+        self.assertFalse(page.has_next())
+
+
+@override_settings(ACTIVITY_LOG_ASYNC=False)
+class ListPaginationViewTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('viewer', password='secret')
+        create_arrivals(self.user, 3)
+        self.client.force_login(self.user)
+
+    def test_per_page_clamped(self):
+        url = reverse('device_arrival_list')
+        self.assertEqual(self.client.get(url, {'per_page': 100000}).context['per_page'], 100)
+        self.assertEqual(self.client.get(url, {'per_page': 0}).context['per_page'], 1)
+        self.assertEqual(self.client.get(url, {'per_page': 'x'}).context['per_page'], 50)
+
+    def test_cursor_pages(self):
+        url = reverse('device_arrival_list')
+        first = self.client.get(url, {'per_page': 2}).context['page_obj']
+        second = self.client.get(url, {'per_page': 2, 'cursor': first.next_cursor()}).context['page_obj']
+        barcodes = [arrival.barcode for page in (first, second) for arrival in page]
+        self.assertEqual(sorted(barcodes), ['BC000000', 'BC000001', 'BC000002'])
+
+
+class SearchIndexTests(TestCase):
+
+    def setUp(self):
+        self.arrival = DeviceArrival.objects.create(
+            project_name='城东机房改造', arrival_date=date(2024, 1, 2), device_model='防火墙X100', barcode='BC000001',
+        )
+
+    def matches(self, query):
+        condition = search.search_filter(DeviceArrival, query)
+        return sorted(DeviceArrival.objects.filter(condition).values_list('barcode', flat=True))
+
+    def test_uses_fts_index(self):
+        self.assertTrue(search.uses_fts(DeviceArrival))
+        self.assertEqual(self.matches('机房改'), ['BC000001'])
+        self.assertEqual(self.matches('x10'), ['BC000001'])
+
+    def test_short_query_uses_icontains(self):
+        self.assertIn('LIKE', str(DeviceArrival.objects.filter(search.search_filter(DeviceArrival, '机房')).query))
+        self.assertEqual(self.matches('机房'), ['BC000001'])
+
+    def test_save_and_delete_keep_index_in_sync(self):
+        self.arrival.project_name = '城西数据中心'
+        self.arrival.save()
+        self.assertEqual(self.matches('机房改'), [])
+        self.assertEqual(self.matches('数据中'), ['BC000001'])
+        self.arrival.delete()
+        self.assertEqual(self.matches('数据中'), [])
+
+    def test_deferred_index_updates_on_exit(self):
+        with search.deferred_index(DeviceArrival):
+            DeviceArrival.objects.create(
+                project_name='城北汇聚点', arrival_date=date(2024, 1, 2), device_model='交换机', barcode='BC000002',
+            )
+            self.assertEqual(self.matches('汇聚点'), [])
+        self.assertEqual(self.matches('汇聚点'), ['BC000002'])
+
+    def test_rebuild_after_queryset_update(self):
+        # 查询集 update() 不触发信号，重建后索引与数据一致
+        DeviceArrival.objects.update(project_name='城南接入点')
+        self.assertEqual(self.matches('接入点'), [])
+        self.assertEqual(search.rebuild(DeviceArrival), 1)
+        self.assertEqual(self.matches('接入点'), ['BC000001'])
+        self.assertEqual(self.matches('机房改'), [])
+
+
+def create_delivery(barcode, **kwargs):
+    values = {'delivery_date': date(2024, 1, 3), 'device_model': '型号', 'recipient_unit': '单位', 'recipient': '领用人', **kwargs}
+    return DeviceDelivery.objects.create(barcode=barcode, **values)
+
+
+def create_installation(serial, **kwargs):
+    values = {'network_element_name': f'网元-{serial}', 'is_online': True, **kwargs}
+    return DeviceSecurityStatus.objects.create(asset_serial_number=serial, **values)
+
+
+@override_settings(ACTIVITY_LOG_ASYNC=False)
+class BarcodeResolveTests(TestCase):
+
+    def setUp(self):
+        barcodes.invalidate()
+        self.addCleanup(barcodes.invalidate)
+        with self.captureOnCommitCallbacks(execute=True):
+            create_arrivals(None, 3)
+            create_delivery('BC000001')
+            create_installation('BC000001')
+
+    def test_is_barcode(self):
+        self.assertTrue(barcodes.is_barcode('BC000001'))
+        self.assertTrue(barcodes.is_barcode('sn-2024/01'))
+        self.assertFalse(barcodes.is_barcode('机房改造'))
+        self.assertFalse(barcodes.is_barcode('ABCDEF'))
+        self.assertFalse(barcodes.is_barcode('BC 0001'))
+
+    def test_filter_matches_prefix_and_lowercase(self):
+        condition = barcodes.barcode_filter(DeviceArrival, 'bc00000')
+        self.assertEqual(DeviceArrival.objects.filter(condition).count(), 3)
+        self.assertEqual(DeviceArrivalQuery({'q': 'bc000002'}).get_queryset().get().barcode, 'BC000002')
+
+    def test_resolve_returns_all_records(self):
+        result = barcodes.resolve(' bc000001 ')
+        self.assertTrue(result['found'])
+        self.assertEqual(result['arrival']['barcode'], 'BC000001')
+        self.assertEqual([len(result['deliveries']), len(result['installations'])], [1, 1])
+
+    def test_missing_barcode_lists_candidates(self):
+        result = barcodes.resolve('BC00000')
+        self.assertFalse(result['found'])
+        self.assertEqual(result['candidates'], ['BC000000', 'BC000001', 'BC000002'])
+
+    def test_cached_until_data_changes(self):
+        barcodes.resolve('BC000001')
+        with self.assertNumQueries(0):
+            barcodes.resolve('BC000001')
+        with self.captureOnCommitCallbacks(execute=True):
+            create_delivery('BC000001')
+        self.assertEqual(len(barcodes.resolve('BC000001')['deliveries']), 2)
+
+    def test_resolve_view(self):
+        self.client.force_login(User.objects.create_user('scanner', password='secret'))
+        url = reverse('barcode_resolve')
+        self.assertEqual(self.client.get(url).status_code, 400)
+        data = self.client.get(url, {'barcode': 'BC000002'}).json()
+        self.assertEqual((data['found'], data['arrival']['barcode']), (True, 'BC000002'))
+
+
+class QueryPlanTests(TestCase):
+
+    def test_canonical_queries_use_indexes(self):
+        output = io.StringIO()
+        call_command('check_query_plans', stdout=output)
+        self.assertIn('所有查询均使用索引', output.getvalue())
+
+    def test_full_scan_detection(self):
+        command = CheckQueryPlansCommand()
+        pattern = SCAN_PATTERNS['sqlite']
+        filtered = DeviceArrival.objects.filter(project_name='项目')
+        plan = 'SCAN core_devicearrival USING INDEX core_device_created_idx'
+        # 沿索引顺序读取只在没有筛选条件时可以接受，部分索引除外
+        self.assertEqual(command.find_full_scans(DeviceArrival.objects.all(), plan, pattern, set()), [])
+        self.assertEqual(command.find_full_scans(filtered, plan, pattern, set()), ['core_devicearrival'])
+        self.assertEqual(command.find_full_scans(filtered, plan, pattern, {'core_device_created_idx'}), [])
+        self.assertEqual(command.find_full_scans(DeviceArrival.objects.all(), 'SCAN core_devicearrival', pattern, set()), ['core_devicearrival'])
+
+
+@override_settings(ACTIVITY_LOG_ASYNC=False, ACTIVITY_LOG_VIEW_POLICY='skip', ACTIVITY_LOG_ROUTE_POLICIES={})
+class ListQueryCountTests(TestCase):
+    list_urls = ('device_arrival_list', 'device_delivery_list', 'device_security_status_list', 'user_activity_log_list')
+
+    def setUp(self):
+        self.user = User.objects.create_user('admin', password='secret', is_staff=True)
+        self.client.force_login(self.user)
+        self.add_rows(2)
+
+    def add_rows(self, count):
+        start = DeviceArrival.objects.count()
+        for i in range(start, start + count):
+            DeviceArrival.objects.create(
+                project_name='项目', arrival_date=date(2024, 1, 2), device_model='型号', barcode=f'BC{i:06d}', created_by=self.user,
+            )
+            create_delivery(f'BC{i:06d}', created_by=self.user)
+            create_installation(f'BC{i:06d}', created_by=self.user)
+            UserActivityLog.objects.create(user=self.user, action_type='CREATE', content_type='DEVICE_ARRIVAL', object_id=str(i))
+
+    def count_queries(self, url_name, **params):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(url_name), {'per_page': 100, **params})
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_queries_independent_of_rows(self):
+        before = {name: self.count_queries(name) for name in self.list_urls}
+        self.add_rows(10)
+        after = {name: self.count_queries(name) for name in self.list_urls}
+        self.assertEqual(after, before)
+
+    def test_user_filter_looks_up_selected_user_only(self):
+        before = self.count_queries('user_activity_log_list', user=self.user.pk)
+        for i in range(5):
+            User.objects.create_user(f'user{i}', password='secret')
+        self.assertEqual(self.count_queries('user_activity_log_list', user=self.user.pk), before)
+
+    def test_user_autocomplete(self):
+        User.objects.create_user('adam', password='secret')
+        User.objects.create_user('bob', password='secret')
+        results = self.client.get(reverse('user_autocomplete'), {'q': 'ad'}).json()['results']
+        self.assertEqual([user['username'] for user in results], ['adam', 'admin'])
+        self.client.force_login(User.objects.get(username='bob'))
+        self.assertNotEqual(self.client.get(reverse('user_autocomplete'), {'q': 'ad'}).status_code, 200)
+
+
+class ReconciliationTests(ImporterTestMixin, TestCase):
+
+    def states(self):
+        return dict(DeviceReconciliation.objects.values_list('barcode', 'state'))
+
+    def test_signals_keep_states_current(self):
+        arrival = DeviceArrival.objects.create(project_name='项目', arrival_date=date(2024, 1, 2), device_model='型号', barcode='BC1')
+        self.assertEqual(self.states(), {'BC1': 'offline'})
+        installation = create_installation('BC1')
+        self.assertEqual(self.states(), {'BC1': 'online'})
+        # 修改序列号后旧条码和新条码都重新计算
+        installation.asset_serial_number = 'BC2'
+        installation.save()
+        self.assertEqual(self.states(), {'BC1': 'offline', 'BC2': 'other'})
+        arrival.delete()
+        self.assertEqual(self.states(), {'BC2': 'other'})
+        installation.delete()
+        self.assertEqual(self.states(), {})
+
+    def test_bulk_import_refreshes_states(self):
+        DeviceArrivalImporter(user=self.user, chunk_size=2).run(self.make_file(3))
+        upload = make_workbook(['网元名称', '资产序列号', '检查日期'], [['网元', 'BC000001', '2024-01-02'], ['网元', 'SN9', '2024-01-02']])
+        DeviceSecurityStatusImporter(user=self.user).run(upload)
+        self.assertEqual(self.states(), {'BC000000': 'offline', 'BC000001': 'online', 'BC000002': 'offline', 'SN9': 'other'})
+
+    def test_rebuild_matches_incremental_rows(self):
+        create_arrivals(None, 2)
+        create_installation('BC000001')
+        create_installation('SN9')
+        fields = ('barcode', 'state', 'arrival', 'installation', 'arrival_created_at', 'installation_created_at')
+        expected = list(DeviceReconciliation.objects.order_by('barcode').values_list(*fields))
+        DeviceReconciliation.objects.all().delete()
+        reconciliation.rebuild()
+        self.assertEqual(list(DeviceReconciliation.objects.order_by('barcode').values_list(*fields)), expected)
+
+
+@override_settings(DASHBOARD_WINDOW_HOURS=24)
+class DashboardBackendTests(TestCase):
+    """两种看板实现的计数、分页和显示的安装记录一致"""
+
+    def setUp(self):
+        old = timezone.now() - timedelta(days=3)
+        arrivals = {'A': False, 'B': False, 'C': True, 'D': False, 'F': True}
+        installations = {'A': False, 'C': False, 'D': True, 'E': False, 'G': True, 'H': True}
+        for barcode, is_old in arrivals.items():
+            arrival = DeviceArrival.objects.create(project_name='项目', arrival_date=date(2024, 1, 2), device_model='型号', barcode=barcode)
+            if is_old:
+                DeviceArrival.objects.filter(pk=arrival.pk).update(created_at=old)
+        for serial, is_old in installations.items():
+            installation = create_installation(serial)
+            if is_old:
+                DeviceSecurityStatus.objects.filter(pk=installation.pk).update(created_at=old)
+        # H 另有一条最近创建的安装记录，但最近检查的是较早创建的那条
+        create_installation('H', network_element_name='网元-H-新', is_online=False)
+        DeviceSecurityStatus.objects.filter(network_element_name='网元-H').update(last_check_time=timezone.now() + timedelta(hours=1))
+        reconciliation.refresh(set(arrivals) | set(installations))
+
+    def pages(self, backend):
+        return {
+            state: [item.get('barcode') or item['serial'] for item in backend.get_page(state, 0, 100)]
+            for state in ('online', 'offline', 'other')
+        }
+
+    def test_windowed_scope(self):
+        expected = {'online': ['A'], 'offline': ['B', 'D'], 'other': ['C', 'E', 'H']}
+        for backend in (ReconciliationBackend(24), QueryBackend(24)):
+            with self.subTest(backend=backend.name):
+                self.assertEqual(backend.get_counts(), {state: len(items) for state, items in expected.items()})
+                self.assertEqual(self.pages(backend), expected)
+
+    def test_all_devices(self):
+        expected = {'online': ['A', 'C', 'D'], 'offline': ['B', 'F'], 'other': ['E', 'G', 'H']}
+        for backend in (ReconciliationBackend(), QueryBackend()):
+            with self.subTest(backend=backend.name):
+                self.assertEqual(backend.get_counts(), {state: len(items) for state, items in expected.items()})
+                self.assertEqual(self.pages(backend), expected)
+
+    def test_same_installation_displayed(self):
+        for backend in (ReconciliationBackend(24), QueryBackend(24), ReconciliationBackend(), QueryBackend()):
+            with self.subTest(backend=backend.name, window=backend.window):
+                item = next(item for item in backend.get_page('other', 0, 100) if item['serial'] == 'H')
+                self.assertEqual((item['network_element_name'], item['is_online']), ('网元-H', True))
+            # 脱网设备不显示范围外的安装记录
+            self.assertFalse([item for item in backend.get_page('offline', 0, 100) if 'network_element_name' in item])
+
+    def test_setting_selects_backend_for_both_scopes(self):
+        with override_settings(DASHBOARD_BACKEND='reconciliation'):
+            self.assertIsInstance(get_backend(limited=True), ReconciliationBackend)
+            self.assertIsNone(get_backend().window)
+        with override_settings(DASHBOARD_BACKEND='query'):
+            self.assertIsInstance(get_backend(limited=True), QueryBackend)
+            self.assertEqual(get_backend(limited=True).window, timedelta(hours=24))
+
+
+@override_settings(ACTIVITY_LOG_ASYNC=False, DASHBOARD_BACKEND='query', DASHBOARD_WINDOW_HOURS=24)
+class DashboardViewTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        for i in (3, 1, 4, 0, 2):
+            DeviceArrival.objects.create(project_name='项目', arrival_date=date(2024, 1, 2), device_model='型号', barcode=f'BC{i}')
+        for i in (1, 3, 9):
+            create_installation(f'BC{i}')
+        self.client.force_login(User.objects.create_user('viewer', password='secret'))
+
+    def get(self, **params):
+        cache.clear()
+        return self.client.get(reverse('dashboard_status'), params).context
+
+    def test_query_backend_pages_in_barcode_order(self):
+        backend = QueryBackend(24)
+        pages = [backend.get_page('offline', offset, 2) for offset in (0, 2)]
+        self.assertEqual([[item['barcode'] for item in page] for page in pages], [['BC0', 'BC2'], ['BC4']])
+        self.assertEqual([item['barcode'] for item in backend.get_page('online', 0, 10)], ['BC1', 'BC3'])
+
+    def test_query_backend_counts_in_two_queries(self):
+        with self.assertNumQueries(2):
+            self.assertEqual(QueryBackend(24).get_counts(), {'online': 2, 'offline': 3, 'other': 1})
+
+    def test_view_counts_and_page(self):
+        context = self.get(type='offline', per_page=2, page=2)
+        self.assertEqual((context['online_count'], context['offline_count'], context['other_count']), (2, 3, 1))
+        self.assertEqual((context['total_pages'], [item['barcode'] for item in context['device_list']]), (2, ['BC4']))
+
+    def test_per_page_capped(self):
+        self.assertEqual(self.get(per_page=100000)['per_page'], 100)
+        self.assertEqual(self.get(per_page=0)['per_page'], 1)
+        self.assertEqual(self.get(per_page='x')['per_page'], 20)
+
+
+class RollupTests(TestCase):
+
+    def setUp(self):
+        self.now = rollups.floor_hour(timezone.now())
+        # 过去 5 天每天两条到货和两条安装记录
+        for days_ago in range(5):
+            for hours_ago in (1, 5):
+                created_at = self.now - timedelta(days=days_ago, hours=hours_ago)
+                self.create(f'{days_ago}-{hours_ago}', created_at, is_online=hours_ago == 1)
+
+    def create(self, key, created_at, is_online=True):
+        arrival = DeviceArrival.objects.create(project_name='项目', arrival_date=date(2024, 1, 2), device_model='型号', barcode=f'BC{key}')
+        installation = create_installation(f'SN{key}', is_online=is_online)
+        DeviceArrival.objects.filter(pk=arrival.pk).update(created_at=created_at)
+        DeviceSecurityStatus.objects.filter(pk=installation.pk).update(created_at=created_at)
+
+    def assert_counts_match_records(self, *ranges):
+        for start, end in ranges:
+            with self.subTest(start=start, end=end):
+                self.assertEqual(rollups.get_counts(start, end), rollups.count_records(rollups.floor_hour(start), end))
+
+    def test_counts_match_records(self):
+        ranges = [
+            (self.now - timedelta(days=4, hours=3), self.now),
+            (self.now - timedelta(hours=6), self.now - timedelta(hours=2)),
+            (self.now - timedelta(days=10), self.now + timedelta(hours=1)),
+        ]
+        self.assert_counts_match_records(*ranges)
+        self.assertGreater(rollups.update(self.now), 0)
+        self.assert_counts_match_records(*ranges)
+        counts = rollups.get_counts(self.now - timedelta(days=10), self.now)
+        self.assertEqual((counts['arrivals'], counts['online_installations'], counts['offline_installations']), (10, 5, 5))
+
+    def test_records_after_last_rollup_counted_live(self):
+        rollups.update(self.now)
+        self.create('new', self.now + timedelta(minutes=5))
+        counts = rollups.get_counts(self.now - timedelta(days=10), self.now + timedelta(hours=1))
+        self.assertEqual(counts['arrivals'], 11)
+
+    def test_deleted_record_recounted_on_update(self):
+        rollups.update(self.now)
+        DeviceArrival.objects.get(barcode='BC2-5').delete()
+        rollups.update(self.now)
+        self.assertEqual(rollups.get_counts(self.now - timedelta(days=10), self.now)['arrivals'], 9)
+        self.assert_counts_match_records((self.now - timedelta(days=10), self.now))
+
+    def test_queries_independent_of_range_length(self):
+        rollups.update(self.now)
+        with CaptureQueriesContext(connection) as short:
+            rollups.get_counts(self.now - timedelta(days=2), self.now)
+        with CaptureQueriesContext(connection) as long:
+            rollups.get_counts(self.now - timedelta(days=90), self.now)
+        self.assertEqual(len(short), len(long))
+
+
+class StatusHistoryTests(TestCase):
+
+    def changes(self):
+        return list(DeviceStatusChange.objects.order_by('id').values_list('asset_serial_number', 'was_online', 'is_online'))
+
+    def test_signals_record_changes_only(self):
+        installation = create_installation('SN1')
+        installation.network_element_name = '新网元'
+        installation.save()
+        installation.is_online = False
+        installation.save()
+        # only() 未加载在线状态时保存前从数据库读取
+        partial = DeviceSecurityStatus.objects.only('id', 'asset_serial_number', 'network_element_name').get()
+        partial.is_online = True
+        partial.save()
+        DeviceSecurityStatus.objects.get().delete()
+        self.assertEqual(self.changes(), [('SN1', None, True), ('SN1', True, False), ('SN1', False, True), ('SN1', True, None)])
+
+    def test_record_bulk(self):
+        for i in range(2):
+            create_installation(f'SN{i}')
+        DeviceStatusChange.objects.all().delete()
+        installations = list(DeviceSecurityStatus.objects.order_by('id'))
+        installations[0].is_online = False
+        created = DeviceSecurityStatus.objects.bulk_create([
+            DeviceSecurityStatus(asset_serial_number='SN9', network_element_name='网元', is_online=False),
+        ])
+        self.assertEqual(status_history.record_bulk(created, installations), 2)
+        self.assertEqual(sorted(self.changes()), [('SN0', True, False), ('SN9', None, False)])
+
+    def test_fetch_changes_pages_and_filters(self):
+        for i in range(3):
+            installation = create_installation(f'SN{i}')
+            installation.is_online = False
+            installation.save()
+        first = status_history.fetch_changes(limit=4)
+        second = status_history.fetch_changes(cursor=first['cursor'], limit=4)
+        self.assertEqual((len(first['changes']), first['has_more'], len(second['changes']), second['has_more']), (4, True, 2, False))
+        ids = [change['id'] for change in first['changes'] + second['changes']]
+        self.assertEqual(ids, sorted(DeviceStatusChange.objects.values_list('id', flat=True)))
+        serial = status_history.fetch_changes(serial='SN1')['changes']
+        self.assertEqual([(change['was_online'], change['is_online']) for change in serial], [(None, True), (True, False)])
+
+    def test_trend_ends_at_current_counts(self):
+        for i in range(3):
+            create_installation(f'SN{i}', is_online=i > 0)
+        now = timezone.now()
+        trend = status_history.get_trend(now - timedelta(hours=24), now + timedelta(minutes=1), points=24)
+        self.assertIn(trend['step_hours'], (1, 2))
+        self.assertEqual((trend['points'][-1]['online'], trend['points'][-1]['offline']), (2, 1))
+        self.assertEqual(sum(point['changes'] for point in trend['points']), 3)
+
+    @override_settings(ACTIVITY_LOG_ASYNC=False)
+    def test_views_reject_bad_times(self):
+        self.client.force_login(User.objects.create_user('viewer', password='secret'))
+        self.assertEqual(self.client.get(reverse('status_history'), {'start': '不是时间'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('status_trend'), {'start': '2024-01-02', 'end': '2024-01-01'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('status_trend')).json()['step_hours'], 1)
+
+
+class ChangeFeedTests(TestCase):
+
+    def setUp(self):
+        self.feed = live.ChangeFeed()
+
+    def test_compute_counts_and_changed_devices(self):
+        first = self.feed.compute(set())
+        self.assertEqual(first['counts'], {'online': 0, 'offline': 0, 'other': 0})
+        # 没有发布也没有版本变化时不推送
+        self.assertIsNone(self.feed.compute(set()))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            create_installation('SN1', network_element_name='网元A')
+        data = self.feed.compute({'SN1', 'SN2'})
+        self.assertEqual(data['delta'], {'online': 0, 'offline': 0, 'other': 1})
+        self.assertEqual(data['devices'], [{'barcode': 'SN1', 'state': 'other', 'network_element_name': '网元A', 'is_online': True}])
+        self.assertEqual(data['removed'], ['SN2'])
+
+    def test_publish_overflow_keeps_counts_only(self):
+        self.feed.publish(f'BC{i}' for i in range(live.MAX_PENDING + 1))
+        self.feed.publish(['BC-late'])
+        self.assertEqual((self.feed._pending, self.feed._overflow), (set(), True))
+
+    def test_refresh_publishes_after_commit(self):
+        with mock.patch.object(live, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                create_installation('SN1')
+                publish.assert_not_called()
+        publish.assert_called_with(['SN1'])
+
+    @override_settings(LIVE_DASHBOARD_POLL_SECONDS=0.05)
+    def test_subscribers_share_one_computation(self):
+        def compute(barcodes, overflow=False):
+            # 与 ChangeFeed.compute 相同：启动时计算一次，之后没有变化时返回 None
+            if barcodes or not calls:
+                calls.append(barcodes)
+                return {'barcodes': sorted(barcodes)}
+            return None
+
+        calls = []
+
+        async def next_event(stream):
+            return await asyncio.wait_for(stream.__anext__(), timeout=5)
+
+        async def scenario():
+            first, second = self.feed.subscribe(), self.feed.subscribe()
+            events = list(await asyncio.gather(next_event(first), next_event(second)))
+            self.feed.publish(['BC1'])
+            events += await asyncio.gather(next_event(first), next_event(second))
+            # 断线重连时补发之后的事件
+            replay = self.feed.subscribe(last_event_id=1)
+            events.append(await next_event(replay))
+            for stream in (first, second, replay):
+                await stream.aclose()
+            self.feed._task.cancel()
+            return events
+
+        with mock.patch.object(self.feed, 'compute', side_effect=compute):
+            events = asyncio.run(scenario())
+        # 两个订阅者的每次变化只计算一次
+        self.assertEqual(calls, [set(), {'BC1'}])
+        self.assertEqual(events[0], events[1])
+        self.assertTrue(events[0].startswith('id: 1\nevent: change\n'))
+        self.assertEqual(events[2], events[3])
+        self.assertEqual(events[2], 'id: 2\nevent: change\ndata: {"barcodes": ["BC1"]}\n\n')
+        self.assertEqual(events[4], events[2])
+
+
+class CachingTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        caching.reset_stats()
+
+    def test_bump_on_commit_once_per_transaction(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(3):
+                bump_on_commit(DeviceArrival)
+            self.assertEqual(get_version(DeviceArrival).version, 0)
+        self.assertEqual(get_version(DeviceArrival).version, 1)
+
+    def test_cached_until_tables_change(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return DeviceArrival.objects.count()
+
+        self.assertEqual(caching.cached_for_models('arrivals', [DeviceArrival], ['x'], compute), 0)
+        self.assertEqual(caching.cached_for_models('arrivals', [DeviceArrival], ['x'], compute), 0)
+        self.assertEqual(len(calls), 1)
+
+        # 写入后版本号变化，旧缓存不再被读取
+        with self.captureOnCommitCallbacks(execute=True):
+            create_arrivals(None, 2)
+        self.assertEqual(caching.cached_for_models('arrivals', [DeviceArrival], ['x'], compute), 2)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(caching.get_stats()['arrivals'], {'hits': 1, 'misses': 2, 'hit_rate': 0.3333})
+
+    def test_key_depends_on_versions_and_parts(self):
+        versions = caching.get_versions(DeviceArrival, DeviceSecurityStatus)
+        self.assertEqual(versions, [0, 0])
+        key = caching.make_key('ns', versions, 'a', 1)
+        self.assertEqual(key, caching.make_key('ns', [0, 0], 'a', 1))
+        self.assertNotEqual(key, caching.make_key('ns', [0, 1], 'a', 1))
+        self.assertNotEqual(key, caching.make_key('ns', versions, 'a', 2))
+
+    def test_none_not_cached(self):
+        compute = mock.Mock(return_value=None)
+        for _ in range(2):
+            self.assertIsNone(caching.get_or_compute('ns', 'ns:key', compute))
+        self.assertEqual(compute.call_count, 2)
+
+    @override_settings(ACTIVITY_LOG_ASYNC=False)
+    def test_stats_view_staff_only(self):
+        user = User.objects.create_user('viewer', password='secret')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(reverse('cache_stats')).status_code, 403)
+        user.is_staff = True
+        user.save()
+        response = self.client.get(reverse('cache_stats'))
+        self.assertEqual(response.json()['backend'], 'locmem')
+
+
+class ActivityLogTestMixin:
+
+    def setUp(self):
+        super().setUp()
+        # 进程内的用户代理缓存不随测试事务回滚
+        activity_log._user_agents.clear()
+        self.addCleanup(activity_log._user_agents.clear)
+        self.user = User.objects.create_user('operator', password='secret')
+
+    def make_record(self, action_type='VIEW', content_type='SYSTEM', object_id=None, description='',
+                    user_agent='Mozilla/5.0', timestamp=None):
+        return {
+            'user_id': self.user.pk,
+            'action_type': action_type,
+            'content_type': content_type,
+            'object_id': object_id,
+            'description': description,
+            'ip_address': '127.0.0.1',
+            'user_agent': user_agent,
+            'timestamp': timestamp or timezone.now(),
+        }
+
+
+class ActivityLogWriterTests(ActivityLogTestMixin, TestCase):
+
+    def make_writer(self, maxsize):
+        """不启动后台线程的写入器，由测试直接调用 _collect/_flush"""
+        writer = activity_log.ActivityLogWriter()
+        writer._pid = os.getpid()
+        writer._queue = queue.Queue(maxsize=maxsize)
+        return writer
+
+    @override_settings(ACTIVITY_LOG_OVERFLOW='drop')
+    def test_overflow_drops_and_counts(self):
+        writer = self.make_writer(2)
+        results = [writer.enqueue(self.make_record()) for _ in range(3)]
+        self.assertEqual(results, [True, True, False])
+        self.assertEqual(writer.get_stats(), {'pending': 2, 'written': 0, 'dropped': 1, 'failed': 0})
+
+    @override_settings(ACTIVITY_LOG_OVERFLOW='block', ACTIVITY_LOG_BLOCK_SECONDS=0.01)
+    def test_overflow_blocks_then_drops(self):
+        writer = self.make_writer(1)
+        self.assertTrue(writer.enqueue(self.make_record()))
+        self.assertFalse(writer.enqueue(self.make_record()))
+        self.assertEqual(writer.get_stats()['dropped'], 1)
+
+    @override_settings(ACTIVITY_LOG_BATCH_SIZE=2, ACTIVITY_LOG_FLUSH_MS=10)
+    def test_collect_batches_and_stop(self):
+        writer = self.make_writer(10)
+        for _ in range(3):
+            writer.enqueue(self.make_record())
+        writer._queue.put(activity_log._STOP)
+        self.assertEqual(len(writer._collect(writer._queue)[0]), 2)
+        batch, stopping = writer._collect(writer._queue)
+        self.assertEqual((len(batch), stopping), (1, True))
+
+    def test_flush_writes_batch(self):
+        writer = self.make_writer(10)
+        timestamp = timezone.now() - timedelta(minutes=5)
+        writer._flush([self.make_record('LOGIN', 'USER', timestamp=timestamp), self.make_record()])
+        self.assertEqual(writer.get_stats()['written'], 2)
+        # 时间戳是入队时确定的，不是写入时间
+        self.assertEqual(UserActivityLog.objects.get(action_type='LOGIN').timestamp, timestamp)
+
+    def test_flush_failure_counted(self):
+        writer = self.make_writer(10)
+        with mock.patch.object(activity_log, 'write', side_effect=IntegrityError), self.assertLogs(activity_log.logger, 'ERROR'):
+            writer._flush([self.make_record(), self.make_record()])
+        self.assertEqual(writer.get_stats(), {'pending': 0, 'written': 0, 'dropped': 0, 'failed': 2})
+
+    @override_settings(ACTIVITY_LOG_ASYNC=True)
+    def test_log_activity_enqueues_when_async(self):
+        with mock.patch.object(activity_log.writer, 'enqueue') as enqueue:
+            activity_log.log_activity(self.user, 'EXPORT', 'DEVICE_ARRIVAL', 3)
+        self.assertEqual(enqueue.call_args.args[0]['object_id'], '3')
+        self.assertFalse(UserActivityLog.objects.exists())
+
+    @override_settings(ACTIVITY_LOG_ASYNC=False)
+    def test_log_activity_writes_when_sync(self):
+        activity_log.log_activity(self.user, 'EXPORT', 'DEVICE_ARRIVAL', 3, user_agent='Mozilla/5.0')
+        log = UserActivityLog.objects.get()
+        self.assertEqual((log.user, log.action_type, log.object_id), (self.user, 'EXPORT', '3'))
+
+
+@override_settings(ACTIVITY_LOG_ASYNC=False)
+class ActivityRouteTests(ActivityLogTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        UserActivityLog.objects.all().delete()
+
+    def logged(self):
+        return list(UserActivityLog.objects.order_by('id').values_list('content_type', 'action_type', 'object_id'))
+
+    def test_route_table_classification(self):
+        table = build_route_table()
+        routes = {
+            key: (table[key].content_type, table[key].action_type)
+            for key in [
+                ('device_arrival_list', 'GET'), ('device_delivery_update', 'GET'), ('device_delivery_update', 'POST'),
+                ('device_security_status_delete', 'POST'), ('device_arrival_export', 'GET'),
+                ('status_history', 'GET'), ('change_password', 'POST'), ('admin:core_devicearrival_add', 'POST'),
+                ('dashboard', 'GET'),
+            ]
+        }
+        self.assertEqual(routes, {
+            ('device_arrival_list', 'GET'): ('DEVICE_ARRIVAL', 'VIEW'),
+            ('device_delivery_update', 'GET'): ('DEVICE_DELIVERY', 'VIEW'),
+            ('device_delivery_update', 'POST'): ('DEVICE_DELIVERY', 'UPDATE'),
+            ('device_security_status_delete', 'POST'): ('DEVICE_SECURITY', 'DELETE'),
+            ('device_arrival_export', 'GET'): ('DEVICE_ARRIVAL', 'EXPORT'),
+            ('status_history', 'GET'): ('DEVICE_SECURITY', 'VIEW'),
+            ('change_password', 'POST'): ('USER', 'CREATE'),
+            ('admin:core_devicearrival_add', 'POST'): ('DEVICE_ARRIVAL', 'CREATE'),
+            ('dashboard', 'GET'): ('SYSTEM', 'VIEW'),
+        })
+        self.assertNotIn(('login', 'POST'), table)
+
+    def test_middleware_logs_resolved_route(self):
+        arrival = create_arrivals(self.user, 1)[0]
+        self.client.get(reverse('device_arrival_list'))
+        self.client.post(reverse('device_arrival_delete', args=[arrival.pk]))
+        self.assertEqual(self.logged(), [('DEVICE_ARRIVAL', 'VIEW', None), ('DEVICE_ARRIVAL', 'DELETE', str(arrival.pk))])
+
+    def test_unresolved_and_anonymous_not_logged(self):
+        self.assertEqual(self.client.get('/no-such-page/').status_code, 404)
+        self.client.logout()
+        UserActivityLog.objects.all().delete()
+        self.client.get(reverse('device_arrival_list'))
+        self.assertEqual(self.logged(), [])
+
+    def test_login_logged_once(self):
+        self.client.logout()
+        UserActivityLog.objects.all().delete()
+        self.client.post(reverse('login'), {'username': 'operator', 'password': 'secret'})
+        self.assertEqual(self.logged(), [('USER', 'LOGIN', None)])
+
+
+class ActivityPolicyTests(TestCase):
+
+    def route(self, policy, view_name='dashboard_status'):
+        return ActivityRoute(view_name, 'SYSTEM', 'VIEW', policy)
+
+    @override_settings(ACTIVITY_LOG_VIEW_POLICY='sample', ACTIVITY_LOG_ROUTE_POLICIES={
+        'dashboard_status': 'dedupe', 'status_trend': {'VIEW': 'skip', 'EXPORT': 'always'},
+    })
+    def test_view_policy_overrides(self):
+        self.assertEqual(get_policy('dashboard_status', 'VIEW'), 'dedupe')
+        self.assertEqual(get_policy('status_trend', 'VIEW'), 'skip')
+        self.assertEqual(get_policy('status_trend', 'EXPORT'), 'always')
+        self.assertEqual(get_policy('device_arrival_list', 'VIEW'), 'sample')
+
+    @override_settings(ACTIVITY_LOG_VIEW_POLICY='skip', ACTIVITY_LOG_ROUTE_POLICIES={'device_arrival_delete': 'skip'})
+    def test_other_actions_always_logged(self):
+        # 字符串策略和全局的查看策略都不作用于写操作
+        self.assertEqual(get_policy('device_arrival_delete', 'DELETE'), 'always')
+        self.assertEqual(get_policy('device_arrival_export', 'EXPORT'), 'always')
+
+    def test_rejects_dropping_other_actions(self):
+        with override_settings(ACTIVITY_LOG_ROUTE_POLICIES={'device_arrival_export': {'EXPORT': 'dedupe'}}):
+            with self.assertRaises(ValueError):
+                get_policy('device_arrival_export', 'EXPORT')
+            with self.assertRaises(ValueError):
+                build_route_table()
+        with override_settings(ACTIVITY_LOG_ROUTE_POLICIES={'dashboard_status': 'never'}):
+            with self.assertRaises(ValueError):
+                get_policy('dashboard_status', 'VIEW')
+
+    @override_settings(ACTIVITY_LOG_DEDUPE_SECONDS=300)
+    def test_throttle_dedupe_per_user(self):
+        throttle = ActivityThrottle()
+        route = self.route('dedupe')
+        self.assertEqual([throttle.allow(route, user_id) for user_id in (1, 1, 2)], [True, False, True])
+
+    @override_settings(ACTIVITY_LOG_SAMPLE_RATE=0.5)
+    def test_throttle_sample_and_skip(self):
+        throttle = ActivityThrottle()
+        with mock.patch('core.activity_routes.random.random', side_effect=[0.2, 0.7]):
+            self.assertEqual([throttle.allow(self.route('sample'), 1) for _ in range(2)], [True, False])
+        self.assertFalse(throttle.allow(self.route('skip', 'job_status'), 1))
+        self.assertTrue(throttle.allow(self.route('always', 'dashboard'), 1))
+        stats = throttle.get_stats()
+        self.assertEqual((stats['logged'], stats['suppressed']), (2, 2))
+        self.assertEqual(stats['routes'][0], {
+            'route': 'dashboard_status', 'action_type': 'VIEW', 'policy': 'sample', 'logged': 1, 'suppressed': 1,
+        })
+
+    @override_settings(ACTIVITY_LOG_ASYNC=False)
+    def test_stats_view_staff_only(self):
+        user = User.objects.create_user('viewer', password='secret')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(reverse('activity_log_stats')).status_code, 403)
+        user.is_staff = True
+        user.save()
+        data = self.client.get(reverse('activity_log_stats')).json()
+        self.assertEqual(set(data), {'pid', 'writer', 'events'})
+
+
+@override_settings(ACTIVITY_LOG_ASYNC=False)
+class LogArchiveTests(ActivityLogTestMixin, TempDirMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        settings_override = override_settings(ACTIVITY_LOG_ARCHIVE_DIR=self.make_temp_dir())
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.now = timezone.now()
+        self.cutoff = log_archive.get_cutoff(days=30, now=self.now)
+        activity_log.write(
+            [self.make_record('LOGIN', 'USER', timestamp=self.cutoff - timedelta(days=2, hours=i)) for i in range(3)]
+            + [self.make_record('UPDATE', 'DEVICE_ARRIVAL', '7', description='手工说明', timestamp=self.cutoff - timedelta(days=1))]
+            + [self.make_record('VIEW', 'SYSTEM', timestamp=self.now)]
+        )
+
+    def test_dry_run_only_counts(self):
+        self.assertEqual(log_archive.archive(self.cutoff, dry_run=True), (4, 0))
+        self.assertEqual(UserActivityLog.objects.count(), 5)
+
+    def test_round_trip(self):
+        archived, partitions = log_archive.archive(self.cutoff, batch_size=2)
+        self.assertEqual(archived, 4)
+        self.assertEqual(partitions, len(log_archive.list_partitions()))
+        self.assertEqual(list(UserActivityLog.objects.values_list('action_type', flat=True)), ['VIEW'])
+
+        result = log_archive.search(limit=10)
+        logs = result['logs']
+        self.assertEqual(len(logs), 4)
+        self.assertFalse(result['has_more'])
+        self.assertEqual([log['timestamp'] for log in logs], sorted(log['timestamp'] for log in logs))
+        # 归档文件保存完整的描述和用户代理
+        self.assertEqual(logs[0]['description'], '用户登录')
+        self.assertEqual(logs[0]['user_agent'], 'Mozilla/5.0')
+        self.assertEqual(logs[0]['username'], 'operator')
+        self.assertEqual(logs[-1]['description'], '手工说明')
+
+        for _, path in log_archive.list_partitions():
+            with gzip.open(path, 'rt', encoding='utf-8') as archive:
+                self.assertTrue(all(json.loads(line) for line in archive))
+
+    def test_search_pages_and_filters(self):
+        log_archive.archive(self.cutoff)
+        first = log_archive.search(limit=2)
+        self.assertTrue(first['has_more'])
+        second = log_archive.search(cursor=first['cursor'], limit=2)
+        self.assertEqual(len(first['logs'] + second['logs']), 4)
+        self.assertEqual(len({log['id'] for log in first['logs'] + second['logs']}), 4)
+        self.assertEqual(len(log_archive.search(query='登录')['logs']), 3)
+        self.assertEqual(len(log_archive.search(action_type='UPDATE')['logs']), 1)
+        start = self.cutoff - timedelta(days=1, hours=1)
+        self.assertEqual([log['action_type'] for log in log_archive.search(start=start)['logs']], ['UPDATE'])
+
+    def test_archived_rows_leave_search_index(self):
+        self.assertEqual(UserActivityLog.objects.filter(search.search_filter(UserActivityLog, '手工说明')).count(), 1)
+        log_archive.archive(self.cutoff)
+        self.assertFalse(UserActivityLog.objects.filter(search.search_filter(UserActivityLog, '手工说明')).exists())
+
+    def test_command_and_view(self):
+        out = io.StringIO()
+        call_command('archive_activity_logs', '--days', '30', stdout=out)
+        self.assertIn('4 条日志', out.getvalue())
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('activity_log_archive'), {'action_type': 'UPDATE'})
+        self.assertEqual([log['object_id'] for log in response.json()['logs']], ['7'])
+        self.assertEqual(self.client.get(reverse('activity_log_archive'), {'limit': 'x'}).status_code, 400)
+
+    def test_rearchive_after_interruption_is_deduplicated(self):
+        # 模拟写入归档后、删除记录前中断：同一批记录再次归档
+        rows = list(UserActivityLog.objects.filter(timestamp__lt=self.cutoff).values(*log_archive.ARCHIVE_FIELDS))
+        log_archive.write_partitions(rows)
+        log_archive.archive(self.cutoff)
+        self.assertEqual(len(log_archive.search(limit=100)['logs']), 4)
+
+
+class DerivedActivityLogTests(ActivityLogTestMixin, TestCase):
+
+    def make_writer(self):
+        writer = activity_log.ActivityLogWriter()
+        writer._pid = os.getpid()
+        writer._queue = queue.Queue()
+        return writer
+
+    def test_flush_interns_and_derives(self):
+        writer = self.make_writer()
+        writer._flush([
+            self.make_record('UPDATE', 'DEVICE_ARRIVAL', '12', description=UserActivityLog.describe('UPDATE', 'DEVICE_ARRIVAL', '12')),
+            self.make_record('OTHER', 'SYSTEM', description='手工说明'),
+            self.make_record(user_agent='curl/8.0'),
+        ])
+        self.assertEqual(writer.get_stats()['written'], 3)
+        logs = list(UserActivityLog.objects.order_by('id'))
+        # 可生成的描述不保存，显示时生成
+        self.assertEqual(logs[0].description, '')
+        self.assertEqual(logs[0].get_description(), '更新了设备到货记录 ID:12')
+        self.assertEqual(logs[1].description, '手工说明')
+        self.assertEqual(UserAgent.objects.count(), 2)
+        self.assertEqual(logs[0].user_agent_id, logs[1].user_agent_id)
+
+    def test_intern_user_agents_uses_cache(self):
+        first = activity_log.intern_user_agents(['Mozilla/5.0', 'Mozilla/5.0', ''])
+        self.assertEqual(list(first), ['Mozilla/5.0'])
+        with self.assertNumQueries(0):
+            self.assertEqual(activity_log.intern_user_agents(['Mozilla/5.0']), first)
+        activity_log._user_agents.clear()
+        # 缓存清空后按摘要找到已有的行，不重复插入
+        self.assertEqual(activity_log.intern_user_agents(['Mozilla/5.0']), first)
+        self.assertEqual(UserAgent.objects.count(), 1)
+
+    def test_search_matches_derived_description(self):
+        activity_log.write([
+            self.make_record('LOGIN', 'USER'),
+            self.make_record('IMPORT', 'DEVICE_ARRIVAL'),
+            self.make_record('UPDATE', 'DEVICE_DELIVERY', '4521'),
+        ])
+
+        def matching(query):
+            return set(UserActivityLog.objects.filter(search.search_filter(UserActivityLog, query)).values_list('action_type', flat=True))
+
+        self.assertEqual(matching('登录'), {'LOGIN'})
+        self.assertEqual(matching('导入了设备到货记录'), {'IMPORT'})
+        self.assertEqual(matching('出货记录 ID:45'), {'UPDATE'})
+        self.assertEqual(matching('到货'), {'IMPORT'})
+        self.assertEqual(matching('不存在的关键词'), set())
+
+
+class UserAgentMigrationTests(TransactionTestCase):
+    """0016 迁移把已有日志的用户代理写入 UserAgent 表，可生成的描述置空"""
+    migrate_from = ('core', '0015_activity_log_timestamp')
+    migrate_to = ('core', '0016_user_agent_and_derived_descriptions')
+
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate([target])
+        return executor.loader.project_state(target).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        self.migrate(executor.loader.graph.leaf_nodes('core')[0])
+        super().tearDown()
+
+    def test_backfill_existing_rows(self):
+        apps = self.migrate(self.migrate_from)
+        OldUser = apps.get_model('core', 'User')
+        OldLog = apps.get_model('core', 'UserActivityLog')
+        user = OldUser.objects.create(username='legacy')
+        firefox = 'Mozilla/5.0 Firefox/120.0'
+        OldLog.objects.bulk_create([
+            OldLog(user=user, action_type='LOGIN', content_type='USER', description='用户登录', user_agent=firefox),
+            OldLog(user=user, action_type='UPDATE', content_type='DEVICE_ARRIVAL', object_id='3',
+                   description='更新了设备到货记录 ID:3', user_agent=firefox),
+            OldLog(user=user, action_type='OTHER', content_type='SYSTEM', description='手工说明', user_agent='curl/8.0'),
+            OldLog(user=user, action_type='VIEW', content_type='SYSTEM', description='查看了系统', user_agent=''),
+        ])
+
+        apps = self.migrate(self.migrate_to)
+        NewLog = apps.get_model('core', 'UserActivityLog')
+        NewAgent = apps.get_model('core', 'UserAgent')
+        self.assertEqual(set(NewAgent.objects.values_list('value', flat=True)), {firefox, 'curl/8.0'})
+        rows = list(NewLog.objects.order_by('id').values_list('description', 'user_agent__value'))
+        self.assertEqual(rows, [('', firefox), ('', firefox), ('手工说明', 'curl/8.0'), ('', None)])
+
+        # 回滚时写回原来的描述和用户代理
+        apps = self.migrate(self.migrate_from)
+        OldLog = apps.get_model('core', 'UserActivityLog')
+        rows = list(OldLog.objects.order_by('id').values_list('description', 'user_agent'))
+        self.assertEqual(rows[1], ('更新了设备到货记录 ID:3', firefox))
+        self.assertEqual(rows[3][0], '查看了系统')
+        self.assertFalse(rows[3][1])
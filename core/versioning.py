@@ -0,0 +1,85 @@
+"""数据表版本号
+
+post_save/post_delete 信号和批量导入都会递增表的版本号。信号触发的递增在事务提交后
+合并执行，批量删除等同一事务内的多次写入只递增一次；批量写入期间用 bulk_changes()
+暂停逐行递增，结束时每张表只递增一次。只需暂停、由调用方决定何时递增时用 suppress_bumps()。
+"""
+import threading
+from contextlib import contextmanager
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import DeviceArrival, DeviceDelivery, DeviceSecurityStatus, TableVersion
+
+# 跟踪版本号的设备数据表
+TRACKED_MODELS = (DeviceArrival, DeviceDelivery, DeviceSecurityStatus)
+
+_state = threading.local()
+
+
+def get_table_label(model):
+    return model._meta.label
+
+
+def bump_version(model):
+    """递增表的版本号"""
+    table = get_table_label(model)
+    updated = TableVersion.objects.filter(table=table).update(
+        version=F('version') + 1, updated_at=timezone.now(),
+    )
+    if not updated:
+        try:
+            TableVersion.objects.create(table=table, version=1)
+        except IntegrityError:
+            # 其他进程已创建该记录
+            bump_version(model)
+
+
+def flush_pending_bumps():
+    pending = getattr(_state, 'pending', set())
+    _state.pending = set()
+    for model in pending:
+        bump_version(model)
+
+
+def bump_on_commit(model):
+    """事务提交后递增版本号，同一事务内的多次调用只递增一次"""
+    if not hasattr(_state, 'pending'):
+        _state.pending = set()
+    _state.pending.add(model)
+    transaction.on_commit(flush_pending_bumps)
+
+
+def get_version(model):
+    """返回表的版本记录；从未写入过的表返回版本号为 0 的未保存记录"""
+    table = get_table_label(model)
+    return TableVersion.objects.filter(table=table).first() or TableVersion(table=table, version=0)
+
+
+def is_suppressed(model):
+    return get_table_label(model) in getattr(_state, 'suppressed', ())
+
+
+@contextmanager
+def suppress_bumps(*models):
+    """期间不逐行递增版本号，结束时也不递增"""
+    previous = getattr(_state, 'suppressed', frozenset())
+    _state.suppressed = previous | {get_table_label(model) for model in models}
+    try:
+        yield
+    finally:
+        _state.suppressed = previous
+
+
+@contextmanager
+def bulk_changes(*models):
+    """批量写入期间不逐行递增版本号，结束时(包括出错时)每张表递增一次"""
+    try:
+        with suppress_bumps(*models):
+            yield
+    finally:
+        for model in models:
+            if not is_suppressed(model):
+                bump_version(model)
@@ -1,3 +1,6 @@
+import os
+from datetime import timedelta
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, logout, update_session_auth_hash
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
@@ -6,15 +9,36 @@ from django.contrib.auth.forms import AuthenticationForm, PasswordChangeForm
 from django.contrib import messages
 from django.views.generic import TemplateView, ListView, DetailView, CreateView, UpdateView, DeleteView, View, FormView
 from django import forms
-from django.urls import reverse_lazy
-from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
+from django.urls import reverse, reverse_lazy
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, HttpResponseRedirect, JsonResponse, FileResponse, Http404, StreamingHttpResponse
 from import_export.formats import base_formats
-from tablib import Dataset
 from django.db import models
+from django.conf import settings
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import urlencode
 
-from .models import User, DeviceArrival, DeviceDelivery, DeviceSecurityStatus, UserActivityLog
+from .models import User, DeviceArrival, DeviceDelivery, DeviceSecurityStatus, UserActivityLog, BackgroundJob
 from .resources import DeviceArrivalResource, DeviceDeliveryResource, DeviceSecurityStatusResource
+from .dashboard import get_backend as get_dashboard_backend, get_window_hours
+from .delta import DEFAULT_LIMIT as DEFAULT_DELTA_LIMIT, fetch_delta
+from .export_cache import ExportCacheEntry
+from .exporters import STREAM_FORMATS, parse_export_fields, stream_export
+from .filters import DeviceArrivalQuery, DeviceDeliveryQuery, DeviceSecurityStatusQuery
+from .importers import ImportSummary, StagingNotFound
+from .jobs import JOB_TARGETS, enqueue_export, enqueue_import_apply, enqueue_import_stage, get_job_stats
+from . import barcodes
+from . import caching, live, log_archive, rollups, status_history
+from .activity_log import writer as activity_log_writer
+from .activity_routes import throttle as activity_throttle
+from .pagination import (
+    PAGE_WINDOW, CachedCount, CachedCountPaginator, InvalidCursor as InvalidPageCursor, KeysetPaginator,
+)
+from .rollups import start_of_day
+from .search import search_filter
+from .versioning import TRACKED_MODELS, get_version
 
 # Authentication Views
 class RegisterForm(forms.ModelForm):
@@ -103,43 +127,276 @@ def change_password(request):
         form = PasswordChangeForm(request.user)
     return render(request, 'core/change_password.html', {'form': form})
 
+def render_import_preview(request, job):
+    """根据导入校验任务的结果渲染预览页"""
+    target = JOB_TARGETS[job.target]
+    importer_class = target['importer_class']
+    summary = ImportSummary.from_dict(job.result)
+    # 预览样例按列顺序展示
+    fields = list(importer_class.columns.values())
+    samples = [
+        (row_number, action, [values.get(field) for field in fields])
+        for row_number, action, values in summary.samples
+    ]
+    return render(request, 'core/import_preview.html', {
+        'summary': summary,
+        'samples': samples,
+        'headers': list(importer_class.columns),
+        'import_title': target['label'],
+        'import_url_name': f'{job.target}_import',
+    })
+
+class ExcelImportMixin:
+    """Excel流式分块导入的通用处理
+
+    第一步上传文件，由后台任务只解析校验一次并生成预览；第二步凭令牌确认，
+    由后台任务直接写入暂存的行。
+    """
+    job_target = None
+    
+    def post(self, request, *args, **kwargs):
+        import_url = reverse_lazy(f'{self.job_target}_import')
+        token = request.POST.get('token')
+        if token:
+            return self.confirm(request, token)
+        
+        # 获取上传的文件
+        import_file = request.FILES.get('import_file')
+        if not import_file:
+            messages.error(request, "请选择上传文件")
+            return HttpResponseRedirect(import_url)
+        
+        # 检查文件类型，只读模式仅支持 xlsx
+        if not import_file.name.endswith('.xlsx'):
+            messages.error(request, "只接受Excel文件(.xlsx)")
+            return HttpResponseRedirect(import_url)
+        
+        job = enqueue_import_stage(request.user, self.job_target, import_file)
+        return redirect('job_detail', pk=job.pk)
+    
+    def confirm(self, request, token):
+        """确认或取消已暂存的导入"""
+        importer = JOB_TARGETS[self.job_target]['importer_class'](user=request.user)
+        if 'cancel' in request.POST:
+            importer.discard(token)
+            messages.info(request, "已取消导入")
+            return HttpResponseRedirect(reverse_lazy(f'{self.job_target}_import'))
+        
+        try:
+            importer.load_staged(token)
+        except StagingNotFound:
+            messages.error(request, "导入预览已失效，请重新上传文件")
+            return HttpResponseRedirect(reverse_lazy(f'{self.job_target}_import'))
+        
+        job = enqueue_import_apply(request.user, self.job_target, token)
+        return redirect('job_detail', pk=job.pk)
+
+class ExportMixin:
+    """设备清单导出
+
+    带 format 参数(xlsx/csv/csv.gz)时边查询边输出文件，内存占用与数据量无关；
+    否则创建后台导出任务(格式由 job_format 参数指定，默认 xlsx)，完成后在任务页面下载。
+    两种方式都接受列表页的筛选参数和 fields 列选择参数。
+    """
+    job_target = None
+    
+    def get(self, request, *args, **kwargs):
+        target = JOB_TARGETS[self.job_target]
+        # 与列表页相同的筛选条件，只导出匹配的记录
+        query = target['query_class'](request.GET)
+        # fields 参数指定要导出的列，数据库只查询这些列
+        fields = parse_export_fields(target['resource_class'](), request.GET.getlist('fields'))
+        export_format = request.GET.get('format')
+        if export_format:
+            return self.stream(export_format, query, fields)
+        job_format = request.GET.get('job_format', 'xlsx')
+        if job_format not in STREAM_FORMATS:
+            raise Http404("不支持的导出格式")
+        job = enqueue_export(request.user, self.job_target, filters=query.params, fields=fields, export_format=job_format)
+        return redirect('job_detail', pk=job.pk)
+    
+    def stream(self, export_format, query, fields):
+        if export_format not in STREAM_FORMATS:
+            raise Http404("不支持的导出格式")
+        target = JOB_TARGETS[self.job_target]
+        content_type, extension = STREAM_FORMATS[export_format]
+        # 先读取版本号再查询，查询期间有写入时新版本不会命中这份缓存
+        entry = ExportCacheEntry(
+            self.job_target, get_version(target['model']), query.params, fields, export_format,
+        )
+        not_modified = get_conditional_response(
+            self.request, etag=entry.etag, last_modified=entry.last_modified and entry.last_modified.timestamp(),
+        )
+        if not_modified is not None:
+            return not_modified
+        
+        response = None
+        if entry.exists():
+            try:
+                response = FileResponse(entry.open(), content_type=content_type)
+            except FileNotFoundError:
+                # 文件刚被清理，重新生成
+                pass
+        if response is None:
+            queryset = query.get_queryset().order_by('id')
+            response = StreamingHttpResponse(
+                entry.tee(stream_export(target['resource_class'](), queryset, export_format, fields=fields)),
+                content_type=content_type,
+            )
+        filename = f"{os.path.splitext(target['export_filename'])[0]}.{extension}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        response['ETag'] = entry.etag
+        if entry.last_modified_header:
+            response['Last-Modified'] = entry.last_modified_header
+        # 需要登录才能下载，只允许浏览器私有缓存，且每次使用前校验
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+class DeltaExportMixin:
+    """增量导出：返回 cursor 之后变化和删除的记录，以及新的游标"""
+    job_target = None
+    
+    def get(self, request, *args, **kwargs):
+        target = JOB_TARGETS[self.job_target]
+        try:
+            limit = int(request.GET.get('limit', DEFAULT_DELTA_LIMIT))
+            delta = fetch_delta(target['model'], target['resource_class'](), request.GET.get('cursor'), limit)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        return JsonResponse(delta, json_dumps_params={'ensure_ascii': False})
+
+class KeysetPaginationMixin:
+    """列表分页：默认按 keyset_ordering 做键集分页，总数缓存或估算，页码只显示当前页附近的窗口
+
+    settings.LIST_PAGINATION 为 'offset' 时使用页码分页。
+    """
+    keyset_ordering = ('-created_at', '-id')
+    # 模板用到的字段，关联字段写作 外键__字段；为空时查询全部字段
+    list_fields = ()
+    # 每页条数上限
+    max_paginate_by = 100
+    
+    def get_paginate_by(self, queryset=None):
+        """允许用户选择每页显示的记录数，无法解析时使用默认值"""
+        try:
+            per_page = int(self.request.GET.get('per_page', self.paginate_by))
+        except (TypeError, ValueError):
+            return self.paginate_by
+        return max(1, min(per_page, self.max_paginate_by))
+    
+    def project(self, queryset):
+        """只查询模板用到的字段，关联对象用 JOIN 一起取出，每页的查询数与行数无关"""
+        if not self.list_fields:
+            return queryset
+        related = {field.split('__')[0] for field in self.list_fields if '__' in field}
+        # 分页游标需要排序字段
+        ordering = [field.lstrip('-') for field in self.keyset_ordering]
+        return queryset.select_related(*related).only(*self.list_fields, *related, *ordering)
+    
+    def get_count_version(self, queryset):
+        """总数缓存使用的表版本号，未跟踪版本号的表只按缓存时间过期"""
+        if queryset.model in TRACKED_MODELS:
+            return get_version(queryset.model).version
+        return None
+    
+    def get_counter(self, queryset):
+        return CachedCount(queryset, version=self.get_count_version(queryset))
+    
+    def use_keyset(self):
+        return getattr(settings, 'LIST_PAGINATION', 'keyset') != 'offset'
+    
+    def get_paginator(self, queryset, per_page, orphans=0, allow_empty_first_page=True, **kwargs):
+        return CachedCountPaginator(
+            queryset, per_page, orphans=orphans, allow_empty_first_page=allow_empty_first_page,
+            counter=self.get_counter(queryset), **kwargs
+        )
+    
+    def paginate_queryset(self, queryset, page_size):
+        if not self.use_keyset():
+            return super().paginate_queryset(queryset, page_size)
+        paginator = KeysetPaginator(
+            queryset, page_size, self.keyset_ordering, counter=self.get_counter(queryset),
+        )
+        try:
+            page = paginator.page(self.request.GET.get('cursor'))
+        except InvalidPageCursor:
+            raise Http404("分页游标无效")
+        return paginator, page, page.object_list, page.has_other_pages()
+    
+    def get_page_url(self, name=None, value=None):
+        """保留其他查询参数，只替换分页参数"""
+        params = self.request.GET.copy()
+        params.pop('page', None)
+        params.pop('cursor', None)
+        if value:
+            params[name] = value
+        return f'?{params.urlencode()}'
+    
+    def get_pagination_links(self, page):
+        """首页/上一页/下一页/末页链接和当前页附近的页码窗口"""
+        links = {'first': None, 'previous': None, 'next': None, 'last': None, 'window': []}
+        if self.use_keyset():
+            if page.has_previous():
+                links['first'] = self.get_page_url()
+                links['previous'] = self.get_page_url('cursor', page.previous_cursor())
+            if page.has_next():
+                links['next'] = self.get_page_url('cursor', page.next_cursor())
+                links['last'] = self.get_page_url('cursor', page.last_cursor())
+            links['window'] = [
+                (number, None if cursor == '' else self.get_page_url('cursor', cursor))
+                for number, cursor in page.get_window()
+            ]
+            return links
+        
+        if page.has_previous():
+            links['first'] = self.get_page_url()
+            links['previous'] = self.get_page_url('page', page.previous_page_number())
+        if page.has_next():
+            links['next'] = self.get_page_url('page', page.next_page_number())
+            links['last'] = self.get_page_url('page', page.paginator.num_pages)
+        first = max(1, page.number - PAGE_WINDOW)
+        last = min(page.paginator.num_pages, page.number + PAGE_WINDOW)
+        links['window'] = [
+            (number, None if number == page.number else self.get_page_url('page', number))
+            for number in range(first, last + 1)
+        ]
+        return links
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        if context.get('page_obj') is not None:
+            context['page_links'] = self.get_pagination_links(context['page_obj'])
+        return context
+
 # Dashboard View
 class DashboardView(LoginRequiredMixin, TemplateView):
     template_name = 'core/dashboard.html'
 
 # 设备到货清单视图
-class DeviceArrivalListView(LoginRequiredMixin, ListView):
+class DeviceArrivalListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     model = DeviceArrival
     template_name = 'core/device_arrival_list.html'
     context_object_name = 'device_arrivals'
     paginate_by = 50  # 默认每页显示50条记录
-    
-    def get_paginate_by(self, queryset):
-        """允许用户选择每页显示的记录数"""
-        return self.request.GET.get('per_page', self.paginate_by)
+    query_class = DeviceArrivalQuery  # 列表和导出共用的查询条件
+    # 模板显示的字段，创建人与记录一起查询
+    list_fields = ('project_name', 'arrival_date', 'device_model', 'barcode', 'created_at', 'created_by__username')
     
     def get_queryset(self):
-        queryset = DeviceArrival.objects.all()  # 所有用户都能看到所有记录
-        
-        # 搜索功能
-        query = self.request.GET.get('q', '')
-        if query:
-            queryset = queryset.filter(
-                # 在多个字段中搜索
-                models.Q(project_name__icontains=query) |
-                models.Q(device_model__icontains=query) |
-                models.Q(barcode__icontains=query)
-            )
+        # 搜索条件与导出共用
+        queryset = self.query_class(self.request.GET).get_queryset()
         
         # 按照创建时间倒序排序
-        return queryset.order_by('-created_at')
+        return self.project(queryset).order_by(*self.keyset_ordering)
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         # 将搜索关键词加入上下文
         context['query'] = self.request.GET.get('q', '')
-        context['per_page'] = self.request.GET.get('per_page', self.paginate_by)
+        context['per_page'] = self.get_paginate_by()
         context['per_page_options'] = [10, 20, 50, 100]
+        # 导出链接带上当前筛选条件
+        context['export_query'] = self.query_class(self.request.GET).urlencode()
         return context
 
 class DeviceArrivalCreateForm(forms.ModelForm):
@@ -178,11 +435,12 @@ class DeviceArrivalCreateView(LoginRequiredMixin, CreateView):
             # 设置条码初始值
             initial['barcode'] = barcode
             # 尝试查找对应的安装记录
-            installation = DeviceSecurityStatus.objects.filter(asset_serial_number=barcode).first()
-            if installation:
+            installations = barcodes.resolve(barcode)['installations']
+            if installations:
                 # 如果找到对应安装记录，可以提取一些信息
-                initial['device_model'] = installation.network_element_name.split('_')[-1] if '_' in installation.network_element_name else '未知型号'
-                initial['project_name'] = installation.network_element_name.split('_')[0] if '_' in installation.network_element_name else '未知项目'
+                network_element_name = installations[0]['network_element_name']
+                initial['device_model'] = network_element_name.split('_')[-1] if '_' in network_element_name else '未知型号'
+                initial['project_name'] = network_element_name.split('_')[0] if '_' in network_element_name else '未知项目'
                 initial['arrival_date'] = timezone.now().date()
         return initial
 
@@ -213,116 +471,46 @@ class DeviceArrivalDeleteView(LoginRequiredMixin, DeleteView):
             return DeviceArrival.objects.all()
         return DeviceArrival.objects.filter(created_by=self.request.user)
 
-class DeviceArrivalExportView(LoginRequiredMixin, View):
+class DeviceArrivalExportView(LoginRequiredMixin, ExportMixin, View):
     """设备到货清单导出视图"""
-    
-    def get(self, request, *args, **kwargs):
-        queryset = DeviceArrival.objects.all()  # 所有用户都能导出所有记录
-            
-        resource = DeviceArrivalResource()
-        dataset = resource.export(queryset)
-        
-        response = HttpResponse(content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
-        response["Content-Disposition"] = 'attachment; filename="device_arrivals.xlsx"'
-        response.content = dataset.export("xlsx")
-        return response
+    job_target = 'device_arrival'
+
+class DeviceArrivalDeltaView(LoginRequiredMixin, DeltaExportMixin, View):
+    """设备到货清单增量导出视图"""
+    job_target = 'device_arrival'
 
-class DeviceArrivalImportView(LoginRequiredMixin, TemplateView):
+class DeviceArrivalImportView(LoginRequiredMixin, ExcelImportMixin, TemplateView):
     """设备到货导入视图"""
     template_name = 'core/device_arrival_import.html'
-    
-    def post(self, request, *args, **kwargs):
-        resource = DeviceArrivalResource()
-        dataset = Dataset()
-        
-        # 获取上传的文件
-        import_file = request.FILES.get('import_file')
-        if not import_file:
-            messages.error(request, "请选择上传文件")
-            return HttpResponseRedirect(reverse_lazy('device_arrival_import'))
-        
-        try:
-            # 检查文件类型
-            if not import_file.name.endswith(('.xls', '.xlsx')):
-                messages.error(request, "只接受Excel文件(.xls, .xlsx)")
-                return HttpResponseRedirect(reverse_lazy('device_arrival_import'))
-            
-            # 尝试加载Excel内容
-            try:
-                imported_data = dataset.load(import_file.read(), format='xlsx')
-            except Exception as e:
-                messages.error(request, f"Excel文件读取失败: {str(e)}")
-                return HttpResponseRedirect(reverse_lazy('device_arrival_import'))
-            
-            # 关联创建者
-            def before_import(dataset, dry_run, **kwargs):
-                for row in dataset.dict:
-                    row['created_by'] = request.user.id
-            
-            # 设置导入前回调
-            result = resource.import_data(dataset, dry_run=True, before_import=before_import)
-            
-            # 检查导入结果
-            if result.has_errors():
-                # 汇总错误信息
-                error_rows = []
-                for error in result.row_errors():
-                    row_number = error[0]
-                    error_info = "、".join([f"{field}: {err.error}" for field, errors in error[1].items() for err in errors])
-                    error_rows.append(f"行 {row_number}: {error_info}")
-                
-                error_message = "、".join(error_rows[:10])
-                if len(error_rows) > 10:
-                    error_message += f"...等{len(error_rows)}个错误"
-                
-                messages.error(request, f"导入数据有错误: {error_message}")
-                return HttpResponseRedirect(reverse_lazy('device_arrival_import'))
-            
-            # 正式导入数据
-            result = resource.import_data(dataset, dry_run=False, before_import=before_import)
-            
-            # 导入成功
-            messages.success(request, f"成功导入{result.total_rows}行数据")
-            
-        except Exception as e:
-            messages.error(request, f"导入过程发生错误: {str(e)}")
-        
-        return HttpResponseRedirect(reverse_lazy('device_arrival_list'))
+    job_target = 'device_arrival'
 
 # 设备出货清单视图
-class DeviceDeliveryListView(LoginRequiredMixin, ListView):
+class DeviceDeliveryListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     model = DeviceDelivery
     template_name = 'core/device_delivery_list.html'
     context_object_name = 'device_deliveries'
     paginate_by = 50  # 默认每页显示50条记录
-    
-    def get_paginate_by(self, queryset):
-        """允许用户选择每页显示的记录数"""
-        return self.request.GET.get('per_page', self.paginate_by)
+    query_class = DeviceDeliveryQuery  # 列表和导出共用的查询条件
+    # 模板显示的字段，创建人与记录一起查询
+    list_fields = (
+        'delivery_date', 'device_model', 'barcode', 'recipient_unit', 'recipient', 'created_at', 'created_by__username',
+    )
     
     def get_queryset(self):
-        queryset = DeviceDelivery.objects.all()  # 所有用户都能看到所有记录
-        
-        # 搜索功能
-        query = self.request.GET.get('q', '')
-        if query:
-            queryset = queryset.filter(
-                # 在多个字段中搜索
-                models.Q(device_model__icontains=query) |
-                models.Q(barcode__icontains=query) |
-                models.Q(recipient_unit__icontains=query) |
-                models.Q(recipient__icontains=query)
-            )
+        # 搜索条件与导出共用
+        queryset = self.query_class(self.request.GET).get_queryset()
         
         # 按照创建时间倒序排序
-        return queryset.order_by('-created_at')
+        return self.project(queryset).order_by(*self.keyset_ordering)
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         # 将搜索关键词加入上下文
         context['query'] = self.request.GET.get('q', '')
-        context['per_page'] = self.request.GET.get('per_page', self.paginate_by)
+        context['per_page'] = self.get_paginate_by()
         context['per_page_options'] = [10, 20, 50, 100]
+        # 导出链接带上当前筛选条件
+        context['export_query'] = self.query_class(self.request.GET).urlencode()
         return context
 
 class DeviceDeliveryCreateForm(forms.ModelForm):
@@ -380,122 +568,49 @@ class DeviceDeliveryDeleteView(LoginRequiredMixin, DeleteView):
             return DeviceDelivery.objects.all()
         return DeviceDelivery.objects.filter(created_by=self.request.user)
 
-class DeviceDeliveryExportView(LoginRequiredMixin, View):
+class DeviceDeliveryExportView(LoginRequiredMixin, ExportMixin, View):
     """设备出货清单导出视图"""
-    
-    def get(self, request, *args, **kwargs):
-        queryset = DeviceDelivery.objects.all()  # 所有用户都能导出所有记录
-            
-        resource = DeviceDeliveryResource()
-        dataset = resource.export(queryset)
-        
-        response = HttpResponse(content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
-        response["Content-Disposition"] = 'attachment; filename="device_deliveries.xlsx"'
-        response.content = dataset.export("xlsx")
-        return response
+    job_target = 'device_delivery'
 
-class DeviceDeliveryImportView(LoginRequiredMixin, TemplateView):
+class DeviceDeliveryDeltaView(LoginRequiredMixin, DeltaExportMixin, View):
+    """设备出货清单增量导出视图"""
+    job_target = 'device_delivery'
+
+class DeviceDeliveryImportView(LoginRequiredMixin, ExcelImportMixin, TemplateView):
     """设备出货清单导入视图"""
     template_name = 'core/device_delivery_import.html'
-    
-    def post(self, request, *args, **kwargs):
-        resource = DeviceDeliveryResource()
-        dataset = Dataset()
-        
-        # 获取上传的文件
-        import_file = request.FILES.get('import_file')
-        if not import_file:
-            messages.error(request, "请选择上传文件")
-            return HttpResponseRedirect(reverse_lazy('device_delivery_import'))
-        
-        try:
-            # 检查文件类型
-            if not import_file.name.endswith(('.xls', '.xlsx')):
-                messages.error(request, "只接受Excel文件(.xls, .xlsx)")
-                return HttpResponseRedirect(reverse_lazy('device_delivery_import'))
-            
-            # 尝试加载Excel内容
-            try:
-                imported_data = dataset.load(import_file.read(), format='xlsx')
-            except Exception as e:
-                messages.error(request, f"Excel文件读取失败: {str(e)}")
-                return HttpResponseRedirect(reverse_lazy('device_delivery_import'))
-            
-            # 关联创建者
-            def before_import(dataset, dry_run, **kwargs):
-                for row in dataset.dict:
-                    row['created_by'] = request.user.id
-            
-            # 设置导入前回调
-            result = resource.import_data(dataset, dry_run=True, before_import=before_import)
-            
-            # 检查导入结果
-            if result.has_errors():
-                # 汇总错误信息
-                error_rows = []
-                for error in result.row_errors():
-                    row_number = error[0]
-                    error_info = "、".join([f"{field}: {err.error}" for field, errors in error[1].items() for err in errors])
-                    error_rows.append(f"行 {row_number}: {error_info}")
-                
-                error_message = "、".join(error_rows[:10])
-                if len(error_rows) > 10:
-                    error_message += f"...等{len(error_rows)}个错误"
-                
-                messages.error(request, f"导入数据有错误: {error_message}")
-                return HttpResponseRedirect(reverse_lazy('device_delivery_import'))
-            
-            # 正式导入数据
-            result = resource.import_data(dataset, dry_run=False, before_import=before_import)
-            
-            # 导入成功
-            messages.success(request, f"成功导入{result.total_rows}行数据")
-            
-        except Exception as e:
-            messages.error(request, f"导入过程发生错误: {str(e)}")
-        
-        return HttpResponseRedirect(reverse_lazy('device_delivery_list'))
+    job_target = 'device_delivery'
 
 # 设备安全状态视图
-class DeviceSecurityStatusListView(LoginRequiredMixin, ListView):
+class DeviceSecurityStatusListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     model = DeviceSecurityStatus
     template_name = 'core/device_security_status_list.html'
     context_object_name = 'device_statuses'
     paginate_by = 50  # 默认每页显示50条记录
-    
-    def get_paginate_by(self, queryset):
-        """允许用户选择每页显示的记录数"""
-        return self.request.GET.get('per_page', self.paginate_by)
+    query_class = DeviceSecurityStatusQuery  # 列表和导出共用的查询条件
+    keyset_ordering = ('-last_check_time', '-id')  # 按最后检查时间倒序分页
+    # 模板显示的字段，创建人与记录一起查询
+    list_fields = (
+        'network_element_name', 'is_online', 'asset_serial_number', 'check_date', 'last_check_time', 'created_at',
+        'created_by__username',
+    )
     
     def get_queryset(self):
-        queryset = DeviceSecurityStatus.objects.all()  # 所有用户都能看到所有记录
-        
-        # 搜索功能
-        query = self.request.GET.get('q', '')
-        if query:
-            queryset = queryset.filter(
-                # 在多个字段中搜索
-                models.Q(network_element_name__icontains=query) |
-                models.Q(asset_serial_number__icontains=query)
-            )
-        
-        # 增加在线状态筛选
-        online_status = self.request.GET.get('status')
-        if online_status == 'online':
-            queryset = queryset.filter(is_online=True)
-        elif online_status == 'offline':
-            queryset = queryset.filter(is_online=False)
+        # 搜索和在线状态筛选条件与导出共用
+        queryset = self.query_class(self.request.GET).get_queryset()
         
         # 按照最后检查时间倒序排序
-        return queryset.order_by('-last_check_time')
+        return self.project(queryset).order_by(*self.keyset_ordering)
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         # 将搜索关键词和状态筛选加入上下文
         context['query'] = self.request.GET.get('q', '')
         context['status'] = self.request.GET.get('status', '')
-        context['per_page'] = self.request.GET.get('per_page', self.paginate_by)
+        context['per_page'] = self.get_paginate_by()
         context['per_page_options'] = [10, 20, 50, 100]
+        # 导出链接带上当前筛选条件
+        context['export_query'] = self.query_class(self.request.GET).urlencode()
         return context
 
 class DeviceSecurityStatusCreateForm(forms.ModelForm):
@@ -535,9 +650,9 @@ class DeviceSecurityStatusCreateView(LoginRequiredMixin, CreateView):
             initial['asset_serial_number'] = barcode
             initial['is_online'] = True  # 默认设置为在线
             # 尝试查找对应的到货记录
-            arrival = DeviceArrival.objects.filter(barcode=barcode).first()
+            arrival = barcodes.resolve(barcode)['arrival']
             if arrival:
-                initial['network_element_name'] = f"{arrival.project_name}_{arrival.device_model}"
+                initial['network_element_name'] = f"{arrival['project_name']}_{arrival['device_model']}"
                 initial['check_date'] = timezone.now().date()
         return initial
 
@@ -568,86 +683,156 @@ class DeviceSecurityStatusDeleteView(LoginRequiredMixin, DeleteView):
             return DeviceSecurityStatus.objects.all()
         return DeviceSecurityStatus.objects.filter(created_by=self.request.user)
 
-class DeviceSecurityStatusExportView(LoginRequiredMixin, View):
+class DeviceSecurityStatusExportView(LoginRequiredMixin, ExportMixin, View):
     """设备安全状态导出视图"""
+    job_target = 'device_security_status'
+
+class DeviceSecurityStatusDeltaView(LoginRequiredMixin, DeltaExportMixin, View):
+    """设备安全状态增量导出视图"""
+    job_target = 'device_security_status'
+
+class DeviceSecurityStatusImportView(LoginRequiredMixin, ExcelImportMixin, TemplateView):
+    """设备安装状态导入视图"""
+    template_name = 'core/device_security_status_import.html'
+    job_target = 'device_security_status'
+
+class BarcodeResolveView(LoginRequiredMixin, View):
+    """按条码一次返回到货、出货和安装记录，未找到时附带以该条码开头的候选条码"""
     
     def get(self, request, *args, **kwargs):
-        queryset = DeviceSecurityStatus.objects.all()  # 所有用户都能导出所有记录
-            
-        resource = DeviceSecurityStatusResource()
-        dataset = resource.export(queryset)
-        
-        response = HttpResponse(content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
-        response["Content-Disposition"] = 'attachment; filename="device_security_statuses.xlsx"'
-        response.content = dataset.export("xlsx")
+        barcode = request.GET.get('barcode', '').strip()
+        if not barcode:
+            return JsonResponse({'error': '缺少条码参数'}, status=400)
+        response = JsonResponse(barcodes.resolve(barcode), json_dumps_params={'ensure_ascii': False})
+        patch_cache_control(response, private=True, no_cache=True)
         return response
 
-class DeviceSecurityStatusImportView(LoginRequiredMixin, TemplateView):
-    """设备安装状态导入视图"""
-    template_name = 'core/device_security_status_import.html'
+def parse_moment(value):
+    """解析时间参数，可以是日期(当天零点)或日期时间，无法解析时抛出 ValueError"""
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"无效的时间: {value}")
+        return start_of_day(day)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+class StatusHistoryView(LoginRequiredMixin, View):
+    """按时间顺序返回设备在线状态变化，可按序列号(serial)、网元名称(network_element)和时间范围(start/end)筛选"""
     
-    def post(self, request, *args, **kwargs):
-        resource = DeviceSecurityStatusResource()
-        dataset = Dataset()
-        
-        # 获取上传的文件
-        import_file = request.FILES.get('import_file')
-        if not import_file:
-            messages.error(request, "请选择上传文件")
-            return HttpResponseRedirect(reverse_lazy('device_security_status_import'))
-        
+    def get(self, request, *args, **kwargs):
         try:
-            # 检查文件类型
-            if not import_file.name.endswith(('.xls', '.xlsx')):
-                messages.error(request, "只接受Excel文件(.xls, .xlsx)")
-                return HttpResponseRedirect(reverse_lazy('device_security_status_import'))
-            
-            # 尝试加载Excel内容
-            try:
-                imported_data = dataset.load(import_file.read(), format='xlsx')
-            except Exception as e:
-                messages.error(request, f"Excel文件读取失败: {str(e)}")
-                return HttpResponseRedirect(reverse_lazy('device_security_status_import'))
-            
-            # 关联创建者
-            def before_import(dataset, dry_run, **kwargs):
-                for row in dataset.dict:
-                    row['created_by'] = request.user.id
-            
-            # 设置导入前回调
-            result = resource.import_data(dataset, dry_run=True, before_import=before_import)
-            
-            # 检查导入结果
-            if result.has_errors():
-                # 汇总错误信息
-                error_rows = []
-                for error in result.row_errors():
-                    row_number = error[0]
-                    error_info = "、".join([f"{field}: {err.error}" for field, errors in error[1].items() for err in errors])
-                    error_rows.append(f"行 {row_number}: {error_info}")
-                
-                error_message = "、".join(error_rows[:10])
-                if len(error_rows) > 10:
-                    error_message += f"...等{len(error_rows)}个错误"
-                
-                messages.error(request, f"导入数据有错误: {error_message}")
-                return HttpResponseRedirect(reverse_lazy('device_security_status_import'))
-            
-            # 正式导入数据
-            result = resource.import_data(dataset, dry_run=False, before_import=before_import)
-            
-            # 导入成功
-            messages.success(request, f"成功导入{result.total_rows}行数据")
-            
-        except Exception as e:
-            messages.error(request, f"导入过程发生错误: {str(e)}")
-        
-        return HttpResponseRedirect(reverse_lazy('device_security_status_list'))
+            start = request.GET.get('start')
+            end = request.GET.get('end')
+            history = status_history.fetch_changes(
+                serial=request.GET.get('serial', '').strip(),
+                network_element=request.GET.get('network_element', '').strip(),
+                start=parse_moment(start) if start else None,
+                end=parse_moment(end) if end else None,
+                cursor=request.GET.get('cursor'),
+                limit=int(request.GET.get('limit', status_history.DEFAULT_LIMIT)),
+            )
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        return JsonResponse(history, json_dumps_params={'ensure_ascii': False})
+
+class StatusTrendView(LoginRequiredMixin, View):
+    """在线/离线设备数趋势，按 points 降采样；默认为过去 24 小时"""
+    
+    def get(self, request, *args, **kwargs):
+        now = timezone.now()
+        try:
+            start = request.GET.get('start')
+            end = request.GET.get('end')
+            start = parse_moment(start) if start else now - timedelta(hours=24)
+            end = min(parse_moment(end), now) if end else now
+            if start >= end:
+                raise ValueError('开始时间必须早于结束时间')
+            trend = status_history.get_trend(
+                start, end, int(request.GET.get('points', status_history.DEFAULT_POINTS)),
+            )
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        response = JsonResponse(trend)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+class DashboardEventsView(View):
+    """设备状态看板实时推送(Server-Sent Events)，只能通过 ASGI 部署提供"""
+    
+    async def get(self, request, *args, **kwargs):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return JsonResponse({'error': '请先登录'}, status=403)
+        if not isinstance(request, ASGIRequest):
+            # WSGI 下流式响应会一直占用工作进程
+            return JsonResponse({'error': '实时推送需要通过 ASGI 部署'}, status=501)
+        try:
+            last_event_id = int(request.headers.get('Last-Event-ID', ''))
+        except ValueError:
+            last_event_id = None
+        response = StreamingHttpResponse(live.feed.subscribe(last_event_id), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # 关闭 nginx 等反向代理的响应缓冲
+        response['X-Accel-Buffering'] = 'no'
+        return response
 
 class DashboardStatusView(LoginRequiredMixin, TemplateView):
     """设备状态看板视图"""
     template_name = 'core/dashboard_status.html'
     items_per_page = 20  # 默认每页显示20条记录
+    max_items_per_page = 100  # 每页最多显示的记录数
+    # 新增统计的时间范围：(参数值, 名称, 时长)，今日从零点开始；也可用 start_date/end_date 自定义日期范围
+    windows = (
+        ('today', '今日', None),
+        ('24h', '过去24小时', timedelta(hours=24)),
+        ('7d', '过去7天', timedelta(days=7)),
+        ('30d', '过去30天', timedelta(days=30)),
+        ('90d', '过去90天', timedelta(days=90)),
+    )
+    
+    # 设备分类的统计范围：默认只统计最近 DASHBOARD_WINDOW_HOURS 小时创建的记录，all 统计全部设备
+    scopes = (
+        ('recent', '最近{hours}小时'),
+        ('all', '全部设备'),
+    )
+    
+    cached_models = (DeviceArrival, DeviceSecurityStatus)
+    
+    def cached(self, namespace, versions, parts, compute):
+        key = caching.make_key(namespace, versions, *parts)
+        timeout = getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', caching.DEFAULT_TIMEOUT)
+        return caching.get_or_compute(namespace, key, compute, timeout)
+    
+    def get_window_counts(self, versions, start, end, now):
+        """时间范围内的新增数量；截止到当前时刻的范围只在有新记录写入时变化，缓存键不含当前时间"""
+        parts = [rollups.floor_hour(start), end if end < now else None]
+        return self.cached('dashboard-window', versions, parts, lambda: rollups.get_counts(start, end))
+    
+    def get_window(self, now):
+        """返回 (参数值, 名称, 开始时间, 结束时间)"""
+        window = self.request.GET.get('window', 'today')
+        if window == 'custom':
+            start_date = parse_date(self.request.GET.get('start_date') or '')
+            end_date = parse_date(self.request.GET.get('end_date') or '') or timezone.localdate()
+            if start_date and start_date <= end_date:
+                return (
+                    window, f"{start_date:%Y-%m-%d} 至 {end_date:%Y-%m-%d}",
+                    start_of_day(start_date), min(now, start_of_day(end_date + timedelta(days=1))),
+                )
+        for value, label, length in self.windows:
+            if value == window and length:
+                return value, label, now - length, now
+        return 'today', '今日', start_of_day(timezone.localdate()), now
+    
+    def get_date_range(self, backend):
+        """只统计时间范围内数据时的说明"""
+        if backend.window is None:
+            return ''
+        hours = int(backend.window.total_seconds() // 3600)
+        return f"过去{hours}小时 ({timezone.localtime(backend.since).strftime('%Y-%m-%d %H:%M')} 至今)"
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -663,55 +848,50 @@ class DashboardStatusView(LoginRequiredMixin, TemplateView):
         except ValueError:
             page = 1
             per_page = self.items_per_page
+        per_page = max(1, min(per_page, self.max_items_per_page))
         
-        # 限制查询的时间范围，只获取最近24小时的数据
-        date_limit = timezone.now() - timezone.timedelta(hours=24)
-        
-        # 只获取必要的字段，减少内存使用
-        arrivals = DeviceArrival.objects.filter(
-            created_at__gte=date_limit
-        ).values('barcode', 'device_model', 'project_name', 'arrival_date')
+        # 各分类的设备数，看板实现见 dashboard 模块
+        # 计数和页面数据按到货、安装表的版本号缓存，数据写入后失效
+        scope = self.request.GET.get('scope')
+        if scope not in dict(self.scopes):
+            scope = 'recent'
+        backend = get_dashboard_backend(limited=scope == 'recent')
+        versions = caching.get_versions(*self.cached_models)
+        counts = self.cached('dashboard-counts', versions, backend.get_cache_parts(), backend.get_counts)
+        online_count = counts.get('online', 0)
+        offline_count = counts.get('offline', 0)
+        other_count = counts.get('other', 0)
         
-        installations = DeviceSecurityStatus.objects.filter(
-            created_at__gte=date_limit
-        ).values('asset_serial_number', 'network_element_name', 'is_online', 'check_date')
-        
-        # 使用字典代替多次查询，提高效率
-        arrival_dict = {item['barcode']: item for item in arrivals if item['barcode']}
-        installation_dict = {item['asset_serial_number']: item for item in installations if item['asset_serial_number']}
-        
-        # 高效计算设备分类
-        arrival_barcodes = set(arrival_dict.keys())
-        installation_serials = set(installation_dict.keys())
-        
-        # 计算不同情况的设备
-        online_devices = arrival_barcodes.intersection(installation_serials)
-        offline_devices = arrival_barcodes.difference(installation_serials)
-        other_devices = installation_serials.difference(arrival_barcodes)
-        
-        # 获取今日数据
-        today = timezone.now().date()
+        # 时间范围内新增的到货和安装数量，由小时/每日汇总表统计，见 rollups 模块
+        now = timezone.now()
+        today = timezone.localdate()
+        window, window_label, window_start, window_end = self.get_window(now)
+        window_counts = self.get_window_counts(versions, window_start, window_end, now)
+        if window == 'today':
+            today_counts = window_counts
+        else:
+            today_counts = self.get_window_counts(versions, start_of_day(today), now, now)
         
-        today_installations = DeviceSecurityStatus.objects.filter(
-            created_at__date=today
-        ).values('is_online')
+        today_online_count = today_counts['online_installations']
+        today_offline_count = today_counts['offline_installations']
         
-        today_online_count = sum(1 for item in today_installations if item['is_online'])
-        today_offline_count = len(today_installations) - today_online_count
+        window_params = {'scope': scope, 'window': window}
+        if window == 'custom':
+            window_params.update(start_date=self.request.GET.get('start_date'), end_date=self.request.GET.get('end_date', ''))
         
         # 准备分页数据
         if device_type == 'online':
-            all_devices = list(online_devices)
+            total_devices = online_count
             device_label = '在线设备'
         elif device_type == 'offline':
-            all_devices = list(offline_devices)
+            total_devices = offline_count
             device_label = '脱网设备'
         else:  # 'other'
-            all_devices = list(other_devices)
+            device_type = 'other'
+            total_devices = other_count
             device_label = '其他设备'
             
         # 计算总页数
-        total_devices = len(all_devices)
         total_pages = (total_devices + per_page - 1) // per_page
         
         # 确保页码有效
@@ -720,47 +900,12 @@ class DashboardStatusView(LoginRequiredMixin, TemplateView):
         if page > total_pages and total_pages > 0:
             page = total_pages
             
-        # 计算当前页的设备
+        # 只查询当前页的设备，按条码排序
         start_idx = (page - 1) * per_page
-        end_idx = start_idx + per_page
-        current_page_devices = all_devices[start_idx:end_idx]
-        
-        # 生成当前设备列表
-        device_list = []
-        
-        if device_type == 'online':
-            for barcode in current_page_devices:
-                arrival = arrival_dict.get(barcode)
-                installation = installation_dict.get(barcode)
-                if arrival and installation:
-                    device_list.append({
-                        'barcode': barcode,
-                        'device_model': arrival['device_model'],
-                        'project_name': arrival['project_name'],
-                        'network_element_name': installation['network_element_name'],
-                        'is_online': installation['is_online'],
-                        'check_date': installation['check_date'],
-                    })
-        elif device_type == 'offline':
-            for barcode in current_page_devices:
-                arrival = arrival_dict.get(barcode)
-                if arrival:
-                    device_list.append({
-                        'barcode': barcode,
-                        'device_model': arrival['device_model'],
-                        'project_name': arrival['project_name'],
-                        'arrival_date': arrival['arrival_date'],
-                    })
-        else:  # 'other'
-            for serial in current_page_devices:
-                installation = installation_dict.get(serial)
-                if installation:
-                    device_list.append({
-                        'serial': serial,
-                        'network_element_name': installation['network_element_name'],
-                        'is_online': installation['is_online'],
-                        'check_date': installation['check_date'],
-                    })
+        device_list = self.cached(
+            'dashboard-page', versions, [*backend.get_cache_parts(), device_type, start_idx, per_page],
+            lambda: backend.get_page(device_type, start_idx, per_page),
+        )
         
         # 为了向后兼容，保留原来的列表
         online_device_list = []
@@ -777,17 +922,31 @@ class DashboardStatusView(LoginRequiredMixin, TemplateView):
         
         # 添加数据到上下文
         context.update({
-            'online_count': len(online_devices),
-            'offline_count': len(offline_devices),
-            'other_count': len(other_devices),
+            'online_count': online_count,
+            'offline_count': offline_count,
+            'other_count': other_count,
             'today_online_count': today_online_count,
             'today_offline_count': today_offline_count,
             'online_device_list': online_device_list,
             'offline_device_list': offline_device_list,
             'other_device_list': other_device_list,
             'today': today,
-            'is_limited_view': True,
-            'date_range': f"过去24小时 ({date_limit.strftime('%Y-%m-%d %H:%M')} 至今)",
+            'window': window,
+            'window_label': window_label,
+            'window_counts': window_counts,
+            'window_start': window_start.isoformat(),
+            'window_end': window_end.isoformat(),
+            'window_options': [(value, label) for value, label, length in self.windows],
+            'window_query': urlencode(window_params),
+            'start_date': self.request.GET.get('start_date', ''),
+            'end_date': self.request.GET.get('end_date', ''),
+            'scope': scope,
+            'scope_options': [
+                (value, label.format(hours=get_window_hours()), urlencode({**window_params, 'scope': value}))
+                for value, label in self.scopes
+            ],
+            'is_limited_view': backend.window is not None,
+            'date_range': self.get_date_range(backend),
             
             # 分页信息
             'current_page': page,
@@ -803,17 +962,16 @@ class DashboardStatusView(LoginRequiredMixin, TemplateView):
         
         return context
 
-class UserActivityLogListView(LoginRequiredMixin, UserPassesTestMixin, ListView):
+class UserActivityLogListView(LoginRequiredMixin, UserPassesTestMixin, KeysetPaginationMixin, ListView):
     """用户操作日志列表视图，仅管理员可访问"""
     model = UserActivityLog
     template_name = 'core/user_activity_log_list.html'
     context_object_name = 'logs'
     paginate_by = 50  # 默认每页显示50条记录
-    ordering = ['-timestamp']
-    
-    def get_paginate_by(self, queryset):
-        """允许用户选择每页显示的记录数"""
-        return self.request.GET.get('per_page', self.paginate_by)
+    ordering = ['-timestamp', '-id']
+    keyset_ordering = ('-timestamp', '-id')  # 按时间倒序分页
+    # 模板显示的字段，描述由操作类型、内容类型和对象ID生成
+    list_fields = ('user__username', 'action_type', 'content_type', 'object_id', 'description', 'ip_address', 'timestamp')
     
     def test_func(self):
         """检查用户是否是管理员"""
@@ -821,14 +979,14 @@ class UserActivityLogListView(LoginRequiredMixin, UserPassesTestMixin, ListView)
     
     def get_queryset(self):
         """根据筛选条件获取查询集"""
-        queryset = super().get_queryset()
+        queryset = self.project(super().get_queryset())
         
         # 获取筛选参数
         user_id = self.request.GET.get('user')
         action_type = self.request.GET.get('action_type')
         content_type = self.request.GET.get('content_type')
-        start_date = self.request.GET.get('start_date')
-        end_date = self.request.GET.get('end_date')
+        start_date = parse_date(self.request.GET.get('start_date') or '')
+        end_date = parse_date(self.request.GET.get('end_date') or '')
         search = self.request.GET.get('search')
         
         # 应用筛选
@@ -839,15 +997,12 @@ class UserActivityLogListView(LoginRequiredMixin, UserPassesTestMixin, ListView)
         if content_type:
             queryset = queryset.filter(content_type=content_type)
         if start_date:
-            queryset = queryset.filter(timestamp__date__gte=start_date)
+            queryset = queryset.filter(timestamp__gte=start_of_day(start_date))
         if end_date:
-            queryset = queryset.filter(timestamp__date__lte=end_date)
+            queryset = queryset.filter(timestamp__lt=start_of_day(end_date + timedelta(days=1)))
         if search:
-            queryset = queryset.filter(
-                models.Q(description__icontains=search) |
-                models.Q(user__username__icontains=search) |
-                models.Q(ip_address__icontains=search)
-            )
+            # 在描述、对象ID、用户名和IP中模糊搜索
+            queryset = queryset.filter(search_filter(UserActivityLog, search))
         
         return queryset
     
@@ -855,8 +1010,11 @@ class UserActivityLogListView(LoginRequiredMixin, UserPassesTestMixin, ListView)
         """添加额外上下文数据"""
         context = super().get_context_data(**kwargs)
         
-        # 添加筛选选项
-        context['users'] = User.objects.all()
+        # 添加筛选选项，用户通过自动补全选择，只查询已选中的用户
+        user_id = self.request.GET.get('user', '')
+        context['selected_username'] = (
+            User.objects.filter(pk=user_id).values_list('username', flat=True).first() if user_id.isdigit() else ''
+        )
         context['action_types'] = UserActivityLog.ACTION_TYPES
         context['content_types'] = UserActivityLog.CONTENT_TYPES
         
@@ -867,7 +1025,143 @@ class UserActivityLogListView(LoginRequiredMixin, UserPassesTestMixin, ListView)
         context['start_date'] = self.request.GET.get('start_date', '')
         context['end_date'] = self.request.GET.get('end_date', '')
         context['search'] = self.request.GET.get('search', '')
-        context['per_page'] = self.request.GET.get('per_page', self.paginate_by)
+        context['per_page'] = self.get_paginate_by()
         context['per_page_options'] = [10, 20, 50, 100]
         
-        return context
\ No newline at end of file
+        return context
+
+class CacheStatsView(LoginRequiredMixin, UserPassesTestMixin, View):
+    """本进程的缓存命中统计，仅管理员可见"""
+    
+    def test_func(self):
+        return self.request.user.is_staff or self.request.user.is_superuser
+    
+    def get(self, request, *args, **kwargs):
+        response = JsonResponse({
+            'backend': caching.get_backend_name(),
+            'pid': os.getpid(),
+            'caches': caching.get_stats(),
+            'barcodes': barcodes.get_stats(),
+        })
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+class ActivityLogStatsView(LoginRequiredMixin, UserPassesTestMixin, View):
+    """本进程的操作日志写入和按记录策略未记录的事件统计，仅管理员可见"""
+    
+    def test_func(self):
+        return self.request.user.is_staff or self.request.user.is_superuser
+    
+    def get(self, request, *args, **kwargs):
+        response = JsonResponse({
+            'pid': os.getpid(),
+            'writer': activity_log_writer.get_stats(),
+            'events': activity_throttle.get_stats(),
+        })
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+class ActivityLogArchiveView(LoginRequiredMixin, UserPassesTestMixin, View):
+    """只读查询已归档的操作日志，按时间范围(start/end)、用户名(user)、操作类型、内容类型和关键词(q)筛选"""
+    
+    def test_func(self):
+        return self.request.user.is_staff or self.request.user.is_superuser
+    
+    def get(self, request, *args, **kwargs):
+        try:
+            start = request.GET.get('start')
+            end = request.GET.get('end')
+            result = log_archive.search(
+                start=parse_moment(start) if start else None,
+                end=parse_moment(end) if end else None,
+                username=request.GET.get('user', '').strip(),
+                action_type=request.GET.get('action_type', ''),
+                content_type=request.GET.get('content_type', ''),
+                query=request.GET.get('q', '').strip(),
+                cursor=request.GET.get('cursor'),
+                limit=int(request.GET.get('limit', log_archive.DEFAULT_LIMIT)),
+            )
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        return JsonResponse(result, json_dumps_params={'ensure_ascii': False})
+
+class UserAutocompleteView(LoginRequiredMixin, UserPassesTestMixin, View):
+    """日志筛选的用户自动补全，按用户名前缀返回少量用户"""
+    limit = 20
+    
+    def test_func(self):
+        return self.request.user.is_staff or self.request.user.is_superuser
+    
+    def get(self, request, *args, **kwargs):
+        query = request.GET.get('q', '').strip()
+        users = User.objects.order_by('username')
+        if query:
+            users = users.filter(username__istartswith=query)
+        results = [
+            {'id': pk, 'username': username}
+            for pk, username in users.values_list('id', 'username')[:self.limit]
+        ]
+        return JsonResponse({'results': results}, json_dumps_params={'ensure_ascii': False})
+
+class JobQuerysetMixin:
+    """用户只能查看自己创建的任务，管理员可以查看全部"""
+    
+    def get_queryset(self):
+        if self.request.user.is_staff:
+            return BackgroundJob.objects.all()
+        return BackgroundJob.objects.filter(created_by=self.request.user)
+
+class JobDetailView(LoginRequiredMixin, JobQuerysetMixin, DetailView):
+    """后台任务进度页面"""
+    model = BackgroundJob
+    template_name = 'core/job_detail.html'
+    context_object_name = 'job'
+    
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        # 导入校验完成后直接展示预览，供用户确认
+        if self.object.job_type == 'IMPORT_STAGE' and self.object.status == 'SUCCESS':
+            return render_import_preview(request, self.object)
+        return self.render_to_response(self.get_context_data(object=self.object))
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['target_label'] = JOB_TARGETS[self.object.target]['label']
+        context['list_url_name'] = f'{self.object.target}_list'
+        return context
+
+class JobStatusView(LoginRequiredMixin, JobQuerysetMixin, View):
+    """以JSON返回任务进度、吞吐量和预计剩余时间"""
+    
+    def get(self, request, pk, *args, **kwargs):
+        job = get_object_or_404(self.get_queryset(), pk=pk)
+        throughput, eta_seconds = get_job_stats(job)
+        return JsonResponse({
+            'id': job.pk,
+            'job_type': job.job_type,
+            'status': job.status,
+            'status_display': job.get_status_display(),
+            'total_rows': job.total_rows,
+            'processed_rows': job.processed_rows,
+            'throughput': round(throughput, 1) if throughput else None,
+            'eta_seconds': round(eta_seconds) if eta_seconds is not None else None,
+            'result': job.result,
+            'error': job.error,
+            'download_url': reverse('job_download', kwargs={'pk': job.pk}) if job.result_file and job.status == 'SUCCESS' else None,
+        }, json_dumps_params={'ensure_ascii': False})
+
+class JobDownloadView(LoginRequiredMixin, JobQuerysetMixin, View):
+    """下载已完成的导出任务文件"""
+    
+    def get(self, request, pk, *args, **kwargs):
+        job = get_object_or_404(self.get_queryset(), pk=pk, job_type='EXPORT', status='SUCCESS')
+        if not job.result_file or not os.path.exists(job.result_file):
+            raise Http404("导出文件不存在")
+        # 早期的任务没有记录格式，都是 xlsx
+        content_type, extension = STREAM_FORMATS[job.result.get('format', 'xlsx')]
+        return FileResponse(
+            open(job.result_file, 'rb'),
+            as_attachment=True,
+            filename=job.result.get('filename', f'export.{extension}'),
+            content_type=content_type,
+        )
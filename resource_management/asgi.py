@@ -5,6 +5,14 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
+
+设备状态看板的实时推送(/dashboard/status/events/)是长连接的 Server-Sent Events，
+需要用 uvicorn、daphne 等 ASGI 服务器加载本模块，例如:
+
+    uvicorn resource_management.asgi:application --workers 1
+
+每个服务进程维护自己的变化源(core.live)，同一进程内的写入立即推送，其他进程的写入
+按 LIVE_DASHBOARD_POLL_SECONDS 定时检查。
 """
 
 import os
@@ -142,6 +142,105 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# 导入设置
+# 流式导入时每块写入的行数
+IMPORT_CHUNK_SIZE = 1000
+# 导入预览暂存目录及有效期(秒)，确认导入前校验后的数据保存在这里
+IMPORT_STAGING_DIR = os.path.join(MEDIA_ROOT, 'import_staging')
+IMPORT_STAGING_TTL = 3600
+
+# 后台任务设置
+# 默认在请求内同步执行；部署了 `python manage.py run_jobs` 工作进程后改为 True，
+# 导入导出才交给工作进程执行，否则任务会一直停在排队状态
+BACKGROUND_JOBS = False
+# 任务上传文件和导出结果的存放目录
+JOB_FILES_DIR = os.path.join(MEDIA_ROOT, 'jobs')
+
+# 导出缓存设置
+# 数据未变化时重复导出直接返回缓存文件，目录总大小超过上限时清理最久未使用的文件
+EXPORT_CACHE_DIR = os.path.join(MEDIA_ROOT, 'export_cache')
+EXPORT_CACHE_MAX_BYTES = 512 * 1024 * 1024
+# 增量导出只返回该秒数之前的变化，给尚未提交的导入事务留出时间
+DELTA_EXPORT_SAFETY_LAG = 60
+
+# 缓存设置
+# locmem: 进程内缓存；file: 文件缓存，同一台机器上的多个进程共享；
+# redis: 兼容 Redis 协议的缓存服务，多台机器共享(需要安装 redis 包)
+CACHE_BACKEND = 'locmem'
+CACHE_FILE_DIR = os.path.join(BASE_DIR, 'cache')
+CACHE_REDIS_URL = 'redis://127.0.0.1:6379/0'
+CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'resource_management',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': CACHE_FILE_DIR,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': CACHE_REDIS_URL,
+    },
+}
+CACHES = {
+    'default': {**CACHE_BACKENDS[CACHE_BACKEND], 'KEY_PREFIX': 'resource_management', 'TIMEOUT': 300},
+}
+# 设备状态看板计数和页面数据的缓存时间(秒)，缓存键包含表版本号，数据写入后立即失效
+DASHBOARD_CACHE_TIMEOUT = 300
+
+# 列表分页设置
+# keyset: 按排序键翻页，深页与首页开销相同；offset: 传统页码分页
+LIST_PAGINATION = 'keyset'
+# 列表总数缓存时间(秒)，设备数据表写入后总数缓存立即失效
+LIST_COUNT_CACHE_TIMEOUT = 60
+
+# 条码查询进程内缓存的条目数和有效期(秒)；本进程写入后立即清空，其他进程的写入在有效期后可见
+BARCODE_CACHE_SIZE = 256
+BARCODE_CACHE_TIMEOUT = 30
+
+# 设备状态看板默认只统计最近 DASHBOARD_WINDOW_HOURS 小时创建的到货和安装记录，也可选择全部设备；
+# 两种范围的实现：reconciliation 读取对账表；query 用子查询直接在到货和安装表上分类
+DASHBOARD_BACKEND = 'reconciliation'
+DASHBOARD_WINDOW_HOURS = 24
+
+# 设备状态看板实时推送检查其他进程写入的间隔(秒)，本进程内的写入立即推送
+LIVE_DASHBOARD_POLL_SECONDS = 5
+
+# 用户操作日志设置
+# 为 True 时日志先放入进程内队列，由后台线程批量写入；为 False 时在请求内逐条写入
+ACTIVITY_LOG_ASYNC = True
+# 队列容量，以及每批写入的条数和最长等待时间(毫秒)
+ACTIVITY_LOG_QUEUE_SIZE = 10000
+ACTIVITY_LOG_BATCH_SIZE = 200
+ACTIVITY_LOG_FLUSH_MS = 500
+# 队列已满时的处理：drop 直接丢弃；block 最多等待 ACTIVITY_LOG_BLOCK_SECONDS 秒后丢弃
+ACTIVITY_LOG_OVERFLOW = 'drop'
+ACTIVITY_LOG_BLOCK_SECONDS = 1.0
+# 查看类事件的记录策略：always 全部记录；sample 按 ACTIVITY_LOG_SAMPLE_RATE 抽样；
+# dedupe 同一用户同一路由在 ACTIVITY_LOG_DEDUPE_SECONDS 秒内只记录一次；skip 不记录。
+# 默认全部记录，访问频繁的路由在 ACTIVITY_LOG_ROUTE_POLICIES 中单独指定
+ACTIVITY_LOG_VIEW_POLICY = 'always'
+ACTIVITY_LOG_SAMPLE_RATE = 0.1
+ACTIVITY_LOG_DEDUPE_SECONDS = 300
+# 按路由名指定查看事件的策略，值为字符串或 {'VIEW': 'sample'} 形式的字典；其他操作类型总是全部记录，不能指定
+ACTIVITY_LOG_ROUTE_POLICIES = {
+    # 实时推送连接、任务进度轮询和自动补全由页面自动发起
+    'dashboard_events': 'skip',
+    'job_status': 'skip',
+    'user_autocomplete': 'skip',
+    # 看板和趋势图会被反复刷新，同一用户在时间窗口内只记录一次
+    'dashboard_status': 'dedupe',
+    'status_trend': 'dedupe',
+}
+# 日志保留天数，`python manage.py archive_activity_logs` 把更早的日志归档到 ACTIVITY_LOG_ARCHIVE_DIR 后删除
+ACTIVITY_LOG_RETENTION_DAYS = 180
+ACTIVITY_LOG_ARCHIVE_DIR = os.path.join(BASE_DIR, 'archive', 'activity_logs')
+# 每批归档和删除的条数，每批单独提交，避免长时间占用写锁
+ACTIVITY_LOG_ARCHIVE_BATCH_SIZE = 2000
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
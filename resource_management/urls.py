@@ -33,6 +33,7 @@ from core.views import (
     DeviceArrivalUpdateView,
     DeviceArrivalDeleteView,
     DeviceArrivalExportView,
+    DeviceArrivalDeltaView,
     DeviceArrivalImportView,
     
     # Device Delivery views
@@ -41,6 +42,7 @@ from core.views import (
     DeviceDeliveryUpdateView,
     DeviceDeliveryDeleteView,
     DeviceDeliveryExportView,
+    DeviceDeliveryDeltaView,
     DeviceDeliveryImportView,
     
     # Device Security Status views
@@ -49,13 +51,33 @@ from core.views import (
     DeviceSecurityStatusUpdateView,
     DeviceSecurityStatusDeleteView,
     DeviceSecurityStatusExportView,
+    DeviceSecurityStatusDeltaView,
     DeviceSecurityStatusImportView,
     
     # Dashboard Status view
     DashboardStatusView,
+    DashboardEventsView,
+    
+    # Status history views
+    StatusHistoryView,
+    StatusTrendView,
+    
+    # Barcode lookup view
+    BarcodeResolveView,
     
     # User Activity Log view
     UserActivityLogListView,
+    UserAutocompleteView,
+    ActivityLogStatsView,
+    ActivityLogArchiveView,
+    
+    # Cache stats view
+    CacheStatsView,
+    
+    # Background job views
+    JobDetailView,
+    JobStatusView,
+    JobDownloadView,
 )
 
 urlpatterns = [
@@ -69,6 +91,7 @@ urlpatterns = [
     # Dashboard
     path('', DashboardView.as_view(), name='dashboard'),
     path('dashboard/status/', DashboardStatusView.as_view(), name='dashboard_status'),
+    path('dashboard/status/events/', DashboardEventsView.as_view(), name='dashboard_events'),
     
     # Profile
     path('profile/', ProfileUpdateView.as_view(), name='profile_update'),
@@ -80,6 +103,7 @@ urlpatterns = [
     path('device-arrivals/<int:pk>/edit/', DeviceArrivalUpdateView.as_view(), name='device_arrival_update'),
     path('device-arrivals/<int:pk>/delete/', DeviceArrivalDeleteView.as_view(), name='device_arrival_delete'),
     path('device-arrivals/export/', DeviceArrivalExportView.as_view(), name='device_arrival_export'),
+    path('device-arrivals/delta/', DeviceArrivalDeltaView.as_view(), name='device_arrival_delta'),
     path('device-arrivals/import/', DeviceArrivalImportView.as_view(), name='device_arrival_import'),
     
     # Device Delivery URLs
@@ -88,6 +112,7 @@ urlpatterns = [
     path('device-deliveries/<int:pk>/edit/', DeviceDeliveryUpdateView.as_view(), name='device_delivery_update'),
     path('device-deliveries/<int:pk>/delete/', DeviceDeliveryDeleteView.as_view(), name='device_delivery_delete'),
     path('device-deliveries/export/', DeviceDeliveryExportView.as_view(), name='device_delivery_export'),
+    path('device-deliveries/delta/', DeviceDeliveryDeltaView.as_view(), name='device_delivery_delta'),
     path('device-deliveries/import/', DeviceDeliveryImportView.as_view(), name='device_delivery_import'),
     
     # Device Security Status URLs
@@ -96,10 +121,29 @@ urlpatterns = [
     path('device-security-status/<int:pk>/edit/', DeviceSecurityStatusUpdateView.as_view(), name='device_security_status_update'),
     path('device-security-status/<int:pk>/delete/', DeviceSecurityStatusDeleteView.as_view(), name='device_security_status_delete'),
     path('device-security-status/export/', DeviceSecurityStatusExportView.as_view(), name='device_security_status_export'),
+    path('device-security-status/delta/', DeviceSecurityStatusDeltaView.as_view(), name='device_security_status_delta'),
     path('device-security-status/import/', DeviceSecurityStatusImportView.as_view(), name='device_security_status_import'),
     
+    # 设备在线状态历史
+    path('status-history/', StatusHistoryView.as_view(), name='status_history'),
+    path('status-history/trend/', StatusTrendView.as_view(), name='status_trend'),
+    
+    # 条码查询
+    path('barcodes/resolve/', BarcodeResolveView.as_view(), name='barcode_resolve'),
+    
     # 用户操作日志
     path('logs/', UserActivityLogListView.as_view(), name='user_activity_log_list'),
+    path('logs/users/', UserAutocompleteView.as_view(), name='user_autocomplete'),
+    path('logs/stats/', ActivityLogStatsView.as_view(), name='activity_log_stats'),
+    path('logs/archive/', ActivityLogArchiveView.as_view(), name='activity_log_archive'),
+    
+    # 缓存统计
+    path('cache/stats/', CacheStatsView.as_view(), name='cache_stats'),
+    
+    # 后台导入导出任务
+    path('jobs/<int:pk>/', JobDetailView.as_view(), name='job_detail'),
+    path('jobs/<int:pk>/status/', JobStatusView.as_view(), name='job_status'),
+    path('jobs/<int:pk>/download/', JobDownloadView.as_view(), name='job_download'),
 ]
 
 # 添加静态文件URL配置